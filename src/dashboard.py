@@ -460,7 +460,11 @@ elif selected_page == "Fase 3: Irrigação IoT":
         
         # Try to import the modules
         weather_module = import_module_from_file("weather", str(PHASE3_PATH / "app" / "weather.py"))
-        database_module = import_module_from_file("database", str(PHASE3_PATH / "app" / "database.py"))
+        # Reuse the loaded database module so its connection survives reruns
+        database_path = str(PHASE3_PATH / "app" / "database.py")
+        database_module = sys.modules.get("database")
+        if getattr(database_module, "__file__", None) != database_path:
+            database_module = import_module_from_file("database", database_path)
         
         if weather_module and database_module:
             # Weather data
@@ -493,12 +497,14 @@ elif selected_page == "Fase 3: Irrigação IoT":
                         # Display some visualizations
                         st.subheader("Visualizações dos Dados dos Sensores")
                         
-                        # Group by month
-                        monthly_data = sensor_data.groupby("month").mean().reset_index()
+                        # Monthly humidity averaged in SQL, reading only the columns it needs
+                        monthly_data = database_module.query_sensor_data(
+                            columns=["humidity", "created_at"], resample="month", order="asc"
+                        )
                         
                         # Humidity chart
                         fig, ax = plt.subplots(figsize=(10, 4))
-                        ax.plot(monthly_data["month"].astype(str), monthly_data["humidity"], marker="o")
+                        ax.plot(monthly_data["created_at"].dt.strftime("%Y-%m"), monthly_data["humidity"], marker="o")
                         ax.set_xlabel("Mês")
                         ax.set_ylabel("Umidade Média (%)")
                         ax.set_title("Umidade Média Mensal")
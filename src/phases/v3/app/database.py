@@ -1,15 +1,51 @@
+import atexit
+import json
+import re
 import sqlite3
+import threading
+from collections import OrderedDict
 import pandas
 import os
+import pathlib
 
 # Use caminhos absolutos baseados na localização deste arquivo
 base_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(base_dir)
 DB_PATH = os.path.join(parent_dir, "database", "data.db")
 CSV_PATH = os.path.join(parent_dir, "database", "sensor_data.csv")
+CSV_MANIFEST_PATH = CSV_PATH + ".manifest.json"
 INIT_SQL_PATH = os.path.join(parent_dir, "database", "init.sql")
+MIGRATIONS_PATH = os.path.join(parent_dir, "database", "migrations")
 DB_INITIALIZED = False
 
+# A single long-lived connection shared by every Streamlit rerun, guarded by a
+# lock because sqlite3 connections must not be used by two threads at once.
+CONNECTION = None
+CONNECTION_LOCK = threading.RLock()
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -32000,
+    "mmap_size": 134217728,
+    "busy_timeout": 5000,
+}
+
+# Dashboard reads use their own read-only connection, so a long query never
+# holds CONNECTION_LOCK while save_sensor_data waits for it. With WAL each
+# query reads a consistent snapshot without blocking the writer.
+READ_CONNECTION = None
+READ_CONNECTION_LOCK = threading.RLock()
+
+# Parsed results of read queries, keyed by the normalized query, its
+# parameters and the sensor_data change counter (migration 0002), so a repeat
+# query is served from memory until new data arrives. Least recently used
+# entries are evicted past QUERY_CACHE_MAX_BYTES or QUERY_CACHE_MAX_ENTRIES.
+QUERY_CACHE = OrderedDict()
+QUERY_CACHE_LOCK = threading.Lock()
+QUERY_CACHE_MAX_BYTES = 64 * 2**20
+QUERY_CACHE_MAX_ENTRIES = 64
+QUERY_CACHE_STATS = {"hits": 0, "misses": 0, "evictions": 0, "bytes": 0}
+
 
 def initialize_database():
     if not os.path.exists(DB_PATH) or os.stat(DB_PATH).st_size == 0:
@@ -22,40 +58,309 @@ def initialize_database():
         connection.commit()
         connection.close()
 
+    # Bring new and existing databases up to the latest schema version
+    connection = sqlite3.connect(DB_PATH)
+    try:
+        migrate_database(connection)
+    finally:
+        connection.close()
+
+
+def migrate_database(connection):
+    """Apply `database/migrations/NNNN_name.sql` files newer than schema_version.
+
+    Each migration runs in its own IMMEDIATE transaction and is recorded in
+    schema_version, so existing databases are evolved in place exactly once.
+    """
+    migrations = []
+    for file_name in os.listdir(MIGRATIONS_PATH):
+        match = re.match(r"^(\d+)_(\w+)\.sql$", file_name)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2), file_name))
+
+    for version, name, file_name in sorted(migrations):
+        with open(os.path.join(MIGRATIONS_PATH, file_name), "r") as sql_file:
+            lines = sql_file.read().splitlines(keepends=True)
+
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS schema_version (
+                  version INTEGER PRIMARY KEY,
+                  name TEXT NOT NULL,
+                  applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+                """)
+            applied = connection.execute(
+                "SELECT 1 FROM schema_version WHERE version = ?", (version,)
+            ).fetchone()
+            if applied:
+                connection.rollback()
+                continue
+
+            statement = ""
+            for line in lines:
+                statement += line
+                if sqlite3.complete_statement(statement):
+                    connection.execute(statement)
+                    statement = ""
+
+            connection.execute(
+                "INSERT INTO schema_version (version, name) VALUES (?, ?)",
+                (version, name),
+            )
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+
 
 def connect():
-    global DB_INITIALIZED
-    if not DB_INITIALIZED:
-        initialize_database()
-        DB_INITIALIZED = True
+    global DB_INITIALIZED, CONNECTION
+    with CONNECTION_LOCK:
+        if not DB_INITIALIZED:
+            initialize_database()
+            DB_INITIALIZED = True
 
-    return sqlite3.connect(DB_PATH)
+        if CONNECTION is None:
+            CONNECTION = sqlite3.connect(DB_PATH, check_same_thread=False)
+            for name, value in PRAGMAS.items():
+                CONNECTION.execute(f"PRAGMA {name}={value}")
+
+    return CONNECTION
+
+
+def connect_read():
+    global READ_CONNECTION
+    connect()  # creates and migrates the database, and switches it to WAL
+    with READ_CONNECTION_LOCK:
+        if READ_CONNECTION is None:
+            READ_CONNECTION = sqlite3.connect(
+                pathlib.Path(DB_PATH).as_uri() + "?mode=ro",
+                uri=True,
+                check_same_thread=False,
+            )
+            READ_CONNECTION.execute(f"PRAGMA busy_timeout={PRAGMAS['busy_timeout']}")
+            READ_CONNECTION.execute("PRAGMA query_only=1")
+
+    return READ_CONNECTION
+
+
+def close_connection():
+    global CONNECTION, READ_CONNECTION
+    with CONNECTION_LOCK:
+        if CONNECTION is not None:
+            CONNECTION.close()
+            CONNECTION = None
+    with READ_CONNECTION_LOCK:
+        if READ_CONNECTION is not None:
+            READ_CONNECTION.close()
+            READ_CONNECTION = None
+
+
+atexit.register(close_connection)
 
 
 def save_sensor_data(humidity, temperature, ph, sensor_p, sensor_k, irrigation_status):
-    connection = connect()
-    cursor = connection.cursor()
-    cursor.execute(
-        """
-        INSERT INTO sensor_data (humidity, temperature, ph, sensor_p, sensor_k, irrigation_status)
-        VALUES (?, ?, ?, ?, ?, ?)
-        """,
-        (humidity, temperature, ph, sensor_p, sensor_k, irrigation_status),
-    )
-    connection.commit()
-    connection.close()
+    with CONNECTION_LOCK:
+        connection = connect()
+        connection.execute(
+            """
+            INSERT INTO sensor_data (humidity, temperature, ph, sensor_p, sensor_k, irrigation_status)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            (humidity, temperature, ph, sensor_p, sensor_k, irrigation_status),
+        )
+        connection.commit()
+    # Keep the CSV used by the R analysis up to date (appends the new row only)
+    export_sensor_data()
 
 
-def fetch_sensor_data():
-    connection = connect()
-    query = "SELECT * FROM sensor_data ORDER BY created_at DESC"
-    data = pandas.read_sql_query(query, connection)
+def _cached_read(query, params=(), parse=None):
+    """Run a read query, or return its cached result if sensor_data is unchanged.
 
-    # Export the data to a CSV file
-    data.to_csv(CSV_PATH, index=False)
+    `parse(data)` post-processes a freshly read frame before it is cached.
+    Cached frames are shared, so callers must not modify them in place.
+    """
+    with READ_CONNECTION_LOCK:
+        connection = connect_read()
+        # Version and data come from the same read transaction
+        connection.execute("BEGIN")
+        try:
+            version = connection.execute(
+                "SELECT counter FROM data_version WHERE table_name = 'sensor_data'"
+            ).fetchone()[0]
+            key = (" ".join(query.split()), tuple(params), version)
+            with QUERY_CACHE_LOCK:
+                entry = QUERY_CACHE.get(key)
+                if entry is not None:
+                    QUERY_CACHE.move_to_end(key)
+                    QUERY_CACHE_STATS["hits"] += 1
+                    return entry[0]
+                QUERY_CACHE_STATS["misses"] += 1
+            data = pandas.read_sql_query(query, connection, params=params)
+        finally:
+            connection.rollback()
 
-    data["created_at"] = pandas.to_datetime(data["created_at"])
-    data["month"] = data["created_at"].dt.to_period("M")  # Adiciona uma coluna de mês
-    connection.close()
+    if parse is not None:
+        data = parse(data)
 
+    size = int(data.memory_usage(deep=True, index=True).sum())
+    if size <= QUERY_CACHE_MAX_BYTES:
+        with QUERY_CACHE_LOCK:
+            previous = QUERY_CACHE.pop(key, None)
+            if previous is not None:
+                QUERY_CACHE_STATS["bytes"] -= previous[1]
+            QUERY_CACHE[key] = (data, size)
+            QUERY_CACHE_STATS["bytes"] += size
+            while (
+                QUERY_CACHE_STATS["bytes"] > QUERY_CACHE_MAX_BYTES
+                or len(QUERY_CACHE) > QUERY_CACHE_MAX_ENTRIES
+            ):
+                _, (_, evicted_size) = QUERY_CACHE.popitem(last=False)
+                QUERY_CACHE_STATS["bytes"] -= evicted_size
+                QUERY_CACHE_STATS["evictions"] += 1
     return data
+
+
+def query_cache_stats():
+    with QUERY_CACHE_LOCK:
+        return dict(QUERY_CACHE_STATS, entries=len(QUERY_CACHE))
+
+
+def fetch_sensor_data():
+    def parse(data):
+        data["created_at"] = pandas.to_datetime(data["created_at"])
+        # Adiciona uma coluna de mês
+        data["month"] = data["created_at"].dt.to_period("M")
+        return data
+
+    return _cached_read(
+        "SELECT * FROM sensor_data ORDER BY created_at DESC", parse=parse
+    )
+
+
+SENSOR_COLUMNS = [
+    "id",
+    "humidity",
+    "temperature",
+    "ph",
+    "sensor_p",
+    "sensor_k",
+    "irrigation_status",
+    "created_at",
+]
+# Bucket width in seconds; "month" buckets by calendar month
+RESAMPLE_INTERVALS = {"1min": 60, "15min": 900, "1h": 3600, "1d": 86400, "month": None}
+
+
+def query_sensor_data(
+    columns=None,
+    start=None,
+    end=None,
+    limit=None,
+    offset=None,
+    resample=None,
+    order="desc",
+):
+    """Read a window of sensor_data with the filtering done in SQL.
+
+    `start` is inclusive and `end` exclusive. With `resample` (see
+    RESAMPLE_INTERVALS) the selected columns are averaged per time bucket
+    and a `count` column is added.
+    """
+    columns = list(columns or SENSOR_COLUMNS)
+    unknown = [column for column in columns if column not in SENSOR_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown sensor_data columns: {unknown}")
+    if order not in ("asc", "desc"):
+        raise ValueError("order must be 'asc' or 'desc'")
+
+    conditions, params = [], []
+    if start is not None:
+        conditions.append("created_at >= ?")
+        params.append(pandas.Timestamp(start).strftime("%Y-%m-%d %H:%M:%S"))
+    if end is not None:
+        conditions.append("created_at < ?")
+        params.append(pandas.Timestamp(end).strftime("%Y-%m-%d %H:%M:%S"))
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    if resample is None:
+        query = f"SELECT {', '.join(columns)} FROM sensor_data{where} ORDER BY created_at {order.upper()}"
+    else:
+        seconds = RESAMPLE_INTERVALS[resample]
+        if seconds is None:
+            bucket = "strftime('%Y-%m-01 00:00:00', created_at)"
+        else:
+            bucket = f"datetime((CAST(strftime('%s', created_at) AS INTEGER) / {seconds}) * {seconds}, 'unixepoch')"
+        values = "".join(
+            f", AVG({column}) AS {column}"
+            for column in columns
+            if column not in ("id", "created_at")
+        )
+        query = (
+            f"SELECT {bucket} AS created_at, COUNT(*) AS count{values} "
+            f"FROM sensor_data{where} GROUP BY 1 ORDER BY 1 {order.upper()}"
+        )
+
+    if limit is not None or offset is not None:
+        query += " LIMIT ? OFFSET ?"
+        params += [-1 if limit is None else int(limit), int(offset or 0)]
+
+    def parse(data):
+        if "created_at" in data:
+            data["created_at"] = pandas.to_datetime(data["created_at"])
+        return data
+
+    return _cached_read(query, params, parse)
+
+
+def export_sensor_data():
+    """Append rows added since the last export to CSV_PATH.
+
+    A manifest next to the CSV stores the exported high-water mark (`id`) and
+    the byte length of the complete export, so an interrupted append is cut
+    off on the next run and a missing or edited file is rewritten in full.
+    """
+    try:
+        with open(CSV_MANIFEST_PATH, "r") as manifest_file:
+            manifest = json.load(manifest_file)
+    except (FileNotFoundError, ValueError):
+        manifest = None
+
+    size = os.path.getsize(CSV_PATH) if os.path.exists(CSV_PATH) else None
+    rewrite = manifest is None or size is None or size < manifest["bytes"]
+    if rewrite:
+        manifest = {"watermark": 0, "bytes": 0}
+    elif size > manifest["bytes"]:
+        with open(CSV_PATH, "r+b") as csv_file:
+            csv_file.truncate(manifest["bytes"])
+
+    with READ_CONNECTION_LOCK:
+        new_rows = pandas.read_sql_query(
+            "SELECT * FROM sensor_data WHERE id > ? ORDER BY id",
+            connect_read(),
+            params=(manifest["watermark"],),
+        )
+
+    # An empty table is exported once, as a header-only file
+    if new_rows.empty and not rewrite:
+        return
+
+    if manifest["watermark"] == 0:
+        tmp_path = CSV_PATH + ".tmp"
+        new_rows.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, CSV_PATH)
+    else:
+        new_rows.to_csv(CSV_PATH, mode="a", header=False, index=False)
+
+    manifest = {
+        "watermark": (
+            int(new_rows["id"].max()) if not new_rows.empty else manifest["watermark"]
+        ),
+        "bytes": os.path.getsize(CSV_PATH),
+    }
+    tmp_path = CSV_MANIFEST_PATH + ".tmp"
+    with open(tmp_path, "w") as manifest_file:
+        json.dump(manifest, manifest_file)
+    os.replace(tmp_path, CSV_MANIFEST_PATH)
@@ -0,0 +1,11 @@
+-- Time index for sensor_data. created_at leads so ORDER BY created_at and
+-- time range filters become index scans; the reading columns make it a
+-- covering index for the dashboard's monthly averages.
+CREATE INDEX IF NOT EXISTS
+  idx_sensor_data_created_at ON sensor_data (
+    created_at,
+    humidity,
+    temperature,
+    ph,
+    irrigation_status
+  );
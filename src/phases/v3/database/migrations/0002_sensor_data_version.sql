@@ -0,0 +1,28 @@
+-- Change counter of sensor_data, used as the data version of cached query
+-- results in database.py: every insert, update or delete bumps it.
+
+CREATE TABLE
+  data_version (
+    table_name TEXT PRIMARY KEY,
+    counter INTEGER NOT NULL DEFAULT 0
+  );
+
+INSERT INTO
+  data_version (table_name)
+VALUES
+  ('sensor_data');
+
+CREATE TRIGGER trg_sensor_data_version_insert AFTER INSERT ON sensor_data
+BEGIN
+  UPDATE data_version SET counter = counter + 1 WHERE table_name = 'sensor_data';
+END;
+
+CREATE TRIGGER trg_sensor_data_version_update AFTER UPDATE ON sensor_data
+BEGIN
+  UPDATE data_version SET counter = counter + 1 WHERE table_name = 'sensor_data';
+END;
+
+CREATE TRIGGER trg_sensor_data_version_delete AFTER DELETE ON sensor_data
+BEGIN
+  UPDATE data_version SET counter = counter + 1 WHERE table_name = 'sensor_data';
+END;
@@ -6,12 +6,24 @@ from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import accuracy_score, classification_report, confusion_matrix
 import joblib
 import io
+from utils.export import read_sensor_export
+from utils.query import SCHEMAS, query_sensor_data
+
+
+def load_dataset():
+    # The MQTT writer keeps the export up to date after each commit; reading
+    # it never exports, and rows written since by other writers come from the
+    # database. Before the first export the readings come from SQLite.
+    try:
+        return read_sensor_export(include_new=True)
+    except FileNotFoundError:
+        # A copy: the cached frame is shared and train_model adds a column
+        return query_sensor_data(SCHEMAS["v4"]["columns"], order="asc").copy()
 
 
 def train_model():
 
-    data_path = "./database/tbl_LEITURA.csv"
-    df = pd.read_csv(data_path)
+    df = load_dataset()
 
     df["humidity_temperature_ratio"] = df["ltr_UMIDADE"] / (df["ltr_TEMPERATURA"] + 0.1)
 
@@ -62,8 +74,7 @@ def render():
     st.write("Este modelo utiliza dados de sensores para prever o status de irrigação.")
 
     with st.expander("Detalhes do Dataset"):
-        data_path = "./database/tbl_LEITURA.csv"
-        df = pd.read_csv(data_path)
+        df = load_dataset()
 
         st.markdown("**Primeiras Linhas do Dataset:**")
         st.dataframe(df.head())
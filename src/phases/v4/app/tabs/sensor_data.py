@@ -3,6 +3,16 @@ import pandas as pd
 import plotly.graph_objects as go
 import plotly.express as px
 from utils.database import fetch_sensor_data
+from utils.irrigation import IrrigationCycles, water_time
+from utils.latest import refresh as refresh_latest
+from utils.metrics import histogram_quantile, read_metrics
+from utils.resample import resample_frame
+from utils.rollups import fetch_rollups
+
+# Kept between reruns: each render only processes the readings added since
+IRRIGATION_CYCLES = IrrigationCycles()
+# Longest outage bridged in the trend chart, in seconds
+TREND_MAX_GAP = 3 * 3600
 
 
 def render():
@@ -12,7 +22,42 @@ def render():
     )
     st.markdown("---")
 
-    data = fetch_sensor_data()
+    # Current conditions come from the in-memory latest-reading buffer
+    # of the device that sent the newest reading, so the deltas compare two
+    # readings of the same device
+    device, buffer = refresh_latest()
+    recent = buffer.last_n(2)
+    if len(recent):
+        current = recent.iloc[-1]
+        previous = recent.iloc[0] if len(recent) > 1 else None
+        st.subheader("Condições Atuais")
+        st.caption(
+            f"Última leitura: {current['timestamp']:%d/%m/%Y %H:%M:%S}"
+            + (f" — dispositivo {device}" if device is not None else "")
+        )
+        columns = st.columns(4)
+        for column, (name, label, unit) in zip(
+            columns,
+            [
+                ("ltr_UMIDADE", "Umidade", "%"),
+                ("ltr_TEMPERATURA", "Temperatura", "°C"),
+                ("ltr_PH", "pH", ""),
+            ],
+        ):
+            delta = None if previous is None else current[name] - previous[name]
+            column.metric(
+                label,
+                f"{current[name]:.1f} {unit}".strip(),
+                None if delta is None else f"{delta:+.1f}",
+            )
+        columns[3].metric(
+            "Irrigação", "Ligada" if current["ltr_STATUS_IRRIGACAO"] else "Desligada"
+        )
+        st.markdown("---")
+
+    render_ingest_metrics()
+
+    data = fetch_sensor_data(incremental=True)
 
     # Raw Sensor Data
     st.subheader("Dados Brutos dos Sensores")
@@ -20,7 +65,8 @@ def render():
         "Aqui estão todos os dados coletados pelos sensores, mostrando valores de umidade, pH, temperatura e status da irrigação."
     )
     st.dataframe(data)
-    monthly_data = data.groupby("month").mean().reset_index()
+    # Monthly charts read the rollup tables instead of the raw history
+    monthly_data = fetch_rollups("month")
     st.markdown("---")
 
     # Average Monthly Humidity
@@ -176,15 +222,12 @@ def render():
     st.write(
         "Quantas vezes por mês a irrigação foi ativada. Isso ajuda a entender o consumo de água ao longo do tempo."
     )
-    monthly_activation_count = (
-        data[data["ltr_STATUS_IRRIGACAO"] == 1].groupby("month").size()
-    )
-    monthly_activation_count.index = monthly_activation_count.index.astype(str)
+    monthly_activation_count = monthly_data[monthly_data["agr_IRRIGACAO_QTD"] > 0]
     monthly_irrigation_activation_chart = go.Figure()
     monthly_irrigation_activation_chart.add_trace(
         go.Bar(
-            x=monthly_activation_count.index,
-            y=monthly_activation_count.values,
+            x=monthly_activation_count["month"],
+            y=monthly_activation_count["agr_IRRIGACAO_QTD"],
             marker=dict(color="green"),
         )
     )
@@ -201,12 +244,20 @@ def render():
     st.write(
         "Linhas de tendência para observar como os níveis de umidade e temperatura mudam ao longo do ano."
     )
-    data["ltr_DATA"] = pd.to_datetime(data["ltr_DATA"])
+    # Hourly grid: short gaps are interpolated, longer outages break the lines
+    trend_data = resample_frame(
+        data,
+        "1h",
+        ["ltr_UMIDADE", "ltr_TEMPERATURA"],
+        fill="linear",
+        max_gap=TREND_MAX_GAP,
+        by_device=False,
+    )
     time_trend_chart = go.Figure()
     time_trend_chart.add_trace(
         go.Scatter(
-            x=data["ltr_DATA"],
-            y=data["ltr_UMIDADE"],
+            x=trend_data["ltr_DATA"],
+            y=trend_data["ltr_UMIDADE"],
             mode="lines",
             name="Umidade",
             line=dict(color="blue"),
@@ -214,8 +265,8 @@ def render():
     )
     time_trend_chart.add_trace(
         go.Scatter(
-            x=data["ltr_DATA"],
-            y=data["ltr_TEMPERATURA"],
+            x=trend_data["ltr_DATA"],
+            y=trend_data["ltr_TEMPERATURA"],
             mode="lines",
             name="Temperatura",
             line=dict(color="red"),
@@ -233,45 +284,55 @@ def render():
     # Irrigation Efficiency Analysis
     st.subheader("Eficiência do Uso da Água")
     st.write(
-        "Comparação dos dias com e sem irrigação ativada ao longo do tempo para avaliar a eficiência no uso da água."
-    )
-    days_with_irrigation = (
-        data[data["ltr_STATUS_IRRIGACAO"] == 1].groupby(data["ltr_DATA"].dt.date).size()
+        "Tempo de irrigação ligada por dia e por mês, calculado a partir dos ciclos de irrigação "
+        "(do acionamento até o desligamento) para avaliar a eficiência no uso da água."
     )
-    days_without_irrigation = (
-        data[data["ltr_STATUS_IRRIGACAO"] == 0].groupby(data["ltr_DATA"].dt.date).size()
+    cycles = IRRIGATION_CYCLES.update(data)
+    daily_water = water_time(cycles, "day")
+    monthly_water = water_time(cycles, "month")
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Ciclos de Irrigação", len(cycles))
+    col2.metric("Tempo Total de Irrigação", f"{cycles['duration'].sum() / 3600:.1f} h")
+    col3.metric(
+        "Duração Média do Ciclo",
+        f"{cycles['duration'].mean() / 60:.1f} min" if len(cycles) else "-",
     )
-    efficiency_df = pd.DataFrame(
-        {
-            "Dias com Irrigação": days_with_irrigation,
-            "Dias sem Irrigação": days_without_irrigation,
-        }
-    ).fillna(0)
+
     efficiency_chart = go.Figure()
     efficiency_chart.add_trace(
         go.Bar(
-            x=efficiency_df.index,
-            y=efficiency_df["Dias com Irrigação"],
-            name="Dias com Irrigação",
+            x=daily_water["day"],
+            y=daily_water["irrigation_seconds"] / 60,
+            name="Minutos de Irrigação",
             marker=dict(color="green"),
-        )
-    )
-    efficiency_chart.add_trace(
-        go.Bar(
-            x=efficiency_df.index,
-            y=efficiency_df["Dias sem Irrigação"],
-            name="Dias sem Irrigação",
-            marker=dict(color="red"),
+            customdata=daily_water["cycles"],
+            hovertemplate="%{x|%Y-%m-%d}: %{y:.0f} min em %{customdata} ciclos",
         )
     )
     efficiency_chart.update_layout(
-        barmode="stack",
         title="Eficiência do Uso da Água",
         xaxis_title="Data",
-        yaxis_title="Número de Dias",
+        yaxis_title="Minutos de Irrigação",
         xaxis=dict(tickformat="%Y-%m-%d", tickangle=45),
     )
     st.plotly_chart(efficiency_chart)
+
+    monthly_water_chart = go.Figure()
+    monthly_water_chart.add_trace(
+        go.Bar(
+            x=monthly_water["month"].astype(str),
+            y=monthly_water["irrigation_seconds"] / 3600,
+            name="Horas de Irrigação",
+            marker=dict(color="green"),
+        )
+    )
+    monthly_water_chart.update_layout(
+        title="Horas de Irrigação por Mês",
+        xaxis_title="Mês",
+        yaxis_title="Horas de Irrigação",
+    )
+    st.plotly_chart(monthly_water_chart)
     st.markdown("---")
 
     # Analysis of Ideal Conditions for Humidity and pH
@@ -298,3 +359,48 @@ def render():
     st.write(
         "Essas informações são cruciais para otimizar a irrigação e garantir um ambiente saudável para suas culturas."
     )
+
+
+def render_ingest_metrics():
+    """Ingest health from the metrics file written by utils/mqtt.py."""
+    samples, age = read_metrics()
+    if samples is None:
+        return
+
+    def value(name, **labels):
+        return samples.get((name, tuple(sorted(labels.items()))), 0.0)
+
+    st.subheader("Ingestão MQTT")
+    st.caption(f"Métricas de {age:.0f} s atrás")
+    columns = st.columns(4)
+    columns[0].metric("Mensagens/s", f"{value('ingest_messages_per_second'):,.1f}")
+    for column, stage, label in zip(
+        columns[1:],
+        ["decoded", "written"],
+        ["Leituras decodificadas/s", "Leituras gravadas/s"],
+    ):
+        column.metric(label, f"{value('ingest_readings_per_second', stage=stage):,.1f}")
+    depth = sum(
+        count for (name, _), count in samples.items() if name == "ingest_queue_depth"
+    )
+    columns[3].metric("Fila", f"{depth:,.0f}")
+
+    errors = {
+        dict(labels)["type"]: count
+        for (name, labels), count in samples.items()
+        if name == "ingest_errors_total" and count
+    }
+    columns = st.columns(4)
+    for column, quantile in zip(columns, [0.5, 0.99]):
+        lag = histogram_quantile(samples, "ingest_lag_seconds", quantile)
+        column.metric(
+            f"Atraso p{quantile * 100:.0f}", "-" if lag is None else f"{lag:.1f} s"
+        )
+    columns[2].metric("Descartadas", f"{value('ingest_dropped_total'):,.0f}")
+    columns[3].metric("Erros", f"{sum(errors.values()):,.0f}")
+    if errors:
+        st.caption(
+            "Erros por tipo: "
+            + ", ".join(f"{kind}: {count:,.0f}" for kind, count in errors.items())
+        )
+    st.markdown("---")
@@ -0,0 +1,411 @@
+import argparse
+import json
+import os
+import struct
+import sys
+import numpy
+import pandas
+
+if __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import database
+from utils.database import connect, connect_read
+from utils.query import format_timestamp
+
+ARCHIVE_PATH = "./database/archive.ftsa"
+MAGIC = b"FTSA"
+# Version 2 stores ltr_DISPOSITIVO in every block header; version 1 files
+# (an integer device) are still read
+VERSION = 2
+# Highest ID_LEITURA archived, next to the archive, so reruns of
+# archive_readings only add readings not archived yet
+MANIFEST_SUFFIX = ".manifest.json"
+BLOCK_ROWS = 8192
+READ_CHUNK_ROWS = 100_000
+DEVICE_COLUMN = "ltr_DISPOSITIVO"
+# Device columns accepted by write_archive; utils/generator.py writes `device`
+DEVICE_SOURCES = (DEVICE_COLUMN, "device")
+VALUE_COLUMNS = ["ltr_UMIDADE", "ltr_TEMPERATURA", "ltr_PH"]
+# Bit of each flag in the packed flags column
+FLAG_COLUMNS = ["ltr_NUTRIENTE_P", "ltr_NUTRIENTE_K", "ltr_STATUS_IRRIGACAO"]
+# Sensors report two decimals; values that are not exact get XOR encoding
+DECIMALS = 2
+
+# Block header: device ID bytes, rows, first and last ltr_DATA (epoch
+# seconds), payload bytes; the UTF-8 device ID follows, then the payload
+BLOCK_HEADER = struct.Struct("<HIqqI")
+# Device ID size of the blocks of readings without a device
+NO_DEVICE = 0xFFFF
+# Version 1 block header: integer device instead of the device ID size
+BLOCK_HEADER_V1 = struct.Struct("<iIqqI")
+INT_HEADER = struct.Struct("<BB")  # delta order, bit width
+XOR_HEADER = struct.Struct("<BBQ")  # shift, bit width, first value's bits
+FLOAT_DELTA, FLOAT_XOR = 0, 1
+
+
+def _pack(values, width):
+    """Pack unsigned integers into `width` bits each, least significant first."""
+    if width == 0 or len(values) == 0:
+        return b""
+    bits = (values[:, None] >> numpy.arange(width, dtype=numpy.uint64)) & 1
+    return numpy.packbits(bits.astype(numpy.uint8).ravel(), bitorder="little").tobytes()
+
+
+def _unpack(buffer, offset, count, width):
+    """Inverse of `_pack`; returns the values and the offset after them."""
+    if width == 0 or count == 0:
+        return numpy.zeros(count, dtype=numpy.uint64), offset
+    size = (count * width + 7) // 8
+    bits = numpy.unpackbits(
+        numpy.frombuffer(buffer, numpy.uint8, size, offset),
+        count=count * width,
+        bitorder="little",
+    ).reshape(count, width)
+    weights = numpy.uint64(1) << numpy.arange(width, dtype=numpy.uint64)
+    return bits.astype(numpy.uint64) @ weights, offset + size
+
+
+def _width(values):
+    return int(values.max()).bit_length() if len(values) else 0
+
+
+def encode_ints(values, order):
+    """Delta encode `order` times, then pack the residuals above their minimum.
+
+    Order 2 is delta-of-delta: fixed-interval timestamps become all zeros and
+    take no bits at all.
+    """
+    values = numpy.asarray(values, dtype=numpy.int64)
+    bases = []
+    for _ in range(min(order, len(values))):
+        bases.append(values[0])
+        values = numpy.diff(values)
+    minimum = int(values.min()) if len(values) else 0
+    residuals = (values - minimum).astype(numpy.uint64)
+    width = _width(residuals)
+    return b"".join(
+        [
+            INT_HEADER.pack(len(bases), width),
+            numpy.array(bases + [minimum], dtype="<i8").tobytes(),
+            _pack(residuals, width),
+        ]
+    )
+
+
+def decode_ints(buffer, offset, count):
+    order, width = INT_HEADER.unpack_from(buffer, offset)
+    offset += INT_HEADER.size
+    header = numpy.frombuffer(buffer, "<i8", order + 1, offset)
+    offset += 8 * (order + 1)
+    residuals, offset = _unpack(buffer, offset, count - order, width)
+    values = residuals.astype(numpy.int64) + header[-1]
+    for base in header[:-1][::-1]:
+        values = numpy.concatenate(([base], base + numpy.cumsum(values)))
+    return values, offset
+
+
+def encode_floats(values):
+    """Encode a float column losslessly, as scaled deltas or Gorilla-style XORs.
+
+    Readings with DECIMALS places are stored as delta-encoded integers, which
+    take a few bits for slowly changing values. Anything else falls back to
+    XOR with the previous value, dropping the trailing zero bits the whole
+    block shares.
+    """
+    values = numpy.asarray(values, dtype=numpy.float64)
+    scaled = numpy.round(values * 10**DECIMALS)
+    if numpy.array_equal(scaled / 10**DECIMALS, values):
+        return bytes([FLOAT_DELTA]) + encode_ints(scaled.astype(numpy.int64), 1)
+
+    bits = values.view(numpy.uint64)
+    xors = bits[1:] ^ bits[:-1]
+    nonzero = xors[xors != 0]
+    shift = 0
+    if len(nonzero):
+        lowest = nonzero & (~nonzero + numpy.uint64(1))  # lowest set bit
+        shift = int(numpy.log2(lowest.astype(numpy.float64)).min())
+    xors = xors >> numpy.uint64(shift)
+    width = _width(xors)
+    first = int(bits[0]) if len(bits) else 0
+    return b"".join(
+        [bytes([FLOAT_XOR]), XOR_HEADER.pack(shift, width, first), _pack(xors, width)]
+    )
+
+
+def decode_floats(buffer, offset, count):
+    mode = buffer[offset]
+    offset += 1
+    if mode == FLOAT_DELTA:
+        values, offset = decode_ints(buffer, offset, count)
+        return values / 10**DECIMALS, offset
+
+    shift, width, first = XOR_HEADER.unpack_from(buffer, offset)
+    offset += XOR_HEADER.size
+    xors, offset = _unpack(buffer, offset, count - 1, width)
+    xors = numpy.concatenate(([numpy.uint64(first)], xors << numpy.uint64(shift)))
+    return numpy.bitwise_xor.accumulate(xors).view(numpy.float64), offset
+
+
+def encode_block(device, block):
+    """Encode one device's readings (sorted by ltr_DATA) into a block;
+    `device` is the ltr_DISPOSITIVO text or None."""
+    seconds = block["ltr_DATA"].to_numpy("datetime64[s]").astype(numpy.int64)
+    flags = numpy.zeros(len(block), dtype=numpy.int64)
+    for bit, column in enumerate(FLAG_COLUMNS):
+        flags |= block[column].to_numpy(numpy.int64) << bit
+    payload = b"".join(
+        [encode_ints(seconds, 2), encode_ints(block["ID_LEITURA"], 1)]
+        + [encode_floats(block[column]) for column in VALUE_COLUMNS]
+        + [encode_ints(flags, 0)]
+    )
+    if device is None:
+        device, device_size = b"", NO_DEVICE
+    else:
+        device = device.encode("utf-8")
+        device_size = len(device)
+        if device_size >= NO_DEVICE:
+            raise ValueError(f"Device ID of {device_size} bytes is too long")
+    header = BLOCK_HEADER.pack(
+        device_size, len(block), seconds[0], seconds[-1], len(payload)
+    )
+    return header + device + payload
+
+
+def decode_block(buffer, offset, count):
+    """Decode a block payload into the columns of `fetch_sensor_data`."""
+    seconds, offset = decode_ints(buffer, offset, count)
+    ids, offset = decode_ints(buffer, offset, count)
+    columns = {"ID_LEITURA": ids}
+    for column in VALUE_COLUMNS:
+        columns[column], offset = decode_floats(buffer, offset, count)
+    flags, offset = decode_ints(buffer, offset, count)
+    for bit, column in enumerate(FLAG_COLUMNS):
+        columns[column] = (flags >> bit) & 1
+    columns["ltr_DATA"] = seconds.astype("datetime64[s]").astype("datetime64[ns]")
+    return columns
+
+
+def _devices(frame):
+    """ltr_DISPOSITIVO of each row as text or None, from DEVICE_SOURCES."""
+    source = next((name for name in DEVICE_SOURCES if name in frame), None)
+    if source is None:
+        return pandas.Series(None, index=frame.index, dtype=object)
+    devices = frame[source].convert_dtypes()
+    return devices.astype(str).astype(object).where(devices.notna(), None)
+
+
+def _version(header, path):
+    if header[: len(MAGIC)] != MAGIC or header[len(MAGIC)] not in (1, VERSION):
+        raise ValueError(f"{path} is not a reading archive")
+    return header[len(MAGIC)]
+
+
+def write_archive(frames, path=ARCHIVE_PATH, append=True, block_rows=BLOCK_ROWS):
+    """Append frames of tbl_LEITURA rows to an archive; returns rows written.
+
+    Rows are split by ltr_DISPOSITIVO (or `device`, stored as text; readings
+    without one form their own blocks) and written as blocks of at most
+    `block_rows` readings in time order. Version 1 archives cannot be
+    appended to.
+    """
+    exists = append and os.path.exists(path) and os.path.getsize(path) > 0
+    if exists:
+        with open(path, "rb") as archive:
+            if _version(archive.read(len(MAGIC) + 1), path) != VERSION:
+                raise ValueError(f"{path} is a version 1 archive, write a new one")
+    rows = 0
+    with open(path, "ab" if exists else "wb") as archive:
+        if not exists:
+            archive.write(MAGIC + bytes([VERSION]))
+        for frame in frames:
+            frame = frame.assign(
+                ltr_DATA=pandas.to_datetime(frame["ltr_DATA"]),
+                **{DEVICE_COLUMN: _devices(frame)},
+            )
+            frame = frame.sort_values([DEVICE_COLUMN, "ltr_DATA"], kind="stable")
+            for device, readings in frame.groupby(
+                DEVICE_COLUMN, sort=False, dropna=False
+            ):
+                device = None if pandas.isna(device) else device
+                for first in range(0, len(readings), block_rows):
+                    block = readings.iloc[first : first + block_rows]
+                    archive.write(encode_block(device, block))
+            rows += len(frame)
+    return rows
+
+
+def _read_block_header(archive, version, path):
+    """`(device, rows, first, last, payload size)` of the block at the file
+    position, leaving it at the payload; None at the end of the archive."""
+    header_format = BLOCK_HEADER_V1 if version == 1 else BLOCK_HEADER
+    header = archive.read(header_format.size)
+    if not header:
+        return None
+    if len(header) < header_format.size:
+        raise ValueError(f"{path} ends in a truncated block header")
+    if version == 1:
+        device, *rest = header_format.unpack(header)
+        return (str(device), *rest)
+    device_size, *rest = header_format.unpack(header)
+    if device_size == NO_DEVICE:
+        return (None, *rest)
+    return (archive.read(device_size).decode("utf-8"), *rest)
+
+
+def read_archive(path=ARCHIVE_PATH, device=None, start=None, end=None):
+    """Stream the archive as one DataFrame per block, oldest first per device.
+
+    Frames have the columns of `fetch_sensor_data` plus ltr_DISPOSITIVO
+    (the integer device of version 1 archives as text). Blocks are read one
+    at a time; blocks of other devices than `device` or entirely outside
+    [start, end) are skipped without being read.
+    """
+    start = None if start is None else pandas.Timestamp(start).timestamp()
+    end = None if end is None else pandas.Timestamp(end).timestamp()
+    with open(path, "rb") as archive:
+        version = _version(archive.read(len(MAGIC) + 1), path)
+        while True:
+            header = _read_block_header(archive, version, path)
+            if header is None:
+                break
+            block_device, count, first, last, size = header
+            if (
+                (device is not None and block_device != device)
+                or (start is not None and last < start)
+                or (end is not None and first >= end)
+            ):
+                archive.seek(size, os.SEEK_CUR)
+                continue
+            payload = archive.read(size)
+            if len(payload) < size:
+                raise ValueError(f"{path} ends in a truncated block")
+            columns = decode_block(payload, 0, count)
+            if start is not None or end is not None:
+                seconds = (
+                    columns["ltr_DATA"].astype("datetime64[s]").astype(numpy.int64)
+                )
+                keep = numpy.ones(count, dtype=bool)
+                if start is not None:
+                    keep &= seconds >= start
+                if end is not None:
+                    keep &= seconds < end
+                columns = {column: values[keep] for column, values in columns.items()}
+            # Period ordinals of monthly periods are months since 1970-01, like
+            # datetime64[M]; much faster than Series.dt.to_period
+            months = columns["ltr_DATA"].astype("datetime64[M]").astype(numpy.int64)
+            columns["month"] = pandas.arrays.PeriodArray(months, dtype="period[M]")
+            columns[DEVICE_COLUMN] = numpy.full(len(months), block_device, dtype=object)
+            yield pandas.DataFrame(columns)
+
+
+def load_archive(path=ARCHIVE_PATH, device=None, start=None, end=None):
+    """Return the archived readings newest first, like `fetch_sensor_data`."""
+    frames = list(read_archive(path, device, start, end))
+    if not frames:
+        return pandas.DataFrame(
+            columns=["ID_LEITURA"]
+            + VALUE_COLUMNS
+            + FLAG_COLUMNS
+            + ["ltr_DATA", "month", DEVICE_COLUMN]
+        )
+    data = pandas.concat(frames, ignore_index=True)
+    return data.sort_values("ltr_DATA", ascending=False, ignore_index=True)
+
+
+def _manifest_path(path):
+    return path + MANIFEST_SUFFIX
+
+
+def archived_max_id(path=ARCHIVE_PATH):
+    """Highest ID_LEITURA in the archive, 0 when there is none.
+
+    Read from the manifest, or from the blocks of archives written without
+    one.
+    """
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return 0
+    try:
+        with open(_manifest_path(path), "r") as manifest_file:
+            return json.load(manifest_file)["max_id"]
+    except (FileNotFoundError, ValueError, KeyError):
+        pass
+    return max(
+        (int(frame["ID_LEITURA"].max()) for frame in read_archive(path) if len(frame)),
+        default=0,
+    )
+
+
+def _write_manifest(path, max_id):
+    tmp_path = _manifest_path(path) + ".tmp"
+    with open(tmp_path, "w") as manifest_file:
+        json.dump({"max_id": max_id}, manifest_file)
+        manifest_file.flush()
+        os.fsync(manifest_file.fileno())
+    os.replace(tmp_path, _manifest_path(path))
+
+
+def archive_readings(before, path=ARCHIVE_PATH, delete=False):
+    """Move tbl_LEITURA readings older than `before` into the archive.
+
+    Only readings above the archive's high-water mark (`archived_max_id`)
+    are added, so reruns do not archive them twice. With `delete=True` the
+    archived rows are then removed from the table.
+    The hourly/daily/monthly rollups are left as they are, so dashboards
+    keep the aggregates of archived periods.
+    """
+    if database.SENSOR_STORAGE == "columnar":
+        raise RuntimeError(
+            "archive_readings moves tbl_LEITURA readings; with "
+            "SENSOR_STORAGE=columnar they live in the columnar store instead"
+        )
+    before = format_timestamp(before)
+    # Readings up to this ID were archived by earlier runs
+    archived_id = archived_max_id(path)
+    condition = "ltr_DATA < ? AND ID_LEITURA > ?"
+    with connect_read() as connection:
+        connection.execute("BEGIN")
+        max_id = connection.execute(
+            f"SELECT MAX(ID_LEITURA) FROM tbl_LEITURA WHERE {condition}",
+            (before, archived_id),
+        ).fetchone()[0]
+        if max_id is None:
+            return 0
+        chunks = pandas.read_sql_query(
+            f"SELECT * FROM tbl_LEITURA WHERE {condition} ORDER BY ltr_DATA",
+            connection,
+            params=(before, archived_id),
+            chunksize=READ_CHUNK_ROWS,
+        )
+        rows = write_archive(chunks, path)
+    _write_manifest(path, max_id)
+
+    if delete and rows:
+        with connect() as connection:
+            # Only rows that were archived: new late readings stay in the table
+            connection.execute(
+                "DELETE FROM tbl_LEITURA WHERE ltr_DATA < ? AND ID_LEITURA <= ?",
+                (before, max_id),
+            )
+            connection.commit()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Archive old readings in the compressed time-series format."
+    )
+    parser.add_argument("--before", required=True, help="archive readings before this")
+    parser.add_argument("--path", default=ARCHIVE_PATH)
+    parser.add_argument(
+        "--delete", action="store_true", help="remove archived rows from tbl_LEITURA"
+    )
+    args = parser.parse_args()
+
+    rows = archive_readings(args.before, args.path, args.delete)
+    size = os.path.getsize(args.path) if os.path.exists(args.path) else 0
+    print(f"{rows} readings archived in {args.path} ({size:,} bytes)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+import atexit
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+import numpy
+from utils import metrics
+from utils.database import save_sensor_data_many
+from utils.query import format_timestamp
+
+# Durability presets: (max_rows, max_age in seconds). A crash loses at most
+# the readings still buffered, i.e. max_rows rows or max_age seconds of data.
+DURABILITY = {
+    "strict": (1, 0.0),  # commit every reading, same as save_sensor_data
+    "balanced": (500, 1.0),
+    "relaxed": (5000, 10.0),
+}
+
+# (device, ltr_DATA) keys remembered to drop redeliveries before they reach
+# the database; older duplicates are still caught by the unique index
+RECENT_KEYS = 100_000
+# Readings kept for retry while flushes fail (e.g. the database is locked or
+# the disk is full); beyond that the oldest are dropped and counted
+MAX_PENDING = 100_000
+
+
+class RecentKeys:
+    """Bounded set of the most recently seen keys, oldest evicted first."""
+
+    def __init__(self, capacity=RECENT_KEYS):
+        self.capacity = capacity
+        self._keys = OrderedDict()
+
+    def add(self, key):
+        """Remember `key`; return False if it was already seen."""
+        if key in self._keys:
+            return False
+        self._keys[key] = None
+        if len(self._keys) > self.capacity:
+            self._keys.popitem(last=False)
+        return True
+
+    def discard(self, key):
+        self._keys.pop(key, None)
+
+
+def _key(row):
+    """Redelivery key of a reading tuple, None for readings without a device
+    or timestamped on arrival (see `save_sensor_data_many`)."""
+    if len(row) < 8 or row[7] is None or (len(row) > 8 and row[8]):
+        return None
+    return (row[7], row[6])
+
+
+class BatchWriter:
+    """Buffers sensor readings and writes them with one `executemany` per flush.
+
+    A flush happens when `max_rows` readings are buffered, when the oldest
+    buffered reading is `max_age` seconds old, on `flush()` and on `close()`.
+    `on_flush(rows)` is called after every successful flush. A failed flush
+    keeps its readings for the next one, but at most `max_pending` readings
+    are held: past that the oldest are dropped. Rows written, duplicates,
+    drops, failed flushes and the lag from ltr_DATA to commit are reported
+    through utils/metrics.py.
+    """
+
+    def __init__(
+        self,
+        durability="balanced",
+        max_rows=None,
+        max_age=None,
+        on_flush=None,
+        recent_keys=RECENT_KEYS,
+        max_pending=MAX_PENDING,
+    ):
+        if durability not in DURABILITY:
+            raise ValueError(
+                f"Unknown durability '{durability}', expected one of {list(DURABILITY)}"
+            )
+
+        default_rows, default_age = DURABILITY[durability]
+        self.max_rows = max_rows if max_rows is not None else default_rows
+        self.max_age = max_age if max_age is not None else default_age
+        self.on_flush = on_flush
+        self.max_pending = max(max_pending, self.max_rows)
+        self.rows_written = 0
+        self.duplicates = 0
+        self.dropped = 0
+        self.errors = 0
+        self.lag = metrics.Histogram()
+
+        self._buffer = []
+        self._recent = RecentKeys(recent_keys)
+        self._oldest = None
+        self._buffer_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._timer = None
+        if self.max_age > 0:
+            self._timer = threading.Thread(target=self._flush_when_old, daemon=True)
+            self._timer.start()
+
+        metrics.register(self._collect)
+        atexit.register(self.close)
+
+    def save_sensor_data(
+        self,
+        humidity,
+        temperature,
+        ph,
+        sensor_p,
+        sensor_k,
+        irrigation_status,
+        timestamp=None,
+        device=None,
+    ):
+        """Drop-in replacement for `database.save_sensor_data`.
+
+        Without `timestamp` the reading is timestamped on arrival so a
+        delayed flush does not shift `ltr_DATA` to the commit time. With a
+        `device` and a `timestamp`, a reading already seen for the same device
+        and timestamp is dropped; returns False for such duplicates.
+        """
+        stamped = timestamp is None
+        if stamped:
+            timestamp = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+        else:
+            timestamp = format_timestamp(timestamp)
+        return (
+            self.add_many(
+                [
+                    (
+                        humidity,
+                        temperature,
+                        ph,
+                        sensor_p,
+                        sensor_k,
+                        irrigation_status,
+                        timestamp,
+                        device,
+                        int(stamped),
+                    )
+                ]
+            )
+            == 1
+        )
+
+    def add_many(self, rows):
+        """Buffer reading tuples (see `save_sensor_data_many`); returns how many
+        were kept after dropping recently seen `(device, ltr_DATA)` keys."""
+        with self._buffer_lock:
+            kept = [
+                row for row in rows if _key(row) is None or self._recent.add(_key(row))
+            ]
+            self.duplicates += len(rows) - len(kept)
+            if not kept:
+                return 0
+            if not self._buffer:
+                self._oldest = time.monotonic()
+            self._buffer.extend(kept)
+            self._drop_excess()
+            full = len(self._buffer) >= self.max_rows
+
+        if full:
+            self.flush()
+        return len(kept)
+
+    def flush(self):
+        with self._flush_lock:
+            with self._buffer_lock:
+                rows, self._buffer = self._buffer, []
+                self._oldest = None
+
+            if not rows:
+                return 0
+
+            try:
+                inserted = save_sensor_data_many(rows)
+            except Exception:
+                self.errors += 1
+                # Put the readings back so the next flush retries them in order
+                with self._buffer_lock:
+                    self._buffer[:0] = rows
+                    self._oldest = time.monotonic()
+                    self._drop_excess()
+                raise
+
+            self.rows_written += inserted
+            self._observe_lag(rows)
+            # Duplicates the recent keys had already forgotten
+            with self._buffer_lock:
+                self.duplicates += len(rows) - inserted
+            if self.on_flush is not None:
+                try:
+                    self.on_flush(rows)
+                except Exception as e:
+                    print(f"Error in flush callback: {e}")
+            return len(rows)
+
+    def _drop_excess(self):
+        # Called with _buffer_lock held
+        excess = len(self._buffer) - self.max_pending
+        if excess <= 0:
+            return
+        for row in self._buffer[:excess]:
+            # A redelivery of a dropped reading may still be stored
+            if _key(row) is not None:
+                self._recent.discard(_key(row))
+        del self._buffer[:excess]
+        self.dropped += excess
+
+    def _observe_lag(self, rows):
+        try:
+            # ltr_DATA is UTC, like time.time()
+            stamps = numpy.array([row[6] for row in rows], dtype="datetime64[s]")
+        except ValueError:
+            return
+        lag = time.time() - stamps.astype(numpy.int64)
+        # Devices whose clock runs ahead would report a negative lag
+        self.lag.observe_many(numpy.maximum(lag, 0))
+
+    def _collect(self):
+        return [
+            (
+                "ingest_readings_total",
+                [("ingest_readings_total", {"stage": "written"}, self.rows_written)],
+            ),
+            (
+                "ingest_duplicates_total",
+                [("ingest_duplicates_total", {}, self.duplicates)],
+            ),
+            (
+                "ingest_writer_dropped_total",
+                [("ingest_writer_dropped_total", {}, self.dropped)],
+            ),
+            (
+                "ingest_errors_total",
+                [("ingest_errors_total", {"type": "database"}, self.errors)],
+            ),
+            (
+                "ingest_writer_pending",
+                [("ingest_writer_pending", {}, self.pending())],
+            ),
+            ("ingest_lag_seconds", self.lag.samples("ingest_lag_seconds")),
+        ]
+
+    def pending(self):
+        with self._buffer_lock:
+            return len(self._buffer)
+
+    def _flush_when_old(self):
+        interval = min(self.max_age / 4, 0.25)
+        while not self._stop.wait(interval):
+            with self._buffer_lock:
+                oldest = self._oldest
+            if oldest is not None and time.monotonic() - oldest >= self.max_age:
+                try:
+                    self.flush()
+                except Exception as e:
+                    print(f"Error flushing sensor data: {e}")
+
+    def close(self):
+        self._stop.set()
+        if self._timer is not None and self._timer is not threading.current_thread():
+            self._timer.join()
+        self.flush()
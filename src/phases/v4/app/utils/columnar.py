@@ -0,0 +1,519 @@
+import atexit
+import contextlib
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+import numpy
+import pandas
+import pyarrow
+import pyarrow.compute
+import pyarrow.dataset
+import pyarrow.parquet
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+COLUMNAR_PATH = "./database/columnar"
+# Single readings are buffered until FLUSH_ROWS of them or the oldest is
+# FLUSH_SECONDS old, and at exit
+FLUSH_ROWS = 10_000
+FLUSH_SECONDS = 5
+# Lists the live part files and the next ID_LEITURA; replaced atomically
+MANIFEST = "_manifest.json"
+MANIFEST_LOCK = "_manifest.lock"
+# Held by the process compacting, so only one compacts at a time
+COMPACTION_LOCK = "_compaction.lock"
+# Files compaction replaced stay on disk this long for readers that listed
+# them in an older manifest
+RETAIN_SECONDS = 600
+# Partitions with more than one file smaller than this are merged by compact()
+SMALL_FILE_BYTES = 8 * 2**20
+
+SCHEMA = pyarrow.schema(
+    [
+        ("ID_LEITURA", pyarrow.int64()),
+        ("ltr_UMIDADE", pyarrow.float64()),
+        ("ltr_TEMPERATURA", pyarrow.float64()),
+        ("ltr_PH", pyarrow.float64()),
+        ("ltr_NUTRIENTE_P", pyarrow.uint8()),
+        ("ltr_NUTRIENTE_K", pyarrow.uint8()),
+        ("ltr_STATUS_IRRIGACAO", pyarrow.uint8()),
+        ("ltr_DATA", pyarrow.timestamp("s")),
+        # Missing (null) in files written before they were added; a null
+        # ltr_DATA_RECEBIDA counts as 0, like SQLite's column default
+        ("ltr_DISPOSITIVO", pyarrow.string()),
+        ("ltr_DATA_RECEBIDA", pyarrow.uint8()),
+    ]
+)
+READING_COLUMNS = SCHEMA.names[1:]
+# A redelivered reading has the (device, producer ltr_DATA) of a stored one,
+# see migrations 0005/0006
+KEY_COLUMNS = ["ltr_DISPOSITIVO", "ltr_DATA"]
+
+_STORES = {}
+_STORES_LOCK = threading.Lock()
+
+
+def _keyed(data):
+    """Rows identified by KEY_COLUMNS: with a device and a producer ltr_DATA."""
+    received = data["ltr_DATA_RECEBIDA"].fillna(0)
+    return data["ltr_DISPOSITIVO"].notna() & (received == 0)
+
+
+def _repeated(data):
+    """Mask of the keyed rows whose key an earlier keyed row has."""
+    keyed = _keyed(data).to_numpy(bool)
+    repeated = numpy.zeros(len(data), dtype=bool)
+    repeated[keyed] = data[keyed].duplicated(KEY_COLUMNS).to_numpy(bool)
+    return pandas.Series(repeated, index=data.index)
+
+
+@contextlib.contextmanager
+def _file_lock(path, blocking=True):
+    """Exclusive lock on `path` across processes; yields False if it is held
+    elsewhere and `blocking` is False."""
+    with open(path, "a+b") as lock_file:
+        try:
+            if fcntl is not None:
+                flags = fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB)
+                fcntl.flock(lock_file, flags)
+            else:
+                mode = msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK
+                msvcrt.locking(lock_file.fileno(), mode, 1)
+        except OSError:
+            if blocking:
+                raise
+            yield False
+            return
+        # Closing the file releases the lock
+        yield True
+
+
+def _drop_redeliveries(table):
+    """`table` without the keyed rows repeating an earlier row's key, e.g.
+    written before the store checked them; the lowest ID_LEITURA is kept."""
+    duplicate = _repeated(table.select(KEY_COLUMNS + ["ltr_DATA_RECEBIDA"]).to_pandas())
+    if not duplicate.any():
+        return table
+    return table.filter(pyarrow.array(~duplicate.to_numpy()))
+
+
+class ColumnarStore:
+    """Month-partitioned Parquet storage for sensor readings.
+
+    Files live in `<root>/month=YYYY-MM/part-*.parquet` and `<root>/_manifest.json`
+    lists the live ones. Writes add part files and then replace the manifest
+    under a lock shared by all processes; reads only open the files of the
+    manifest they read, pruned by month, and only load the requested
+    columns. `compact()` merges the small files of each partition.
+    """
+
+    def __init__(
+        self, root=COLUMNAR_PATH, flush_rows=FLUSH_ROWS, flush_seconds=FLUSH_SECONDS
+    ):
+        self.root = root
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        os.makedirs(root, exist_ok=True)
+
+        self._buffer = []
+        self._buffer_lock = threading.Lock()
+        self._flush_timer = None
+        self._files_lock = threading.RLock()
+        self._compactor = None
+        self._stop = threading.Event()
+        # ltr_DATA range of each part file, which never changes once written
+        self._time_ranges = {}
+        with self._update_manifest():
+            pass
+        atexit.register(self.close)
+
+    def _path(self, name):
+        return os.path.join(self.root, name)
+
+    def _read_manifest(self):
+        try:
+            with open(self._path(MANIFEST), "r") as manifest_file:
+                return json.load(manifest_file)
+        except FileNotFoundError:
+            return None
+
+    @contextlib.contextmanager
+    def _update_manifest(self):
+        """Yield the current manifest to change, then replace it atomically.
+
+        Nothing is written if the block raises. A store created before the
+        manifest existed gets one listing its part files.
+        """
+        with self._files_lock, _file_lock(self._path(MANIFEST_LOCK)):
+            manifest = self._read_manifest()
+            if manifest is None:
+                files = [
+                    os.path.relpath(path, self.root) for path in self._partition_files()
+                ]
+                manifest = {
+                    "next_id": self._max_id(files) + 1,
+                    "files": files,
+                    "replaced": {},
+                }
+            yield manifest
+            temporary = self._path(f"{MANIFEST}.tmp")
+            with open(temporary, "w") as manifest_file:
+                json.dump(manifest, manifest_file)
+            os.replace(temporary, self._path(MANIFEST))
+
+    def _partition_files(self):
+        return sorted(glob.glob(os.path.join(self.root, "month=*", "part-*.parquet")))
+
+    def _max_id(self, files):
+        # Only the file footers are read: Parquet keeps per-column statistics
+        max_id = 0
+        for name in files:
+            path = self._path(name)
+            metadata = pyarrow.parquet.ParquetFile(path).metadata
+            index = metadata.schema.names.index("ID_LEITURA")
+            for row_group in range(metadata.num_row_groups):
+                statistics = metadata.row_group(row_group).column(index).statistics
+                if statistics is not None and statistics.has_min_max:
+                    max_id = max(max_id, statistics.max)
+        return max_id
+
+    def _time_range(self, name):
+        """`(first, last)` ltr_DATA of a part file from its footer statistics,
+        or None when they are missing."""
+        if name not in self._time_ranges:
+            metadata = pyarrow.parquet.ParquetFile(self._path(name)).metadata
+            index = metadata.schema.names.index("ltr_DATA")
+            ranges = [
+                metadata.row_group(row_group).column(index).statistics
+                for row_group in range(metadata.num_row_groups)
+            ]
+            if all(stats is not None and stats.has_min_max for stats in ranges):
+                self._time_ranges[name] = (
+                    min(
+                        (pandas.Timestamp(stats.min) for stats in ranges), default=None
+                    ),
+                    max(
+                        (pandas.Timestamp(stats.max) for stats in ranges), default=None
+                    ),
+                )
+            else:
+                self._time_ranges[name] = None
+        return self._time_ranges[name]
+
+    def _files_between(self, names, first, last):
+        """The part files that may hold readings in [first, last]."""
+        files = []
+        for name in names:
+            time_range = self._time_range(name)
+            if time_range is None:
+                overlaps = self._month_overlaps(
+                    name, first, last + pandas.Timedelta(seconds=1)
+                )
+            else:
+                overlaps = time_range[0] is not None and (
+                    time_range[0] <= last and first <= time_range[1]
+                )
+            if overlaps:
+                files.append(self._path(name))
+        return files
+
+    def save_sensor_data(
+        self, humidity, temperature, ph, sensor_p, sensor_k, irrigation_status
+    ):
+        timestamp = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+        with self._buffer_lock:
+            self._buffer.append(
+                (
+                    humidity,
+                    temperature,
+                    ph,
+                    sensor_p,
+                    sensor_k,
+                    irrigation_status,
+                    timestamp,
+                )
+            )
+            full = len(self._buffer) >= self.flush_rows
+            if not full and self._flush_timer is None:
+                self._flush_timer = threading.Timer(
+                    self.flush_seconds, self._timed_flush
+                )
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+        if full:
+            self.flush()
+
+    def save_sensor_data_many(self, rows):
+        """Write `(humidity, ..., irrigation_status, ltr_DATA[, device[,
+        received]])` tuples, like `database.save_sensor_data_many`, as new
+        part files. Returns the rows written, without the redeliveries."""
+        rows = [(*row, *(None, 0)[len(row) - 7 :]) for row in rows]
+        if not rows:
+            return []
+        data = pandas.DataFrame(rows, columns=READING_COLUMNS)
+        data["ltr_DATA"] = pandas.to_datetime(data["ltr_DATA"], format="ISO8601")
+        written = self.write_frame(data)
+        return [rows[position] for position in written]
+
+    def _stored_keys(self, files, data):
+        """KEY_COLUMNS of the stored readings that `data`'s keyed rows could
+        repeat: same devices, within their time range."""
+        condition = (pyarrow.compute.field("ltr_DATA") >= data["ltr_DATA"].min()) & (
+            pyarrow.compute.field("ltr_DATA") <= data["ltr_DATA"].max()
+        )
+        devices = pyarrow.array(data["ltr_DISPOSITIVO"].unique(), pyarrow.string())
+        condition &= pyarrow.compute.field("ltr_DISPOSITIVO").isin(devices)
+        stored = (
+            pyarrow.dataset.dataset(files, schema=SCHEMA, format="parquet")
+            .to_table(columns=KEY_COLUMNS + ["ltr_DATA_RECEBIDA"], filter=condition)
+            .to_pandas()
+        )
+        stored["ltr_DATA"] = stored["ltr_DATA"].astype("datetime64[ns]")
+        return pandas.MultiIndex.from_frame(stored[_keyed(stored)][KEY_COLUMNS])
+
+    def _redeliveries(self, manifest, data):
+        """Mask of `data`'s rows whose key is stored or earlier in `data`."""
+        duplicate = _repeated(data)
+        candidates = data[_keyed(data) & ~duplicate]
+        if candidates.empty:
+            return duplicate
+        files = self._files_between(
+            manifest["files"],
+            candidates["ltr_DATA"].min(),
+            candidates["ltr_DATA"].max(),
+        )
+        if not files:
+            return duplicate
+        keys = pandas.MultiIndex.from_frame(candidates[KEY_COLUMNS])
+        stored = keys.isin(self._stored_keys(files, candidates))
+        duplicate[candidates.index[stored]] = True
+        return duplicate
+
+    def write_frame(self, data):
+        """Write a DataFrame with the READING_COLUMNS, one part file per month;
+        ltr_DISPOSITIVO and ltr_DATA_RECEBIDA are optional.
+
+        Readings with a device and a producer ltr_DATA (ltr_DATA_RECEBIDA
+        missing or 0) are skipped when that device already has a reading at
+        that ltr_DATA, as SQLite's unique index does. The check runs under
+        the manifest lock every writer takes, so concurrent writers cannot
+        both add a reading. Returns the positions of the rows written.
+        """
+        data = data.reindex(columns=READING_COLUMNS).reset_index(drop=True)
+        data["ltr_DATA"] = data["ltr_DATA"].astype("datetime64[ns]")
+        # IDs come from the manifest, so processes sharing a store never
+        # reuse one
+        with self._update_manifest() as manifest:
+            data = data[~self._redeliveries(manifest, data)]
+            if data.empty:
+                return []
+            months = data["ltr_DATA"].dt.strftime("%Y-%m")
+            next_id = manifest["next_id"]
+            data.insert(0, "ID_LEITURA", range(next_id, next_id + len(data)))
+            manifest["next_id"] = next_id + len(data)
+            for month, partition in data.groupby(months, sort=False):
+                table = pyarrow.Table.from_pandas(
+                    partition, schema=SCHEMA, preserve_index=False, safe=False
+                )
+                manifest["files"].append(self._write_file(f"month={month}", table))
+        return data.index.tolist()
+
+    def _write_file(self, partition, table):
+        """Write `table` to a new part file of `partition`; returns its path
+        relative to the root."""
+        os.makedirs(self._path(partition), exist_ok=True)
+        name = os.path.join(partition, f"part-{uuid.uuid4().hex}.parquet")
+        pyarrow.parquet.write_table(table, self._path(name) + ".tmp")
+        os.replace(self._path(name) + ".tmp", self._path(name))
+        first, last = pyarrow.compute.min_max(table["ltr_DATA"]).values()
+        if first.is_valid:
+            self._time_ranges[name] = (
+                pandas.Timestamp(first.as_py()),
+                pandas.Timestamp(last.as_py()),
+            )
+        return name
+
+    def flush(self):
+        with self._buffer_lock:
+            rows, self._buffer = self._buffer, []
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+        try:
+            self.save_sensor_data_many(rows)
+        except Exception:
+            # Kept for the next flush instead of lost
+            with self._buffer_lock:
+                self._buffer[:0] = rows
+            raise
+
+    def _timed_flush(self):
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"Error flushing readings to {self.root}: {e}")
+
+    def fetch_sensor_data(self, columns=None, start=None, end=None, after_id=None):
+        """Return readings newest first, shaped like `database.fetch_sensor_data`.
+
+        Only month partitions overlapping [start, end) are opened and only
+        `columns` (plus ltr_DATA) are read from them. `after_id` keeps the
+        readings with a greater ID_LEITURA, like the CSV export reads them.
+        """
+        start = pandas.Timestamp(start) if start is not None else None
+        end = pandas.Timestamp(end) if end is not None else None
+        columns = list(columns or SCHEMA.names)
+        if "ltr_DATA" not in columns:
+            columns.append("ltr_DATA")
+
+        # Files of this manifest stay on disk for RETAIN_SECONDS even if
+        # compaction replaces them meanwhile
+        manifest = self._read_manifest() or {"files": []}
+        files = [
+            self._path(name)
+            for name in manifest["files"]
+            if self._month_overlaps(name, start, end)
+        ]
+        if not files:
+            table = SCHEMA.empty_table().select(columns)
+        else:
+            dataset = pyarrow.dataset.dataset(files, schema=SCHEMA, format="parquet")
+            condition = None
+            if start is not None:
+                condition = pyarrow.compute.field("ltr_DATA") >= start
+            if end is not None:
+                before_end = pyarrow.compute.field("ltr_DATA") < end
+                condition = before_end if condition is None else condition & before_end
+            if after_id is not None:
+                newer = pyarrow.compute.field("ID_LEITURA") > after_id
+                condition = newer if condition is None else condition & newer
+            table = dataset.to_table(columns=columns, filter=condition)
+
+        data = table.to_pandas()
+        for column in (
+            "ltr_NUTRIENTE_P",
+            "ltr_NUTRIENTE_K",
+            "ltr_STATUS_IRRIGACAO",
+            "ltr_DATA_RECEBIDA",
+        ):
+            if column in data:
+                data[column] = data[column].fillna(0).astype("int64")
+        data["ltr_DATA"] = data["ltr_DATA"].astype("datetime64[ns]")
+        data = data.sort_values("ltr_DATA", ascending=False, ignore_index=True)
+        data["month"] = data["ltr_DATA"].dt.to_period("M")
+        return data
+
+    @staticmethod
+    def _month_overlaps(path, start, end):
+        month = pandas.Period(
+            os.path.basename(os.path.dirname(path)).split("=", 1)[1], freq="M"
+        )
+        if start is not None and month.end_time < start:
+            return False
+        if end is not None and month.start_time >= end:
+            return False
+        return True
+
+    def compact(self, small_file_bytes=SMALL_FILE_BYTES):
+        """Merge the small part files of each partition into one file.
+
+        Returns the number of files merged; 0 when another process holds
+        COMPACTION_LOCK. The merged file is written first and the manifest
+        swap that replaces its inputs is the commit point, so a crash leaves
+        either the inputs or the merged file listed, never both.
+        """
+        with _file_lock(self._path(COMPACTION_LOCK), blocking=False) as owner:
+            if not owner:
+                return 0
+            merged = 0
+            small = {}
+            for name in (self._read_manifest() or {"files": []})["files"]:
+                if os.path.getsize(self._path(name)) < small_file_bytes:
+                    small.setdefault(os.path.dirname(name), []).append(name)
+            for partition, names in sorted(small.items()):
+                if len(names) < 2:
+                    continue
+                table = pyarrow.concat_tables(
+                    [
+                        pyarrow.parquet.read_table(self._path(name), schema=SCHEMA)
+                        for name in names
+                    ]
+                ).sort_by([("ltr_DATA", "ascending"), ("ID_LEITURA", "ascending")])
+                table = _drop_redeliveries(table)
+                merged_name = self._write_file(partition, table)
+                with self._update_manifest() as manifest:
+                    replaced = set(names)
+                    manifest["files"] = [
+                        name for name in manifest["files"] if name not in replaced
+                    ] + [merged_name]
+                    manifest["replaced"].update(dict.fromkeys(names, time.time()))
+                merged += len(names)
+            self._remove_unused()
+        return merged
+
+    def _remove_unused(self):
+        """Delete replaced files older than RETAIN_SECONDS and files no
+        manifest lists (left by a crash before their manifest swap)."""
+        with self._update_manifest() as manifest:
+            listed = set(manifest["files"])
+            now = time.time()
+            for name, replaced_at in list(manifest["replaced"].items()):
+                if now - replaced_at < RETAIN_SECONDS:
+                    continue
+                try:
+                    os.remove(self._path(name))
+                except FileNotFoundError:
+                    pass
+                except OSError:
+                    continue  # Still open on Windows; retried next time
+                del manifest["replaced"][name]
+                self._time_ranges.pop(name, None)
+            # Part files are written while the manifest lock is held, so any
+            # unlisted file now is left over from a failed write
+            for path in glob.glob(os.path.join(self.root, "month=*", "part-*")):
+                name = os.path.relpath(path, self.root)
+                if name not in listed and name not in manifest["replaced"]:
+                    with contextlib.suppress(OSError):
+                        os.remove(path)
+
+    def start_compaction(self, interval=300):
+        """Run `compact()` every `interval` seconds on a daemon thread.
+
+        Only the ingest process calls this (utils/mqtt.py); with several
+        callers, `compact()` still runs in one process at a time.
+        """
+        if self._compactor is not None:
+            return
+
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self.compact()
+                except Exception as e:
+                    print(f"Error compacting {self.root}: {e}")
+
+        self._compactor = threading.Thread(target=run, daemon=True)
+        self._compactor.start()
+
+    def close(self):
+        self._stop.set()
+        self.flush()
+
+
+def get_store(root=COLUMNAR_PATH):
+    """The process-wide store of `root`. Compaction is not started here, so
+    the dashboard never compacts; see `start_compaction`."""
+    with _STORES_LOCK:
+        store = _STORES.get(root)
+        if store is None:
+            store = ColumnarStore(root)
+            _STORES[root] = store
+        return store
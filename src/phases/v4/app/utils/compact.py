@@ -0,0 +1,93 @@
+import numpy
+import pandas
+from utils import database
+from utils.database import connect_read
+
+DEFAULT_CHUNKSIZE = 100_000
+
+# Column dtypes of the compact frame. `month` is an integer YYYYMM key instead
+# of a Python-object Period.
+COMPACT_DTYPES = {
+    "ID_LEITURA": numpy.int64,
+    "ltr_UMIDADE": numpy.float32,
+    "ltr_TEMPERATURA": numpy.float32,
+    "ltr_PH": numpy.float32,
+    "ltr_NUTRIENTE_P": numpy.bool_,
+    "ltr_NUTRIENTE_K": numpy.bool_,
+    "ltr_STATUS_IRRIGACAO": numpy.bool_,
+    "ltr_DATA": "datetime64[ns]",
+    "month": numpy.int32,
+}
+
+
+def compact_chunk(chunk):
+    """Convert a raw tbl_LEITURA chunk to the compact dtypes, column by column."""
+    timestamps = pandas.to_datetime(chunk["ltr_DATA"], format="ISO8601")
+    columns = {}
+    for column, dtype in COMPACT_DTYPES.items():
+        if column == "ltr_DATA":
+            columns[column] = timestamps.to_numpy(dtype="datetime64[ns]")
+        elif column == "month":
+            columns[column] = (timestamps.dt.year * 100 + timestamps.dt.month).to_numpy(
+                dtype=dtype
+            )
+        else:
+            columns[column] = chunk[column].to_numpy(dtype=dtype)
+    return columns
+
+
+def fetch_sensor_data_compact(chunksize=DEFAULT_CHUNKSIZE, start=None, end=None):
+    """Load readings (newest first) with compact dtypes in bounded memory.
+
+    Rows are read `chunksize` at a time and copied into preallocated arrays,
+    so peak memory is the compact result plus one raw chunk, never the full
+    float64/object frame. `start`/`end` optionally bound ltr_DATA.
+    """
+    if database.SENSOR_STORAGE == "columnar":
+        # The store already reads only the needed partitions and columns
+        data = database.get_columnar_store().fetch_sensor_data(start=start, end=end)
+        return pandas.DataFrame(compact_chunk(data), copy=False)
+
+    conditions, params = [], []
+    if start is not None:
+        conditions.append("ltr_DATA >= ?")
+        params.append(str(start))
+    if end is not None:
+        conditions.append("ltr_DATA < ?")
+        params.append(str(end))
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    with connect_read() as connection:
+        # One read transaction so the row count matches the rows read
+        connection.execute("BEGIN")
+        try:
+            total = connection.execute(
+                f"SELECT COUNT(*) FROM tbl_LEITURA{where}", params
+            ).fetchone()[0]
+            arrays = {
+                column: numpy.empty(total, dtype=dtype)
+                for column, dtype in COMPACT_DTYPES.items()
+            }
+
+            position = 0
+            for chunk in pandas.read_sql_query(
+                f"SELECT * FROM tbl_LEITURA{where} ORDER BY ltr_DATA DESC",
+                connection,
+                params=params,
+                chunksize=chunksize,
+            ):
+                size = len(chunk)
+                for column, values in compact_chunk(chunk).items():
+                    arrays[column][position : position + size] = values
+                position += size
+        finally:
+            connection.rollback()
+
+    return pandas.DataFrame(arrays, copy=False)
+
+
+def bytes_per_row(data):
+    """Memory used by a frame, including its index, divided by its row count."""
+    if len(data) == 0:
+        return 0.0
+    return data.memory_usage(deep=True, index=True).sum() / len(data)
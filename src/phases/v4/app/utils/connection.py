@@ -0,0 +1,110 @@
+import atexit
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+POOL_SIZE = 4
+BUSY_TIMEOUT_MS = 5000
+
+# Applied to every pooled connection. WAL lets the dashboard read while the
+# MQTT client writes; NORMAL sync is durable across app crashes in WAL mode.
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -64000,  # negative = KiB, ~64 MB
+    "mmap_size": 268435456,  # 256 MB
+    "temp_store": "MEMORY",
+    "busy_timeout": BUSY_TIMEOUT_MS,
+}
+
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+
+
+class ConnectionPool:
+    """Keeps long-lived SQLite connections to a single database file.
+
+    Connections are created lazily up to `size` and handed out one thread at
+    a time, so they can be shared by Streamlit reruns and MQTT callbacks.
+    """
+
+    def __init__(self, db_path, size=POOL_SIZE, pragmas=None):
+        self.db_path = db_path
+        self.size = size
+        self.pragmas = PRAGMAS if pragmas is None else pragmas
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _open(self):
+        connection = sqlite3.connect(
+            self.db_path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False
+        )
+        for name, value in self.pragmas.items():
+            connection.execute(f"PRAGMA {name}={value}")
+        return connection
+
+    def acquire(self):
+        if self._closed:
+            raise RuntimeError(f"Connection pool for {self.db_path} is closed")
+
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return self._open()
+                except Exception:
+                    self._created -= 1
+                    raise
+
+        return self._idle.get()
+
+    def release(self, connection):
+        if self._closed:
+            connection.close()
+            return
+        if connection.in_transaction:
+            connection.rollback()
+        self._idle.put(connection)
+
+    @contextmanager
+    def connection(self):
+        connection = self.acquire()
+        try:
+            yield connection
+        finally:
+            self.release(connection)
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+def get_pool(db_path, size=POOL_SIZE):
+    with _POOLS_LOCK:
+        pool = _POOLS.get(db_path)
+        if pool is None or pool._closed:
+            pool = ConnectionPool(db_path, size)
+            _POOLS[db_path] = pool
+        return pool
+
+
+def close_all_pools():
+    with _POOLS_LOCK:
+        for pool in _POOLS.values():
+            pool.close()
+        _POOLS.clear()
+
+
+atexit.register(close_all_pools)
@@ -1,11 +1,40 @@
 import sqlite3
+import threading
+import numpy
 import pandas
 import os
+from datetime import datetime
+from dotenv import load_dotenv
+from utils.connection import get_pool
+from utils.migrations import migrate
+from utils.snapshot import get_snapshot
+
+load_dotenv()
 
 DB_PATH = "./database/data.db"
-CSV_PATH = "./database/tbl_LEITURA.csv"
+CSV_PATH = "./database/tbl_LEITURA.csv"  # kept up to date by utils/export.py
 INIT_SQL_PATH = "./database/init.sql"
+MIGRATIONS_PATH = "./database/migrations"
 DB_INITIALIZED = False
+_INIT_LOCK = threading.Lock()
+
+# "sqlite" (default) or "columnar" for month-partitioned Parquet files, see
+# utils/columnar.py. Both are used through the functions below.
+SENSOR_STORAGE = os.getenv("SENSOR_STORAGE", "sqlite")
+
+# Where dashboard and ML reads go, see utils/snapshot.py: "wal" (default) uses
+# a separate read-only pool on the live database, "backup" a copy refreshed
+# every READ_SNAPSHOT_INTERVAL seconds with the sqlite3 backup API.
+READ_SNAPSHOT = os.getenv("READ_SNAPSHOT", "wal")
+READ_SNAPSHOT_INTERVAL = float(os.getenv("READ_SNAPSHOT_INTERVAL", "30"))
+SNAPSHOT_PATH = "./database/snapshot.db"
+
+# Parsed readings kept between incremental fetches, keyed by the highest
+# ID_LEITURA already loaded
+SENSOR_CACHE = {"watermark": 0, "history": None, "data": None}
+SENSOR_CACHE_LOCK = threading.Lock()
+# Rows preallocated for the incremental history; grown by half when full
+HISTORY_CAPACITY = 4096
 
 
 def initialize_database():
@@ -19,40 +48,280 @@ def initialize_database():
         connection.commit()
         connection.close()
 
+    # Bring new and existing databases up to the latest schema version
+    connection = sqlite3.connect(DB_PATH)
+    try:
+        migrate(connection, MIGRATIONS_PATH)
+    finally:
+        connection.close()
 
-def connect():
+
+def _ensure_initialized():
     global DB_INITIALIZED
     if not DB_INITIALIZED:
-        initialize_database()
-        DB_INITIALIZED = True
+        with _INIT_LOCK:
+            if not DB_INITIALIZED:
+                initialize_database()
+                DB_INITIALIZED = True
+
+
+def connect():
+    """Borrow a pooled connection: `with connect() as connection: ...`."""
+    _ensure_initialized()
+    return get_pool(DB_PATH).connection()
+
+
+def connect_read():
+    """Borrow a read-only connection for dashboard and ML queries.
+
+    These never take connections from the write pool, and in "backup" mode
+    they read a periodic copy of the database, up to READ_SNAPSHOT_INTERVAL
+    seconds old, instead of the live file.
+    """
+    _ensure_initialized()
+    return get_snapshot(
+        DB_PATH, READ_SNAPSHOT, SNAPSHOT_PATH, READ_SNAPSHOT_INTERVAL
+    ).connection()
+
 
-    return sqlite3.connect(DB_PATH)
+def get_columnar_store():
+    # Imported lazily so the SQLite backend does not need pyarrow
+    from utils.columnar import get_store
+
+    return get_store()
+
+
+def _record_latest(rows):
+    # Feeds the in-memory latest-reading buffer, see utils/latest.py
+    from utils.latest import record_flat_readings
+
+    record_flat_readings(rows)
 
 
 def save_sensor_data(humidity, temperature, ph, sensor_p, sensor_k, irrigation_status):
-    connection = connect()
-    cursor = connection.cursor()
-    cursor.execute(
-        """
-        INSERT INTO tbl_LEITURA (ltr_UMIDADE, ltr_TEMPERATURA, ltr_PH, ltr_NUTRIENTE_P, ltr_NUTRIENTE_K, ltr_STATUS_IRRIGACAO)
-        VALUES (?, ?, ?, ?, ?, ?)
-        """,
-        (humidity, temperature, ph, sensor_p, sensor_k, irrigation_status),
-    )
-    connection.commit()
-    connection.close()
+    if SENSOR_STORAGE == "columnar":
+        get_columnar_store().save_sensor_data(
+            humidity, temperature, ph, sensor_p, sensor_k, irrigation_status
+        )
+        return
+
+    # Timestamped here rather than by the column default so the latest-reading
+    # buffer gets the same value as the database
+    timestamp = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+    row = (humidity, temperature, ph, sensor_p, sensor_k, irrigation_status, timestamp)
+    with connect() as connection:
+        connection.execute(
+            """
+            INSERT INTO tbl_LEITURA (ltr_UMIDADE, ltr_TEMPERATURA, ltr_PH, ltr_NUTRIENTE_P, ltr_NUTRIENTE_K, ltr_STATUS_IRRIGACAO, ltr_DATA)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            row,
+        )
+        connection.commit()
+    _record_latest([row])
 
 
-def fetch_sensor_data():
-    connection = connect()
-    query = "SELECT * FROM tbl_LEITURA ORDER BY ltr_DATA DESC"
-    data = pandas.read_sql_query(query, connection)
+INSERT_READING = """
+    INSERT INTO tbl_LEITURA (ltr_UMIDADE, ltr_TEMPERATURA, ltr_PH, ltr_NUTRIENTE_P, ltr_NUTRIENTE_K, ltr_STATUS_IRRIGACAO, ltr_DATA, ltr_DISPOSITIVO, ltr_DATA_RECEBIDA)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT DO NOTHING
+"""
 
-    # Export the data to a CSV file
-    data.to_csv(CSV_PATH, index=False)
 
+def save_sensor_data_many(rows):
+    """Insert `(humidity, temperature, ph, sensor_p, sensor_k, irrigation_status,
+    ltr_DATA[, device[, received]])` tuples in a single transaction.
+
+    A reading whose device already has a row at the same ltr_DATA is skipped
+    (unique index of migrations 0005/0006, or the same check in the columnar
+    store), so redelivered messages are
+    harmless. Readings without a device, or with `received` = 1 because
+    ltr_DATA is their arrival time rather than the producer's, are always
+    inserted. Returns the number of rows inserted.
+    """
+    rows = [(*row, *(None, 0)[len(row) - 7 :]) for row in rows]
+    if SENSOR_STORAGE == "columnar":
+        rows = get_columnar_store().save_sensor_data_many(rows)
+        _record_latest(rows)
+        return len(rows)
+
+    with connect() as connection:
+        # rowcount, unlike total_changes, leaves out the rows triggers write
+        inserted = connection.executemany(INSERT_READING, rows).rowcount
+        if inserted < len(rows):
+            # Some were duplicates: redo the batch a row at a time to learn
+            # which ones, so only stored readings reach the latest buffer
+            connection.rollback()
+            rows = [
+                row for row in rows if connection.execute(INSERT_READING, row).rowcount
+            ]
+        connection.commit()
+    _record_latest(rows)
+    return len(rows)
+
+
+def _parse_sensor_data(data):
     data["ltr_DATA"] = pandas.to_datetime(data["ltr_DATA"])
     data["month"] = data["ltr_DATA"].dt.to_period("M")  # Adiciona uma coluna de mês
-    connection.close()
-
     return data
+
+
+def fetch_sensor_data(incremental=False):
+    """Return every reading, newest first, with parsed dates and a `month` column.
+
+    The frame is cached until tbl_LEITURA changes (utils/query_cache.py).
+    With `incremental=True` it is instead kept between calls and only rows
+    above the last loaded `ID_LEITURA` are read and parsed. Either way the
+    frame is shared, so callers must not modify it in place.
+    """
+    if SENSOR_STORAGE == "columnar":
+        return get_columnar_store().fetch_sensor_data()
+
+    if incremental:
+        return _fetch_sensor_data_incremental()
+
+    # Imported lazily: utils.query_cache imports this module
+    from utils.query_cache import cached_read
+
+    return cached_read(
+        "SELECT * FROM tbl_LEITURA ORDER BY ltr_DATA DESC",
+        load=lambda connection, query, params: _parse_sensor_data(
+            pandas.read_sql_query(query, connection)
+        ),
+    )
+
+
+def _history_capacity(size):
+    return max(HISTORY_CAPACITY, size + size // 2)
+
+
+class _SensorHistory:
+    """Parsed tbl_LEITURA rows in preallocated column arrays, oldest first.
+
+    New rows are copied in at the end, the capacity growing by half when
+    full, so an append costs O(new rows) amortized. Rows older than the newest stored one are
+    merged by sorting only the stored rows from their position on, written
+    to fresh arrays. Frames returned by `frame()` are views that later
+    appends never modify.
+    """
+
+    def __init__(self, data):
+        self.names = list(data.columns)
+        self.size = 0
+        self.arrays = None
+        self.append(data)
+
+    def _columns(self, data):
+        timestamps = data["ltr_DATA"].to_numpy("datetime64[ns]")
+        columns = {name: data[name].to_numpy() for name in self.names}
+        columns["ltr_DATA"] = timestamps
+        # Period ordinals of monthly periods are months since 1970-01
+        columns["month"] = timestamps.astype("datetime64[M]").astype(numpy.int64)
+        return columns
+
+    def _reserve(self, size, copy_rows):
+        """Make room for `size` rows, in fresh arrays when `copy_rows` < size."""
+        capacity = len(self.arrays["ltr_DATA"])
+        if size <= capacity and copy_rows == self.size:
+            return
+        if capacity < size:
+            capacity = _history_capacity(size)
+        for name, values in self.arrays.items():
+            grown = numpy.empty(capacity, dtype=values.dtype)
+            grown[:copy_rows] = values[:copy_rows]
+            self.arrays[name] = grown
+
+    def append(self, data):
+        if data.empty:
+            return
+        data = data.sort_values("ltr_DATA", kind="stable")
+        columns = self._columns(data)
+        if not self.size:
+            # Column types come from the first rows read
+            self.arrays = {
+                name: numpy.empty(_history_capacity(len(data)), values.dtype)
+                for name, values in columns.items()
+            }
+        for name, values in columns.items():
+            # e.g. NULLs turning an integer column into floats
+            dtype = numpy.result_type(self.arrays[name].dtype, values.dtype)
+            if dtype != self.arrays[name].dtype:
+                self.arrays[name] = self.arrays[name].astype(dtype)
+
+        # Late or backfilled rows go before the stored rows newer than them
+        position = int(
+            numpy.searchsorted(
+                self.arrays["ltr_DATA"][: self.size],
+                columns["ltr_DATA"][0],
+                side="right",
+            )
+        )
+        size = self.size + len(data)
+        previous = dict(self.arrays)
+        self._reserve(size, position)
+        if position < self.size:
+            tail = {
+                name: values[position : self.size] for name, values in previous.items()
+            }
+            order = numpy.argsort(
+                numpy.concatenate([tail["ltr_DATA"], columns["ltr_DATA"]]),
+                kind="stable",
+            )
+            for name, values in columns.items():
+                merged = numpy.concatenate([tail[name], values])
+                self.arrays[name][position:size] = merged[order]
+        else:
+            for name, values in columns.items():
+                self.arrays[name][self.size : size] = values
+        self.size = size
+
+    def frame(self):
+        """The rows newest first, like `fetch_sensor_data`, without copying."""
+        if not self.size:
+            return _parse_sensor_data(pandas.DataFrame(columns=self.names))
+        columns = {name: self.arrays[name][: self.size][::-1] for name in self.names}
+        columns["month"] = pandas.arrays.PeriodArray(
+            self.arrays["month"][: self.size][::-1], dtype="period[M]"
+        )
+        return pandas.DataFrame(columns, copy=False)
+
+
+def _fetch_sensor_data_incremental():
+    with SENSOR_CACHE_LOCK:
+        history = SENSOR_CACHE["history"]
+        watermark = SENSOR_CACHE["watermark"]
+
+        with connect_read() as connection:
+            max_id = (
+                connection.execute(
+                    "SELECT MAX(ID_LEITURA) FROM tbl_LEITURA"
+                ).fetchone()[0]
+                or 0
+            )
+
+            # The table was recreated or truncated: start over
+            if max_id < watermark:
+                history, watermark = None, 0
+
+            if history is not None and max_id == watermark:
+                return SENSOR_CACHE["data"]
+
+            new_rows = pandas.read_sql_query(
+                "SELECT * FROM tbl_LEITURA WHERE ID_LEITURA > ?",
+                connection,
+                params=(watermark,),
+            )
+
+        new_rows["ltr_DATA"] = pandas.to_datetime(new_rows["ltr_DATA"])
+        if history is None:
+            history = _SensorHistory(new_rows)
+        elif not new_rows.empty:
+            history.append(new_rows)
+
+        if not new_rows.empty:
+            watermark = max(watermark, int(new_rows["ID_LEITURA"].max()))
+        SENSOR_CACHE["history"] = history
+        SENSOR_CACHE["watermark"] = watermark
+        SENSOR_CACHE["data"] = history.frame()
+
+        return SENSOR_CACHE["data"]
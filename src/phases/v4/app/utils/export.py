@@ -0,0 +1,205 @@
+import argparse
+import io
+import json
+import os
+import sys
+import threading
+import pandas
+
+if __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import database
+from utils.query import SCHEMAS
+
+# The manifest records how much of the export is complete. Readers only look
+# at the first `bytes` bytes, so a half-written append is never visible.
+MANIFEST_SUFFIX = ".manifest.json"
+SNAPSHOT_FORMATS = ("feather", "parquet")
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+# Columns of the export; newer tbl_LEITURA columns such as ltr_DISPOSITIVO
+# are left out so appends keep matching the header of existing files
+EXPORT_COLUMNS = ", ".join(SCHEMAS["v4"]["columns"])
+_EXPORT_LOCK = threading.Lock()
+
+
+def _manifest_path(csv_path):
+    return csv_path + MANIFEST_SUFFIX
+
+
+def read_manifest(csv_path=None):
+    csv_path = csv_path or database.CSV_PATH
+    try:
+        with open(_manifest_path(csv_path), "r") as manifest_file:
+            return json.load(manifest_file)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _write_atomically(path, write):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as tmp_file:
+        write(tmp_file)
+        tmp_file.flush()
+        os.fsync(tmp_file.fileno())
+    os.replace(tmp_path, path)
+
+
+def _write_manifest(csv_path, manifest):
+    _write_atomically(
+        _manifest_path(csv_path),
+        lambda f: f.write(json.dumps(manifest).encode("utf-8")),
+    )
+
+
+def _fetch_columnar(after_id=None):
+    columns = SCHEMAS["v4"]["columns"]
+    data = database.get_columnar_store().fetch_sensor_data(columns, after_id=after_id)
+    return data.loc[:, columns].sort_values("ID_LEITURA", ignore_index=True)
+
+
+def _fetch_rows_after(watermark):
+    if database.SENSOR_STORAGE == "columnar":
+        return _fetch_columnar(watermark)
+    with database.connect_read() as connection:
+        return pandas.read_sql_query(
+            f"SELECT {EXPORT_COLUMNS} FROM tbl_LEITURA WHERE ID_LEITURA > ? ORDER BY ID_LEITURA",
+            connection,
+            params=(watermark,),
+        )
+
+
+def _write_snapshot(csv_path, snapshot_format, watermark):
+    snapshot_path = os.path.splitext(csv_path)[0] + "." + snapshot_format
+    if database.SENSOR_STORAGE == "columnar":
+        data = _fetch_columnar()
+        data = data[data["ID_LEITURA"] <= watermark].reset_index(drop=True)
+    else:
+        with database.connect_read() as connection:
+            data = pandas.read_sql_query(
+                f"SELECT {EXPORT_COLUMNS} FROM tbl_LEITURA WHERE ID_LEITURA <= ? ORDER BY ID_LEITURA",
+                connection,
+                params=(watermark,),
+            )
+        data["ltr_DATA"] = pandas.to_datetime(data["ltr_DATA"])
+
+    if snapshot_format == "feather":
+        _write_atomically(snapshot_path, lambda f: data.to_feather(f))
+    else:
+        _write_atomically(snapshot_path, lambda f: data.to_parquet(f, index=False))
+    return snapshot_path
+
+
+def export_sensor_data(csv_path=None, snapshot_format=None):
+    """Bring the CSV export of tbl_LEITURA up to date and return its manifest.
+
+    Only rows above the exported high-water mark are read and appended, so the
+    cost depends on how much changed since the last export. The file is
+    rewritten from scratch only when it is missing or was modified externally.
+    With `snapshot_format` a full columnar copy is also written whenever the
+    high-water mark moves.
+    """
+    csv_path = csv_path or database.CSV_PATH
+    if snapshot_format is not None and snapshot_format not in SNAPSHOT_FORMATS:
+        raise ValueError(
+            f"Unknown snapshot format '{snapshot_format}', expected one of {SNAPSHOT_FORMATS}"
+        )
+
+    with _EXPORT_LOCK:
+        manifest = read_manifest(csv_path)
+        size = os.path.getsize(csv_path) if os.path.exists(csv_path) else None
+
+        if manifest is None or size is None or size < manifest["bytes"]:
+            manifest = {"watermark": 0, "rows": 0, "bytes": 0}
+        elif size > manifest["bytes"]:
+            # An append was interrupted before the manifest was updated
+            with open(csv_path, "r+b") as csv_file:
+                csv_file.truncate(manifest["bytes"])
+
+        new_rows = _fetch_rows_after(manifest["watermark"])
+        changed = False
+
+        if manifest["rows"] == 0 and (not new_rows.empty or size is None):
+            _write_atomically(
+                csv_path,
+                lambda f: new_rows.to_csv(f, index=False, date_format=DATE_FORMAT),
+            )
+            changed = True
+        elif not new_rows.empty:
+            with open(csv_path, "ab") as csv_file:
+                new_rows.to_csv(
+                    csv_file, index=False, header=False, date_format=DATE_FORMAT
+                )
+                csv_file.flush()
+                os.fsync(csv_file.fileno())
+            changed = True
+
+        if changed:
+            manifest = {
+                "watermark": (
+                    int(new_rows["ID_LEITURA"].max())
+                    if not new_rows.empty
+                    else manifest["watermark"]
+                ),
+                "rows": manifest["rows"] + len(new_rows),
+                "bytes": os.path.getsize(csv_path),
+                "snapshot_watermark": manifest.get("snapshot_watermark"),
+            }
+
+        if (
+            snapshot_format is not None
+            and manifest["watermark"] > 0
+            and manifest.get("snapshot_watermark") != manifest["watermark"]
+        ):
+            _write_snapshot(csv_path, snapshot_format, manifest["watermark"])
+            manifest["snapshot_watermark"] = manifest["watermark"]
+            changed = True
+
+        if changed:
+            _write_manifest(csv_path, manifest)
+
+        return manifest
+
+
+def read_sensor_export(csv_path=None, include_new=False):
+    """Read the exported CSV up to the last complete export.
+
+    With `include_new` the rows written since then, by writers that do not
+    refresh the export such as the importer, are read from the database and
+    appended, so the result is current without writing to the export.
+    """
+    csv_path = csv_path or database.CSV_PATH
+    manifest = read_manifest(csv_path)
+    if manifest is None:
+        return pandas.read_csv(csv_path)
+
+    with open(csv_path, "rb") as csv_file:
+        content = csv_file.read(manifest["bytes"])
+    data = pandas.read_csv(io.BytesIO(content))
+    if not include_new:
+        return data
+
+    new_rows = _fetch_rows_after(manifest["watermark"])
+    if new_rows.empty:
+        return data
+    if pandas.api.types.is_datetime64_dtype(new_rows["ltr_DATA"]):
+        new_rows["ltr_DATA"] = new_rows["ltr_DATA"].dt.strftime(DATE_FORMAT)
+    return pandas.concat([data, new_rows], ignore_index=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Export new tbl_LEITURA rows to the CSV used by the analyses."
+    )
+    parser.add_argument(
+        "--csv", default=None, help="CSV path (default: database.CSV_PATH)"
+    )
+    parser.add_argument("--snapshot", choices=SNAPSHOT_FORMATS, default=None)
+    args = parser.parse_args()
+
+    manifest = export_sensor_data(args.csv, args.snapshot)
+    print(f"Exported {manifest['rows']} rows (high-water mark {manifest['watermark']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+import argparse
+import os
+import sys
+import time
+import numpy
+import pandas
+
+if __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Value ranges of the readings produced by mqtt.generate_fake_data
+HUMIDITY_RANGE = (28.9, 55.2)
+TEMPERATURE_RANGE = (7.0, 38.3)
+PH_RANGE = (6.3, 7.3)
+
+# Timestamps are UTC; the farm is at UTC-3, which places the daily peaks
+UTC_OFFSET_HOURS = -3
+TEMPERATURE_PEAK_HOUR = 15
+
+# Soil dries from the top of a cycle until it falls below the irrigation
+# threshold (umidadeMin = 40 on the ESP32), then irrigation brings it back up
+IRRIGATION_THRESHOLD = 40.0
+DRY_HOURS = (18, 60)
+IRRIGATION_MINUTES = (10, 40)
+# Standard deviation of the pH random walk per hour
+PH_DRIFT_PER_HOUR = 0.02
+# Mean time the P and K sensors stay in the same state
+NUTRIENT_DWELL_HOURS = 6
+
+CHUNK_ROWS = 1_000_000
+FORMATS = {".csv": "csv", ".parquet": "parquet"}
+
+
+def _irrigation_cycles(rng, devices, total_seconds):
+    """Random drying/irrigation cycles covering `total_seconds` for every device.
+
+    Returns the span between devices, each device's offset into its first
+    cycle and per-cycle arrays flattened over devices: start (shifted by
+    `device * span` so the starts of all devices form one sorted array), dry
+    and irrigation durations in seconds, and the humidity at the top and
+    bottom of the cycle.
+    """
+    shortest = DRY_HOURS[0] * 3600 + IRRIGATION_MINUTES[0] * 60
+    longest = DRY_HOURS[1] * 3600 + IRRIGATION_MINUTES[1] * 60
+    cycles = int((total_seconds + longest) // shortest) + 2
+    dry = rng.uniform(DRY_HOURS[0], DRY_HOURS[1], (devices, cycles)) * 3600
+    wet = rng.uniform(IRRIGATION_MINUTES[0], IRRIGATION_MINUTES[1], (devices, cycles))
+    wet *= 60
+    starts = numpy.cumsum(dry + wet, axis=1) - (dry + wet)
+    # Start every device at a random point of its first cycle
+    phase = rng.uniform(0, 1, devices) * (dry[:, 0] + wet[:, 0])
+    span = numpy.ceil(starts[:, -1].max()) + 1
+    starts += numpy.arange(devices)[:, None] * span
+    top = rng.uniform(50.0, 54.0, (devices, cycles))
+    bottom = rng.uniform(
+        IRRIGATION_THRESHOLD - 3, IRRIGATION_THRESHOLD, (devices, cycles)
+    )
+    return (
+        span,
+        phase,
+        starts.ravel(),
+        dry.ravel(),
+        wet.ravel(),
+        top.ravel(),
+        bottom.ravel(),
+    )
+
+
+def generate_frames(
+    devices=1,
+    start=None,
+    periods=8640,
+    interval=10,
+    seed=None,
+    chunk_rows=CHUNK_ROWS,
+):
+    """Yield DataFrames of synthetic readings in the tbl_LEITURA column layout.
+
+    Every device reports every `interval` seconds for `periods` readings from
+    `start` (default: `periods` readings ago); rows are ordered by time, then
+    `device`. The values follow the ranges of `mqtt.generate_fake_data` but
+    behave like a field: temperature has a daily cycle with a per-day offset,
+    humidity dries down, dips in the afternoon and rises while irrigation
+    (`ltr_STATUS_IRRIGACAO` = 1) is on, pH drifts slowly within its range and
+    P/K switch a few times a day. The same `seed` gives the same data.
+    """
+    rng = numpy.random.default_rng(seed)
+    if start is None:
+        now = numpy.datetime64("now", "s")
+        start = now - numpy.timedelta64(periods * interval, "s")
+    start = numpy.datetime64(pandas.Timestamp(start).to_datetime64(), "s")
+    total_seconds = periods * interval
+    device_ids = numpy.arange(devices)
+
+    # Per-device parameters and the state carried between chunks
+    temperature_mean = rng.uniform(20.0, 25.0, devices)
+    temperature_amplitude = rng.uniform(5.0, 9.0, devices)
+    daily_offsets = rng.normal(0.0, 1.5, (devices, total_seconds // 86400 + 2))
+    first_day = start.astype("datetime64[D]")
+    span, phase, cycle_starts, dry, wet, top, bottom = _irrigation_cycles(
+        rng, devices, total_seconds
+    )
+    ph = rng.uniform(6.5, 7.1, devices)
+    ph_sigma = PH_DRIFT_PER_HOUR * numpy.sqrt(interval / 3600)
+    nutrients = rng.integers(0, 2, (2, devices))
+    switch_probability = min(1.0, interval / (NUTRIENT_DWELL_HOURS * 3600))
+
+    steps_per_chunk = max(1, chunk_rows // devices)
+    for first_step in range(0, periods, steps_per_chunk):
+        steps = min(steps_per_chunk, periods - first_step)
+        shape = (steps, devices)
+        seconds = (numpy.arange(first_step, first_step + steps) * interval)[:, None]
+        timestamps = start + seconds.ravel().astype("timedelta64[s]")
+
+        # Daily cycle in local time: warmest at TEMPERATURE_PEAK_HOUR
+        local_seconds = seconds + (start - first_day).astype(int)
+        local_seconds = local_seconds + UTC_OFFSET_HOURS * 3600
+        hour = (local_seconds % 86400) / 3600
+        diurnal = numpy.cos(2 * numpy.pi * (hour - TEMPERATURE_PEAK_HOUR) / 24)
+        day = numpy.clip(local_seconds // 86400, 0, daily_offsets.shape[1] - 1)
+        temperature = (
+            temperature_mean
+            + temperature_amplitude * diurnal
+            + daily_offsets[device_ids, day]
+            + rng.normal(0.0, 0.3, shape)
+        )
+
+        # Position of every reading within its device's irrigation cycle
+        moments = seconds + phase + device_ids * span
+        cycle = numpy.searchsorted(cycle_starts, moments, side="right") - 1
+        elapsed = moments - cycle_starts[cycle]
+        irrigating = elapsed >= dry[cycle]
+        drying = numpy.clip(elapsed / dry[cycle], 0.0, 1.0)
+        wetting = numpy.clip((elapsed - dry[cycle]) / wet[cycle], 0.0, 1.0)
+        amount = top[cycle] - bottom[cycle]
+        humidity = numpy.where(
+            irrigating,
+            bottom[cycle] + amount * wetting,
+            top[cycle] - amount * drying,
+        )
+        humidity += -1.5 * diurnal + rng.normal(0.0, 0.3, shape)
+
+        # Random walk folded back into PH_RANGE (reflecting at the bounds)
+        walk = ph + numpy.cumsum(rng.normal(0.0, ph_sigma, shape), axis=0)
+        ph = walk[-1]
+        width = PH_RANGE[1] - PH_RANGE[0]
+        ph_values = PH_RANGE[1] - numpy.abs(
+            numpy.mod(walk - PH_RANGE[0], 2 * width) - width
+        )
+
+        switches = rng.random((2,) + shape) < switch_probability
+        flags = (nutrients[:, None, :] + numpy.cumsum(switches, axis=1)) % 2
+        nutrients = flags[:, -1, :]
+
+        yield pandas.DataFrame(
+            {
+                "device": numpy.tile(device_ids, steps),
+                "ltr_UMIDADE": numpy.clip(humidity, *HUMIDITY_RANGE).round(2).ravel(),
+                "ltr_TEMPERATURA": numpy.clip(temperature, *TEMPERATURE_RANGE)
+                .round(2)
+                .ravel(),
+                "ltr_PH": ph_values.round(2).ravel(),
+                "ltr_NUTRIENTE_P": flags[0].ravel(),
+                "ltr_NUTRIENTE_K": flags[1].ravel(),
+                "ltr_STATUS_IRRIGACAO": irrigating.astype(numpy.int64).ravel(),
+                "ltr_DATA": numpy.repeat(timestamps, devices),
+            }
+        )
+
+
+def generate_readings(devices=1, start=None, periods=8640, interval=10, seed=None):
+    """Return `generate_frames` as a single DataFrame."""
+    return pandas.concat(
+        generate_frames(devices, start, periods, interval, seed), ignore_index=True
+    )
+
+
+def write_csv(frames, path):
+    rows = 0
+    for frame in frames:
+        frame.to_csv(
+            path,
+            mode="a" if rows else "w",
+            header=not rows,
+            index=False,
+            date_format="%Y-%m-%d %H:%M:%S",
+        )
+        rows += len(frame)
+    return rows
+
+
+def write_parquet(frames, path):
+    import pyarrow
+    import pyarrow.parquet
+
+    rows, writer = 0, None
+    try:
+        for frame in frames:
+            table = pyarrow.Table.from_pandas(frame, preserve_index=False)
+            if writer is None:
+                writer = pyarrow.parquet.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+            rows += len(frame)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def write_database(frames, db_path=None):
+    """Load frames through the bulk importer (tbl_LEITURA or the columnar store).
+
+    The `device` number is stored as text in ltr_DISPOSITIVO.
+    """
+    from utils.importer import import_frames
+
+    rows, _ = import_frames(frames, "v4", db_path)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Generate synthetic sensor readings for load testing."
+    )
+    parser.add_argument("--devices", type=int, default=1)
+    parser.add_argument("--days", type=float, default=1)
+    parser.add_argument("--interval", type=int, default=10, help="seconds")
+    parser.add_argument("--start", help="first timestamp (default: --days ago)")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--output", help="CSV or Parquet file to write")
+    parser.add_argument(
+        "--db",
+        nargs="?",
+        const="",
+        help="load into the database (default: the v4 database)",
+    )
+    args = parser.parse_args()
+
+    periods = int(args.days * 86400 // args.interval)
+    frames = generate_frames(
+        args.devices, args.start, periods, args.interval, args.seed
+    )
+    started = time.perf_counter()
+    if args.output:
+        file_format = FORMATS.get(os.path.splitext(args.output)[1].lower())
+        if file_format is None:
+            raise ValueError(
+                f"Cannot tell the format of {args.output}, use .csv or .parquet"
+            )
+        write = write_csv if file_format == "csv" else write_parquet
+        rows = write(frames, args.output)
+        target = args.output
+    elif args.db is not None:
+        rows = write_database(frames, args.db or None)
+        target = args.db or "the v4 database"
+    else:
+        rows = sum(len(frame) for frame in frames)
+        target = "memory"
+    seconds = time.perf_counter() - started
+    print(f"{target}: {rows} rows in {seconds:.1f} s ({rows / seconds:,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
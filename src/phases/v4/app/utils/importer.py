@@ -0,0 +1,248 @@
+import argparse
+import os
+import sqlite3
+import sys
+import time
+import numpy
+import pandas
+
+if __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import database
+from utils.connection import PRAGMAS
+from utils.query import SCHEMAS
+from utils.rollups import rebuild_rollups
+
+CHUNK_ROWS = 100_000
+# Rows per transaction; bounds the WAL size during very large loads
+COMMIT_ROWS = 1_000_000
+# Change-counter table, name and counter columns of each schema
+VERSION_TABLES = {
+    "v4": ("tbl_VERSAO", "ver_TABELA", "ver_CONTADOR"),
+    "v3": ("data_version", "table_name", "counter"),
+}
+FORMATS = {".csv": "csv", ".jsonl": "jsonl", ".json": "jsonl", ".ndjson": "jsonl"}
+# Device ID column of tbl_LEITURA and the names sources use for it
+# (utils/generator.py writes `device`)
+DEVICE_COLUMN = "ltr_DISPOSITIVO"
+DEVICE_SOURCES = ("ltr_DISPOSITIVO", "device")
+
+
+def read_source(path, file_format=None, chunk_rows=CHUNK_ROWS):
+    """Stream a CSV or JSON-lines file as DataFrames of `chunk_rows` rows."""
+    file_format = file_format or FORMATS.get(os.path.splitext(path)[1].lower())
+    if file_format == "csv":
+        return pandas.read_csv(path, chunksize=chunk_rows)
+    if file_format == "jsonl":
+        return pandas.read_json(path, lines=True, chunksize=chunk_rows)
+    raise ValueError(f"Cannot tell the format of {path}, use --format csv|jsonl")
+
+
+def normalize_frame(frame, schema="v4"):
+    """Map a frame using v3 or v4 column names onto the target schema's columns.
+
+    Both schemas list their columns in the same order (id, humidity,
+    temperature, pH, P, K, irrigation, time), which gives the mapping. The id
+    column is dropped so the target assigns its own. Timestamps are written
+    in SQLite's `YYYY-MM-DD HH:MM:SS` text format. For v4, a device column
+    (DEVICE_SOURCES) becomes ltr_DISPOSITIVO, as text like the MQTT ingest
+    writes it.
+    """
+    spec = SCHEMAS[schema]
+    columns = {}
+    for position, target in enumerate(spec["columns"]):
+        if target == spec["id"]:
+            continue
+        names = {other["columns"][position] for other in SCHEMAS.values()}
+        source = next((name for name in names if name in frame), None)
+        if source is None:
+            if target == spec["time"]:
+                continue  # let the column default to CURRENT_TIMESTAMP
+            raise ValueError(f"Missing column for {target}: expected one of {names}")
+        columns[target] = frame[source]
+    if schema == "v4":
+        source = next((name for name in DEVICE_SOURCES if name in frame), None)
+        if source is not None:
+            # Integer IDs with gaps are read from CSV as floats
+            devices = frame[source].convert_dtypes()
+            columns[DEVICE_COLUMN] = (
+                devices.astype(str).astype(object).where(devices.notna(), None)
+            )
+
+    data = pandas.DataFrame(columns)
+    if spec["time"] in data:
+        # numpy formats datetimes about 5x faster than Series.dt.strftime
+        timestamps = pandas.to_datetime(data[spec["time"]], format="ISO8601")
+        text = numpy.datetime_as_string(timestamps.to_numpy("datetime64[s]"))
+        data[spec["time"]] = numpy.char.replace(text, "T", " ").astype(object)
+    return data
+
+
+def _drop_indexes_and_triggers(connection, table):
+    # Unique indexes stay: they are what rejects duplicate readings, also
+    # those live ingest writes during the load
+    unique = {
+        row[1] for row in connection.execute(f"PRAGMA index_list({table})") if row[2]
+    }
+    objects = [
+        (object_type, name, sql)
+        for object_type, name, sql in connection.execute(
+            """
+            SELECT type, name, sql FROM sqlite_master
+            WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL
+            """,
+            (table,),
+        )
+        if name not in unique
+    ]
+    for object_type, name, _ in objects:
+        connection.execute(f"DROP {object_type.upper()} {name}")
+    connection.commit()
+    return [sql for _, _, sql in objects]
+
+
+def _bump_version(connection, schema, table):
+    version_table, name_column, counter_column = VERSION_TABLES[schema]
+    exists = connection.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+        (version_table,),
+    ).fetchone()
+    if exists:
+        connection.execute(
+            f"UPDATE {version_table} SET {counter_column} = {counter_column} + 1 "
+            f"WHERE {name_column} = ?",
+            (table,),
+        )
+
+
+def import_frames(
+    frames, schema="v4", db_path=None, commit_rows=COMMIT_ROWS, drop_indexes=True
+):
+    """Bulk load an iterable of DataFrames and return `(rows, seconds)`.
+
+    Readings that duplicate a stored one (same device and ltr_DATA) are
+    skipped and not counted in `rows`. Non-unique indexes and triggers of the
+    target table are dropped during the load and recreated afterwards (also
+    when the load fails), and the v4 rollup periods covered by the rows added
+    meanwhile, including those other processes wrote while the triggers were
+    gone, are rebuilt once at the end instead of row by row. For small loads
+    into a large table `drop_indexes=False` is faster, as it skips rebuilding
+    the indexes over all rows.
+    """
+    started = time.perf_counter()
+    rows = 0
+
+    if schema == "v4" and db_path is None and database.SENSOR_STORAGE == "columnar":
+        store = database.get_columnar_store()
+        for frame in frames:
+            data = normalize_frame(frame, schema)
+            data["ltr_DATA"] = pandas.to_datetime(data["ltr_DATA"])
+            rows += len(store.write_frame(data))
+        return rows, time.perf_counter() - started
+
+    if db_path is None:
+        if schema != "v4":
+            raise ValueError("db_path is required for the v3 schema")
+        with database.connect():
+            pass  # creates and migrates the default database
+        db_path = database.DB_PATH
+    elif not os.path.exists(db_path):
+        raise FileNotFoundError(f"Database {db_path} does not exist")
+
+    spec = SCHEMAS[schema]
+    connection = sqlite3.connect(db_path)
+    for name, value in PRAGMAS.items():
+        connection.execute(f"PRAGMA {name}={value}")
+    # Databases from before migration 0005 have no ltr_DISPOSITIVO
+    table_columns = {
+        row[1] for row in connection.execute(f"PRAGMA table_info({spec['table']})")
+    }
+
+    # Rows above it were added during the load, by it or by live ingest
+    start_id = connection.execute(
+        f"SELECT COALESCE(MAX({spec['id']}), 0) FROM {spec['table']}"
+    ).fetchone()[0]
+    recreate = (
+        _drop_indexes_and_triggers(connection, spec["table"]) if drop_indexes else []
+    )
+    try:
+        pending = 0
+        for frame in frames:
+            data = normalize_frame(frame, schema)
+            data = data.loc[:, [column for column in data if column in table_columns]]
+            if len(data) == 0:
+                continue
+            placeholders = ", ".join("?" for _ in data.columns)
+            rows += connection.executemany(
+                f"INSERT INTO {spec['table']} ({', '.join(data.columns)}) VALUES ({placeholders}) "
+                "ON CONFLICT DO NOTHING",
+                data.itertuples(index=False, name=None),
+            ).rowcount
+            pending += len(data)
+            if pending >= commit_rows:
+                connection.commit()
+                pending = 0
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        for sql in recreate:
+            connection.execute(sql)
+        if drop_indexes:
+            # The change-counter triggers were dropped too (migration 0004)
+            _bump_version(connection, schema, spec["table"])
+        connection.commit()
+        has_rollups = connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'tbl_LEITURA_MES'"
+        ).fetchone()
+        if schema == "v4" and has_rollups and drop_indexes:
+            first, last = connection.execute(
+                "SELECT MIN(ltr_DATA), MAX(ltr_DATA) FROM tbl_LEITURA WHERE ID_LEITURA > ?",
+                (start_id,),
+            ).fetchone()
+            if first is not None:
+                rebuild_rollups(connection=connection, start=first, end=last)
+        connection.close()
+
+    return rows, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Bulk import sensor readings from CSV or JSON-lines files."
+    )
+    parser.add_argument("paths", nargs="+", help="CSV / JSON-lines files to import")
+    parser.add_argument("--schema", choices=sorted(SCHEMAS), default="v4")
+    parser.add_argument("--db", default=None, help="target database (default: v4 DB)")
+    parser.add_argument("--format", choices=sorted(set(FORMATS.values())))
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument(
+        "--keep-indexes",
+        action="store_true",
+        help="keep indexes and triggers during the load (faster for small loads)",
+    )
+    args = parser.parse_args()
+
+    total_rows, total_seconds = 0, 0.0
+    for path in args.paths:
+        rows, seconds = import_frames(
+            read_source(path, args.format, args.chunk_rows),
+            args.schema,
+            args.db,
+            drop_indexes=not args.keep_indexes,
+        )
+        total_rows += rows
+        total_seconds += seconds
+        print(f"{path}: {rows} rows in {seconds:.1f} s ({rows / seconds:,.0f} rows/s)")
+
+    if len(args.paths) > 1:
+        print(
+            f"Total: {total_rows} rows in {total_seconds:.1f} s "
+            f"({total_rows / total_seconds:,.0f} rows/s)"
+        )
+
+
+if __name__ == "__main__":
+    main()
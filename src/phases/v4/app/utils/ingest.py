@@ -0,0 +1,398 @@
+import atexit
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import deque
+from datetime import datetime, timezone
+from utils import metrics
+from utils.payload import decode_payload
+from utils.query import format_timestamp
+
+# Messages held in memory between the MQTT callback and the workers
+QUEUE_SIZE = 10_000
+POLICIES = ("block", "drop_oldest", "spill")
+INGEST_POLICY = os.getenv("INGEST_POLICY", "block")
+# Writer workers; each device's readings always go to the same one
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "1"))
+SPILL_PATH = "./database/ingest.spill"
+# Messages a worker decodes and hands to the writer at a time
+BATCH_MESSAGES = 500
+# Error types reported by the pipeline (database errors come from the writer)
+ERROR_TYPES = ("KeyError", "decode")
+
+# Spill record header: arrival time, topic and payload sizes in bytes
+SPILL_RECORD = struct.Struct("<dII")
+
+
+class IngestQueue:
+    """Bounded FIFO of raw `(topic, payload, received)` messages.
+
+    When `capacity` messages are queued, `put` applies `policy`: "block"
+    waits for room (up to `block_timeout` seconds, then drops the message),
+    "drop_oldest" discards the oldest queued message and "spill" appends the
+    message to `spill_path`. Spilled messages are read back in order once
+    the memory queue drains, and are recovered from the file after a crash.
+    """
+
+    def __init__(
+        self,
+        capacity=QUEUE_SIZE,
+        policy="block",
+        spill_path=SPILL_PATH,
+        block_timeout=None,
+    ):
+        if policy not in POLICIES:
+            raise ValueError(
+                f"Unknown backpressure policy '{policy}', expected one of {POLICIES}"
+            )
+        self.capacity = capacity
+        self.policy = policy
+        self.spill_path = spill_path
+        self.block_timeout = block_timeout
+        self.dropped = 0
+        self.spilled = 0
+
+        self._items = deque()
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._closed = False
+        self._spill = None
+        self._spill_offset = 0
+        self._spill_pending = 0
+        if policy == "spill" and os.path.exists(spill_path):
+            self._open_spill()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items) + self._spill_pending
+
+    def put(self, topic, payload, received=None):
+        """Queue a message; returns False if it was dropped (or the queue is
+        closed)."""
+        item = (topic, bytes(payload), time.time() if received is None else received)
+        with self._lock:
+            if self._closed:
+                self.dropped += 1
+                return False
+            full = len(self._items) >= self.capacity
+            # Once messages are spilled, newer ones follow them to keep the order
+            if self.policy == "spill" and (full or self._spill_pending):
+                self._write_spill(item)
+            else:
+                if full and self.policy == "drop_oldest":
+                    self._items.popleft()
+                    self.dropped += 1
+                elif full and not self._not_full.wait_for(
+                    lambda: len(self._items) < self.capacity or self._closed,
+                    self.block_timeout,
+                ):
+                    self.dropped += 1
+                    return False
+                self._items.append(item)
+            self._not_empty.notify()
+        return True
+
+    def get_many(self, limit, timeout=None):
+        """Remove and return up to `limit` messages, oldest first.
+
+        Waits up to `timeout` seconds for the first one; returns an empty list
+        on timeout or once the queue is closed and drained.
+        """
+        with self._lock:
+            self._not_empty.wait_for(
+                lambda: self._items or self._spill_pending or self._closed, timeout
+            )
+            if not self._items and self._spill_pending:
+                self._read_spill(limit)
+            items = [self._items.popleft() for _ in range(min(limit, len(self._items)))]
+            if items:
+                self._not_full.notify_all()
+        return items
+
+    def close(self):
+        """Refuse new messages and wake every waiting thread."""
+        with self._lock:
+            self._closed = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def _open_spill(self):
+        self._spill = open(self.spill_path, "a+b")
+        self._spill.seek(0)
+        # Count the complete records left by a previous run
+        offset, size = 0, os.path.getsize(self.spill_path)
+        while offset + SPILL_RECORD.size <= size:
+            _, topic_size, payload_size = SPILL_RECORD.unpack(
+                self._spill.read(SPILL_RECORD.size)
+            )
+            end = offset + SPILL_RECORD.size + topic_size + payload_size
+            if end > size:
+                break
+            self._spill.seek(end)
+            offset = end
+            self._spill_pending += 1
+        self._spill.truncate(offset)
+
+    def _write_spill(self, item):
+        if self._spill is None:
+            self._open_spill()
+        topic, payload, received = item
+        topic = topic.encode("utf-8")
+        self._spill.write(
+            SPILL_RECORD.pack(received, len(topic), len(payload)) + topic + payload
+        )
+        self._spill.flush()
+        self._spill_pending += 1
+        self.spilled += 1
+
+    def _read_spill(self, limit):
+        self._spill.seek(self._spill_offset)
+        for _ in range(min(limit, self._spill_pending)):
+            received, topic_size, payload_size = SPILL_RECORD.unpack(
+                self._spill.read(SPILL_RECORD.size)
+            )
+            topic = self._spill.read(topic_size).decode("utf-8")
+            self._items.append((topic, self._spill.read(payload_size), received))
+            self._spill_pending -= 1
+        self._spill_offset = self._spill.tell()
+        if not self._spill_pending:
+            self._spill.truncate(0)
+            self._spill_offset = 0
+
+
+def topic_levels(topic_filter, topic):
+    """Levels of `topic` matched by the `+` wildcards of `topic_filter`, or
+    None if the topic does not match the filter (MQTT rules, `#` included)."""
+    levels = topic.split("/")
+    captured = []
+    for position, level in enumerate(topic_filter.split("/")):
+        if level == "#":
+            return captured
+        if position >= len(levels):
+            return None
+        if level == "+":
+            captured.append(levels[position])
+        elif level != levels[position]:
+            return None
+    return captured if len(levels) == position + 1 else None
+
+
+def topic_device(topic_filter, topic):
+    """The device or plot ID in `topic`: the level under the filter's first
+    `+` (e.g. "esp32-7" in "farm/esp32-7/sensors" for "farm/+/sensors")."""
+    if topic_filter is None:
+        return None
+    levels = topic_levels(topic_filter, topic)
+    return levels[0] if levels else None
+
+
+def shard_of(key, shards):
+    """Stable shard of a device: crc32 does not change between processes,
+    unlike hash() of a str."""
+    return zlib.crc32(key.encode("utf-8")) % shards if shards > 1 else 0
+
+
+def shard_path(path, shard, shards):
+    if shards == 1:
+        return path
+    root, extension = os.path.splitext(path)
+    return f"{root}.{shard}{extension}"
+
+
+def decode_message(topic, payload, received, device=None):
+    """Validate a message and return the `save_sensor_data_many` tuples of
+    its readings.
+
+    The payload is a JSON reading or array of readings, or a binary reading
+    or batch (utils/payload.py), told apart by its first byte. Raises
+    KeyError for a missing field and ValueError for an undecodable payload
+    or a value of the wrong type; one bad reading rejects the whole message.
+    A single reading without ltr_DATA is timestamped with its arrival time,
+    not with when a worker got to it, and flagged so it is never taken for a
+    redelivery. Batches need ltr_DATA in every reading (ValueError otherwise):
+    their readings would all share one arrival time. The device is the
+    payload's ltr_DISPOSITIVO, else `device` (taken from the topic), else the
+    topic itself.
+    """
+    readings = decode_payload(payload)
+    if len(readings) > 1 and any(reading[6] is None for reading in readings):
+        raise ValueError(
+            f"Batch of {len(readings)} readings without ltr_DATA in every reading"
+        )
+    arrival = None
+    rows = []
+    for *values, timestamp, payload_device in readings:
+        stamped = timestamp is None
+        if stamped:
+            if arrival is None:
+                arrival = format_timestamp(
+                    datetime.fromtimestamp(received, timezone.utc)
+                )
+            timestamp = arrival
+        # Redeliveries repeat the device and the timestamp of the reading
+        rows.append(
+            (*values, timestamp, payload_device or device or topic, int(stamped))
+        )
+    return rows
+
+
+class IngestPipeline:
+    """MQTT ingest split into stages so storage never stalls the network loop.
+
+    `submit` (called from paho's network thread) only queues the raw payload
+    bytes, on the queue of the message's shard. Each writer in `writers` gets
+    a shard: its own queue (of `capacity` messages, with the backpressure
+    `policy`) and worker thread, which takes up to `batch_messages` messages
+    at a time, decodes and validates them and passes the rows of all their
+    readings to the writer's `add_many` (a BatchWriter, which group-commits
+    them), so a batched message is one bulk write like any other.
+
+    Messages are sharded by the device in their topic (see `topic_device`
+    with `topic_filter`), or by the whole topic, so a device's readings are
+    always written in the order they arrived.
+    """
+
+    def __init__(
+        self,
+        writers,
+        topic_filter=None,
+        capacity=QUEUE_SIZE,
+        policy=INGEST_POLICY,
+        spill_path=SPILL_PATH,
+        batch_messages=BATCH_MESSAGES,
+        block_timeout=None,
+    ):
+        self.writers = (
+            list(writers) if isinstance(writers, (list, tuple)) else [writers]
+        )
+        self.topic_filter = topic_filter
+        self.batch_messages = batch_messages
+        shards = len(self.writers)
+        self.queues = [
+            IngestQueue(
+                capacity, policy, shard_path(spill_path, shard, shards), block_timeout
+            )
+            for shard in range(shards)
+        ]
+        self.received = 0
+        self.decoded = 0
+        # Rows handed to the writers, minus the duplicates they dropped
+        self.accepted = 0
+        self.errors = dict.fromkeys(ERROR_TYPES, 0)
+
+        self._counter_lock = threading.Lock()
+        self._workers = [
+            threading.Thread(target=self._work, args=(shard,), daemon=True)
+            for shard in range(shards)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+        metrics.register(self._collect)
+        atexit.register(self.close)
+
+    @property
+    def dropped(self):
+        return sum(queue.dropped for queue in self.queues)
+
+    @property
+    def spilled(self):
+        return sum(queue.spilled for queue in self.queues)
+
+    def depth(self):
+        return sum(len(queue) for queue in self.queues)
+
+    def submit(self, topic, payload):
+        """Queue one message; returns False if backpressure dropped it."""
+        with self._counter_lock:
+            self.received += 1
+        if len(self.queues) == 1:
+            return self.queues[0].put(topic, payload)
+        key = topic_device(self.topic_filter, topic) or topic
+        return self.queues[shard_of(key, len(self.queues))].put(topic, payload)
+
+    def on_message(self, client, userdata, msg):
+        """paho `on_message` callback."""
+        self.submit(msg.topic, msg.payload)
+
+    def _error(self, kind, message):
+        with self._counter_lock:
+            self.errors[kind] = self.errors.get(kind, 0) + 1
+        print(message)
+
+    def _work(self, shard):
+        queue, writer = self.queues[shard], self.writers[shard]
+        while True:
+            messages = queue.get_many(self.batch_messages, timeout=1.0)
+            if not messages:
+                if queue.closed and not len(queue):
+                    return
+                continue
+
+            rows = []
+            for topic, payload, received in messages:
+                try:
+                    device = topic_device(self.topic_filter, topic)
+                    rows.extend(decode_message(topic, payload, received, device))
+                except KeyError as e:
+                    self._error("KeyError", f"Missing field in payload: {e}")
+                except (ValueError, TypeError) as e:
+                    self._error("decode", f"Error decoding message: {e}")
+            with self._counter_lock:
+                self.decoded += len(rows)
+            if not rows:
+                continue
+
+            try:
+                kept = writer.add_many(rows)
+            except Exception as e:
+                # The writer counts the error, keeps the rows and retries them
+                print(f"Error saving sensor data: {e}")
+                continue
+            with self._counter_lock:
+                self.accepted += kept
+
+    def _collect(self):
+        with self._counter_lock:
+            received, decoded = self.received, self.decoded
+            errors = dict(self.errors)
+        return [
+            ("ingest_messages_total", [("ingest_messages_total", {}, received)]),
+            (
+                "ingest_readings_total",
+                [("ingest_readings_total", {"stage": "decoded"}, decoded)],
+            ),
+            ("ingest_dropped_total", [("ingest_dropped_total", {}, self.dropped)]),
+            ("ingest_spilled_total", [("ingest_spilled_total", {}, self.spilled)]),
+            (
+                "ingest_errors_total",
+                [
+                    ("ingest_errors_total", {"type": kind}, count)
+                    for kind, count in errors.items()
+                ],
+            ),
+            (
+                "ingest_queue_depth",
+                [
+                    ("ingest_queue_depth", {"shard": str(shard)}, len(queue))
+                    for shard, queue in enumerate(self.queues)
+                ],
+            ),
+        ]
+
+    def close(self, timeout=None):
+        """Stop accepting messages, let the workers drain the queues and flush."""
+        for queue in self.queues:
+            queue.close()
+        for worker in self._workers:
+            if worker is not threading.current_thread():
+                worker.join(timeout)
+        for writer in self.writers:
+            writer.flush()
@@ -0,0 +1,222 @@
+import threading
+import numpy
+import pandas
+
+DEVICE_COLUMN = "ltr_DISPOSITIVO"
+TIME_COLUMN = "ltr_DATA"
+STATUS_COLUMN = "ltr_STATUS_IRRIGACAO"
+# A gap this long between two readings ends a cycle at its last "on" reading:
+# the device was offline and whether water kept running is unknown
+MAX_GAP = numpy.timedelta64(3600, "s")
+PERIODS = {"day": "D", "month": "M"}
+CYCLE_COLUMNS = ["device", "start", "end", "duration", "open"]
+
+
+def _columns(rows):
+    """Device codes and names, datetime64[s] times and boolean status of rows."""
+    if DEVICE_COLUMN in rows and rows[DEVICE_COLUMN].notna().any():
+        codes, names = pandas.factorize(rows[DEVICE_COLUMN], use_na_sentinel=False)
+        # Readings without a device (local inserts) form one device ""
+        names = names.to_series().fillna("").astype(str).to_numpy(object)
+    else:
+        codes = numpy.zeros(len(rows), dtype=numpy.intp)
+        names = numpy.array([""], dtype=object)
+    times = rows[TIME_COLUMN]
+    if not pandas.api.types.is_datetime64_dtype(times):
+        times = pandas.to_datetime(times)
+    times = times.to_numpy("datetime64[s]")
+    status = rows[STATUS_COLUMN].to_numpy().astype(bool)
+    return codes, names, times, status
+
+
+def _cycles_from(codes, names, times, status, max_gap, run_starts=None):
+    """Run-length encode the status of each device's readings into cycles.
+
+    `codes` index `names`. `run_starts` maps a device to the start of a run
+    carried over from an earlier batch; the device's first run here continues
+    it. Returns the cycles and, per device, its last reading's time and
+    status and the start of the run that reading belongs to.
+    """
+    if len(times) == 0:
+        return pandas.DataFrame(columns=CYCLE_COLUMNS), {}
+    # One int64 sort key is several times faster than lexsort((times, codes))
+    seconds = (times - times.min()).astype(numpy.int64)
+    order = numpy.argsort(codes * (int(seconds.max()) + 1) + seconds, kind="stable")
+    codes, times, status = codes[order], times[order], status[order]
+
+    # A run ends where the device changes, the status changes or the device
+    # was silent for longer than max_gap
+    same_device = codes[1:] == codes[:-1]
+    within_gap = (times[1:] - times[:-1]) <= max_gap
+    boundary = numpy.ones(len(codes), dtype=bool)
+    boundary[1:] = ~same_device | ~within_gap | (status[1:] != status[:-1])
+    first = numpy.flatnonzero(boundary)
+    last = numpy.append(first[1:], len(codes)) - 1
+    # Runs followed by a reading of the same device within max_gap end at
+    # that reading; the others end at their own last reading
+    following = numpy.minimum(last + 1, len(codes) - 1)
+    switched = numpy.append(same_device & within_gap, False)[last]
+    final = numpy.append(~same_device, True)[last]
+
+    starts = times[first]
+    device_first = numpy.append(True, codes[first[1:]] != codes[first[:-1]])
+    for run in numpy.flatnonzero(device_first) if run_starts else ():
+        carried = run_starts.get(names[codes[first[run]]])
+        if carried is not None:
+            starts[run] = carried
+    ends = numpy.where(switched, times[following], times[last])
+
+    on = status[first]
+    cycles = pandas.DataFrame(
+        {
+            "device": names[codes[first[on]]],
+            "start": starts[on],
+            "end": ends[on],
+            "duration": (ends[on] - starts[on]).astype(numpy.int64),
+            "open": final[on] & ~switched[on],
+        }
+    )
+    tails = {
+        names[codes[last[run]]]: (
+            times[last[run]],
+            bool(status[last[run]]),
+            starts[run],
+        )
+        for run in numpy.flatnonzero(final)
+    }
+    return cycles, tails
+
+
+def irrigation_cycles(rows, max_gap=MAX_GAP):
+    """Return one row per irrigation cycle in `rows` (any order).
+
+    A cycle starts at the first reading with ltr_STATUS_IRRIGACAO = 1 and
+    ends at the next reading of the same device with status 0. Cycles cut
+    by a gap longer than `max_gap` end at their last "on" reading; cycles
+    still on at the device's last reading do too and have `open` set.
+    `duration` is in seconds.
+    """
+    cycles, _ = _cycles_from(*_columns(rows), max_gap)
+    return cycles
+
+
+def water_time(cycles, period="day", by_device=False):
+    """Total irrigation seconds and cycles started per day or month.
+
+    Cycles that cross midnight (or a month boundary) are split, so each
+    period gets the part of the cycle that fell inside it.
+    """
+    unit = PERIODS[period]
+    starts = cycles["start"].to_numpy("datetime64[s]")
+    ends = cycles["end"].to_numpy("datetime64[s]")
+    first = starts.astype(f"datetime64[{unit}]")
+    spans = (ends.astype(f"datetime64[{unit}]") - first).astype(numpy.int64) + 1
+
+    # One piece per cycle and period it touches
+    piece = numpy.repeat(numpy.arange(len(cycles)), spans)
+    offset = numpy.arange(len(piece)) - numpy.repeat(numpy.cumsum(spans) - spans, spans)
+    periods = first[piece] + offset
+    seconds = numpy.minimum(
+        ends[piece], (periods + 1).astype("datetime64[s]")
+    ) - numpy.maximum(starts[piece], periods.astype("datetime64[s]"))
+
+    pieces = pandas.DataFrame(
+        {
+            period: periods.astype("datetime64[s]"),
+            "device": cycles["device"].to_numpy()[piece],
+            "irrigation_seconds": seconds.astype(numpy.int64),
+            "cycles": offset == 0,
+        }
+    )
+    keys = [period, "device"] if by_device else [period]
+    totals = pieces.groupby(keys, as_index=False)[["irrigation_seconds", "cycles"]]
+    totals = totals.sum()
+    if period == "month":
+        totals[period] = totals[period].dt.to_period("M")
+    return totals
+
+
+class IrrigationCycles:
+    """Irrigation cycles kept up to date as new readings arrive.
+
+    `update(rows)` only processes rows above the highest ID_LEITURA seen so
+    far. Each device's last reading and the start of its current run are
+    carried over, so a cycle split across updates is counted once. Readings
+    older than a device's last processed reading are ignored;
+    `irrigation_cycles` on the whole history accounts for them.
+    """
+
+    def __init__(self, max_gap=MAX_GAP):
+        self.max_gap = max_gap
+        self.watermark = 0
+        self._closed = []
+        self._tails = {}  # device -> (last time, last status, run start)
+        self._lock = threading.Lock()
+
+    def update(self, rows):
+        """Add new readings and return `cycles()`."""
+        with self._lock:
+            if len(rows) and "ID_LEITURA" in rows:
+                max_id = int(rows["ID_LEITURA"].max())
+                if max_id < self.watermark:
+                    # The table was recreated: start over
+                    self.watermark, self._closed, self._tails = 0, [], {}
+                rows = rows[rows["ID_LEITURA"] > self.watermark]
+                self.watermark = max(self.watermark, max_id)
+            if len(rows):
+                self._add(*_columns(rows))
+            return self._cycles()
+
+    def _add(self, codes, names, times, status):
+        tails = self._tails
+        if tails:
+            # Tail devices get the first codes
+            count = len(tails)
+            merged = pandas.Index(list(tails)).append(pandas.Index(names)).unique()
+            codes = merged.get_indexer(names)[codes]
+            names = merged.to_numpy(object)
+            last_times = numpy.array(
+                [tail[0] for tail in tails.values()], dtype="datetime64[s]"
+            )
+            keep = codes >= count
+            keep[~keep] = times[~keep] > last_times[codes[~keep]]
+            # Each device's last reading goes first, so its run continues
+            codes = numpy.concatenate([numpy.arange(count), codes[keep]])
+            times = numpy.concatenate([last_times, times[keep]])
+            status = numpy.concatenate(
+                [[tail[1] for tail in tails.values()], status[keep]]
+            )
+
+        cycles, new_tails = _cycles_from(
+            codes,
+            names,
+            times,
+            status,
+            self.max_gap,
+            {device: tail[2] for device, tail in tails.items()},
+        )
+        self._tails = new_tails
+        closed = cycles[~cycles["open"]]
+        if len(closed):
+            self._closed.append(closed)
+
+    def cycles(self):
+        with self._lock:
+            return self._cycles()
+
+    def _cycles(self):
+        """Closed cycles plus the ones still running, oldest first."""
+        running = [
+            (device, start, time, int((time - start).astype(numpy.int64)), True)
+            for device, (time, status, start) in self._tails.items()
+            if status
+        ]
+        if len(self._closed) > 1:
+            self._closed = [pandas.concat(self._closed, ignore_index=True)]
+        frames = list(self._closed)
+        if running:
+            frames.append(pandas.DataFrame(running, columns=CYCLE_COLUMNS))
+        if not frames:
+            return pandas.DataFrame(columns=CYCLE_COLUMNS)
+        cycles = pandas.concat(frames, ignore_index=True)
+        return cycles.sort_values("start", ignore_index=True)
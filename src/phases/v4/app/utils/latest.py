@@ -0,0 +1,245 @@
+import threading
+import numpy
+import pandas
+from utils import database
+
+# Readings kept per device
+CAPACITY = 1024
+# tbl_LEITURA buffers are keyed by (FLAT_DEVICE, ltr_DISPOSITIVO), see
+# `flat_key`; Sensor_Reading devices are keyed by their sensor_id
+FLAT_DEVICE = "tbl_LEITURA"
+FLAT_COLUMNS = [
+    "ltr_UMIDADE",
+    "ltr_TEMPERATURA",
+    "ltr_PH",
+    "ltr_NUTRIENTE_P",
+    "ltr_NUTRIENTE_K",
+    "ltr_STATUS_IRRIGACAO",
+]
+SENSOR_COLUMNS = ["moisture_value", "ph_value", "phosphorus_value", "potassium_value"]
+
+_BUFFERS = {}
+_BUFFERS_LOCK = threading.Lock()
+
+
+class ReadingBuffer:
+    """Ring buffer with the last `capacity` readings of one device.
+
+    Timestamps and values live in preallocated numpy arrays, so appends and
+    `latest()` are O(1) and `last_n`/`since` copy only the rows they return.
+    Readings older than the newest one are ignored (they are in the database
+    anyway), which keeps the buffer sorted for `since`. All methods are
+    thread-safe.
+    """
+
+    def __init__(self, columns, capacity=CAPACITY):
+        self.columns = list(columns)
+        self.capacity = capacity
+        self._timestamps = numpy.empty(capacity, dtype="datetime64[s]")
+        self._values = numpy.empty((capacity, len(self.columns)), dtype=numpy.float64)
+        self._size = 0
+        self._next = 0  # slot of the next append
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._size
+
+    def _append(self, timestamp, values):
+        if self._size and timestamp < self._timestamps[self._next - 1]:
+            return
+        self._timestamps[self._next] = timestamp
+        self._values[self._next] = values
+        self._next = (self._next + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+
+    def append(self, timestamp, values):
+        """Add one reading; `values` follows `columns`."""
+        timestamp = numpy.datetime64(timestamp, "s")
+        with self._lock:
+            self._append(timestamp, values)
+
+    def extend(self, rows):
+        """Add `(timestamp, *values)` rows, oldest first."""
+        rows = [(numpy.datetime64(row[0], "s"), row[1:]) for row in rows]
+        with self._lock:
+            for timestamp, values in rows:
+                self._append(timestamp, values)
+
+    def newest_timestamp(self):
+        with self._lock:
+            if not self._size:
+                return None
+            return pandas.Timestamp(self._timestamps[self._next - 1])
+
+    def latest(self):
+        """Return the newest reading as a dict, or None when empty."""
+        with self._lock:
+            if not self._size:
+                return None
+            slot = self._next - 1
+            reading = dict(zip(self.columns, self._values[slot].tolist()))
+            reading["timestamp"] = pandas.Timestamp(self._timestamps[slot])
+        return reading
+
+    def _last(self, n):
+        # Slots of the last n readings, oldest first
+        n = max(0, min(n, self._size))
+        return (numpy.arange(self._next - n, self._next)) % self.capacity
+
+    def _frame(self, slots):
+        data = pandas.DataFrame(self._values[slots], columns=self.columns)
+        data.insert(0, "timestamp", self._timestamps[slots].astype("datetime64[ns]"))
+        return data
+
+    def last_n(self, n):
+        """Return the last `n` readings as a DataFrame, oldest first."""
+        with self._lock:
+            return self._frame(self._last(n))
+
+    def since(self, timestamp):
+        """Return the buffered readings at or after `timestamp`, oldest first."""
+        timestamp = numpy.datetime64(timestamp, "s")
+        with self._lock:
+            slots = self._last(self._size)
+            first = numpy.searchsorted(self._timestamps[slots], timestamp, "left")
+            return self._frame(slots[first:])
+
+
+def _flat_rows(device, newer_than=None, limit=CAPACITY):
+    # The last `limit` tbl_LEITURA readings of one ltr_DISPOSITIVO (None for
+    # readings without one), optionally only those after `newer_than`
+    if database.SENSOR_STORAGE == "columnar":
+        data = database.get_columnar_store().fetch_sensor_data(
+            FLAT_COLUMNS + ["ltr_DISPOSITIVO"], newer_than
+        )
+        if device is None:
+            data = data[data["ltr_DISPOSITIVO"].isna()]
+        else:
+            data = data[data["ltr_DISPOSITIVO"] == device]
+        if newer_than is not None:
+            data = data[data["ltr_DATA"] > pandas.Timestamp(newer_than)]
+        data = data.head(limit).iloc[::-1]
+        data["ltr_DATA"] = data["ltr_DATA"].dt.strftime("%Y-%m-%d %H:%M:%S")
+        return list(data[["ltr_DATA"] + FLAT_COLUMNS].itertuples(False, None))
+
+    condition, params = "WHERE ltr_DISPOSITIVO IS ?", (device,)
+    if newer_than is not None:
+        condition, params = condition + " AND ltr_DATA > ?", (device, newer_than)
+    with database.connect_read() as connection:
+        rows = connection.execute(
+            f"""
+            SELECT ltr_DATA, {', '.join(FLAT_COLUMNS)} FROM tbl_LEITURA
+            {condition} ORDER BY ltr_DATA DESC LIMIT ?
+            """,
+            (*params, limit),
+        ).fetchall()
+    return rows[::-1]
+
+
+def _newest_flat_device():
+    # ltr_DISPOSITIVO of the newest tbl_LEITURA reading
+    if database.SENSOR_STORAGE == "columnar":
+        data = database.get_columnar_store().fetch_sensor_data(["ltr_DISPOSITIVO"])
+        if data.empty or pandas.isna(data["ltr_DISPOSITIVO"].iloc[0]):
+            return None
+        return data["ltr_DISPOSITIVO"].iloc[0]
+
+    with database.connect_read() as connection:
+        row = connection.execute(
+            "SELECT ltr_DISPOSITIVO FROM tbl_LEITURA ORDER BY ltr_DATA DESC LIMIT 1"
+        ).fetchone()
+    return row[0] if row else None
+
+
+def _sensor_rows(sensor_id, limit=CAPACITY):
+    with database.connect_read() as connection:
+        rows = connection.execute(
+            f"""
+            SELECT timestamp, {', '.join(SENSOR_COLUMNS)} FROM Sensor_Reading
+            WHERE sensor_id = ? ORDER BY timestamp DESC LIMIT ?
+            """,
+            (sensor_id, limit),
+        ).fetchall()
+    return rows[::-1]
+
+
+def flat_key(device=None):
+    """Buffer key of the tbl_LEITURA readings of one ltr_DISPOSITIVO."""
+    return (FLAT_DEVICE, device)
+
+
+def _is_flat(key):
+    return isinstance(key, tuple) and key[0] == FLAT_DEVICE
+
+
+def get_buffer(key=flat_key()):
+    """Return the buffer of a device, warming it from the database on first use.
+
+    `key` is `flat_key(ltr_DISPOSITIVO)` for tbl_LEITURA readings, with None
+    for readings without a device, or a Sensor_Reading sensor_id.
+    """
+    with _BUFFERS_LOCK:
+        buffer = _BUFFERS.get(key)
+        if buffer is None:
+            if _is_flat(key):
+                buffer = ReadingBuffer(FLAT_COLUMNS)
+                buffer.extend(_flat_rows(key[1]))
+            else:
+                buffer = ReadingBuffer(SENSOR_COLUMNS)
+                buffer.extend(_sensor_rows(key))
+            _BUFFERS[key] = buffer
+        return buffer
+
+
+def record(key, rows):
+    """Feed `(timestamp, *values)` rows of one device from the write path.
+
+    Devices nobody has read yet are skipped; their buffer is warmed from the
+    database when first requested.
+    """
+    buffer = _BUFFERS.get(key)
+    if buffer is not None:
+        buffer.extend(rows)
+
+
+def record_flat_readings(rows):
+    """Feed tbl_LEITURA rows, see `database.save_sensor_data_many`, to the
+    buffers of their ltr_DISPOSITIVO (row[7], None when missing)."""
+    if not any(_is_flat(key) for key in _BUFFERS):
+        return
+    by_device = {}
+    for row in rows:
+        device = row[7] if len(row) > 7 else None
+        by_device.setdefault(device, []).append((row[6], *row[:6]))
+    for device, device_rows in by_device.items():
+        record(flat_key(device), device_rows)
+
+
+def record_sensor_readings(rows):
+    """Feed Sensor_Reading rows (see sensors.READING_COLUMNS) to their buffers."""
+    if all(_is_flat(key) for key in _BUFFERS):
+        return
+    for row in rows:
+        buffer = _BUFFERS.get(row[0])
+        if buffer is not None:
+            buffer.append(row[1], row[4:])
+
+
+def refresh(device=None):
+    """Pull tbl_LEITURA rows written by other processes into a device buffer.
+
+    `device` is an ltr_DISPOSITIVO; by default the device of the newest
+    reading is used. Returns `(device, buffer)`. Writes made in this process
+    reach the buffers through `record_flat_readings`; a dashboard fed by a
+    separate MQTT process calls this instead, which reads only the device's
+    rows newer than its buffer.
+    """
+    if device is None:
+        device = _newest_flat_device()
+    buffer = get_buffer(flat_key(device))
+    newest = buffer.newest_timestamp()
+    if newest is None:
+        buffer.extend(_flat_rows(device))
+    else:
+        buffer.extend(_flat_rows(device, newest.strftime("%Y-%m-%d %H:%M:%S")))
+    return device, buffer
@@ -0,0 +1,278 @@
+import http.server
+import os
+import threading
+import time
+import numpy
+
+# Prometheus text exposition file, rewritten every METRICS_INTERVAL seconds;
+# METRICS_PORT > 0 also serves it over HTTP at /metrics
+METRICS_PATH = os.getenv("METRICS_PATH", "./database/metrics.prom")
+METRICS_INTERVAL = float(os.getenv("METRICS_INTERVAL", "5"))
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+# Upper bounds, in seconds, of the end-to-end lag histogram buckets
+LAG_BUCKETS = (0.5, 1, 2, 5, 10, 30, 60, 300, 900, 3600)
+
+# Type and help of every metric family the collectors report
+FAMILIES = {
+    "ingest_messages_total": ("counter", "MQTT messages received."),
+    "ingest_readings_total": (
+        "counter",
+        "MQTT ingest readings by stage: decoded, and written (committed).",
+    ),
+    "ingest_dropped_total": (
+        "counter",
+        "Messages dropped by the ingest queue's backpressure policy.",
+    ),
+    "ingest_spilled_total": ("counter", "Messages the ingest queue spilled to disk."),
+    "ingest_duplicates_total": (
+        "counter",
+        "Redelivered readings dropped by device and ltr_DATA.",
+    ),
+    "ingest_writer_dropped_total": (
+        "counter",
+        "Readings a writer dropped because flushes kept failing.",
+    ),
+    "ingest_errors_total": (
+        "counter",
+        "Ingest errors by type: KeyError, decode or database.",
+    ),
+    "ingest_queue_depth": (
+        "gauge",
+        "Messages waiting in each shard's ingest queue, in memory and spilled.",
+    ),
+    "ingest_writer_pending": ("gauge", "Readings buffered but not committed yet."),
+    "ingest_lag_seconds": (
+        "histogram",
+        "Time from a reading's ltr_DATA to the commit that stored it.",
+    ),
+}
+
+_COLLECTORS = []
+_COLLECTORS_LOCK = threading.Lock()
+
+
+class Histogram:
+    """Prometheus-style histogram, observed a batch of values at a time."""
+
+    def __init__(self, buckets=LAG_BUCKETS):
+        self.buckets = numpy.asarray(buckets, dtype=numpy.float64)
+        self._counts = numpy.zeros(len(self.buckets) + 1, dtype=numpy.int64)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe_many(self, values):
+        values = numpy.asarray(values, dtype=numpy.float64)
+        # Index of the first bucket whose bound is >= the value (le semantics)
+        counts = numpy.bincount(
+            numpy.searchsorted(self.buckets, values), minlength=len(self._counts)
+        )
+        with self._lock:
+            self._counts += counts
+            self._sum += float(values.sum())
+
+    def samples(self, name, labels=None):
+        labels = labels or {}
+        with self._lock:
+            counts, total = numpy.cumsum(self._counts), self._sum
+        bounds = [_format_value(bound) for bound in self.buckets] + ["+Inf"]
+        samples = [
+            (f"{name}_bucket", {**labels, "le": bound}, int(count))
+            for bound, count in zip(bounds, counts)
+        ]
+        samples.append((f"{name}_sum", labels, total))
+        samples.append((f"{name}_count", labels, int(counts[-1])))
+        return samples
+
+
+def register(collector):
+    """Report `collector()` in every export for the rest of the process.
+
+    It returns `(family, samples)` pairs, `family` a key of FAMILIES and
+    `samples` a list of `(sample name, labels, value)`. Collectors are never
+    removed, so counters keep growing when a writer or pipeline is replaced.
+    """
+    with _COLLECTORS_LOCK:
+        _COLLECTORS.append(collector)
+
+
+def collect():
+    """`{family: (type, help, {(sample, labels): value})}` of all collectors.
+
+    Samples with the same name and labels from different collectors (e.g.
+    several writers) are added up.
+    """
+    with _COLLECTORS_LOCK:
+        collectors = list(_COLLECTORS)
+    families = {}
+    for collector in collectors:
+        for name, samples in collector():
+            kind, help_text = FAMILIES[name]
+            values = families.setdefault(name, (kind, help_text, {}))[2]
+            for sample, labels, value in samples:
+                key = (sample, tuple(sorted(labels.items())))
+                values[key] = values.get(key, 0) + value
+    return families
+
+
+def _format_value(value):
+    return repr(float(value)) if value % 1 else str(int(value))
+
+
+def render(families=None):
+    """Prometheus text format of `families` (default: `collect()`)."""
+    lines = []
+    for name, (kind, help_text, samples) in sorted((families or collect()).items()):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for (sample, labels), value in samples.items():
+            label_text = ",".join(f'{key}="{label}"' for key, label in labels)
+            label_text = f"{{{label_text}}}" if label_text else ""
+            lines.append(f"{sample}{label_text} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def parse_metrics(text):
+    """Return `{(sample name, labels tuple): value}` from Prometheus text."""
+    samples = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        sample, value = line.rsplit(" ", 1)
+        labels = ()
+        if "{" in sample:
+            sample, label_text = sample[:-1].split("{", 1)
+            labels = tuple(
+                tuple(pair.split("=", 1)) for pair in label_text.split(",") if pair
+            )
+            labels = tuple((key, value.strip('"')) for key, value in labels)
+        samples[(sample, labels)] = float(value)
+    return samples
+
+
+def read_metrics(path=METRICS_PATH):
+    """Parsed metrics file and its age in seconds, or (None, None) if absent."""
+    try:
+        with open(path, "r") as metrics_file:
+            text = metrics_file.read()
+        age = time.time() - os.path.getmtime(path)
+    except FileNotFoundError:
+        return None, None
+    return parse_metrics(text), age
+
+
+def histogram_quantile(samples, name, quantile):
+    """Estimate a quantile from `name`'s buckets in `parse_metrics` output,
+    interpolating linearly within a bucket like Prometheus does."""
+    buckets = sorted(
+        (float(dict(labels)["le"]), count)
+        for (sample, labels), count in samples.items()
+        if sample == f"{name}_bucket"
+    )
+    if not buckets or buckets[-1][1] == 0:
+        return None
+    rank = quantile * buckets[-1][1]
+    lower, below = 0.0, 0
+    for bound, count in buckets:
+        if count >= rank:
+            if bound == float("inf"):
+                return lower
+            return lower + (bound - lower) * (rank - below) / max(count - below, 1)
+        lower, below = bound, count
+    return lower
+
+
+class MetricsExporter:
+    """Writes `render()` to `path` every `interval` seconds.
+
+    The file is replaced atomically, so the dashboard or node_exporter's
+    textfile collector never read half of it. Every counter `X_total` also
+    gets a gauge `X_per_second`: its rate since the previous write. With a
+    `port`, the last rendering is served over HTTP as well.
+    """
+
+    def __init__(self, path=METRICS_PATH, interval=METRICS_INTERVAL, port=METRICS_PORT):
+        self.path = path
+        self.interval = interval
+        self.port = port
+        self.text = ""
+        self._previous = None  # (time, counter samples) of the last write
+        self._stop = threading.Event()
+        self._thread = None
+        self._server = None
+
+    def start(self):
+        self.write()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        if self.port:
+            self._server = http.server.ThreadingHTTPServer(
+                ("", self.port), _handler(self)
+            )
+            threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def write(self):
+        now = time.monotonic()
+        families = collect()
+        counters = {
+            name: samples
+            for name, (kind, _, samples) in families.items()
+            if kind == "counter"
+        }
+        if self._previous is not None:
+            seconds = max(now - self._previous[0], 1e-9)
+            for name, samples in counters.items():
+                before = self._previous[1].get(name, {})
+                rates = {
+                    (sample.replace("_total", "_per_second"), labels): (
+                        value - before.get((sample, labels), 0)
+                    )
+                    / seconds
+                    for (sample, labels), value in samples.items()
+                }
+                rate_name = name.replace("_total", "_per_second")
+                families[rate_name] = ("gauge", f"Rate of {name}.", rates)
+        self._previous = (
+            now,
+            {name: dict(samples) for name, samples in counters.items()},
+        )
+
+        self.text = render(families)
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w") as metrics_file:
+            metrics_file.write(self.text)
+        os.replace(temporary, self.path)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.write()
+            except Exception as e:
+                print(f"Error writing metrics: {e}")
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self._server is not None:
+            self._server.shutdown()
+        self.write()
+
+
+def _handler(exporter):
+    class MetricsHandler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = exporter.text.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return MetricsHandler
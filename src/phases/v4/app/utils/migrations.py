@@ -0,0 +1,82 @@
+import os
+import re
+import sqlite3
+
+MIGRATIONS_PATH = "./database/migrations"
+MIGRATION_FILE = re.compile(r"^(\d+)_(\w+)\.sql$")
+
+
+def list_migrations(path=MIGRATIONS_PATH):
+    """Return `(version, name, file_path)` for every migration, oldest first."""
+    migrations = []
+    for file_name in os.listdir(path):
+        match = MIGRATION_FILE.match(file_name)
+        if match:
+            migrations.append(
+                (int(match.group(1)), match.group(2), os.path.join(path, file_name))
+            )
+    return sorted(migrations)
+
+
+def split_statements(sql_script):
+    """Split a script into statements, keeping trigger bodies together."""
+    statements, current = [], ""
+    for line in sql_script.splitlines(keepends=True):
+        current += line
+        if sqlite3.complete_statement(current):
+            statement = current.strip()
+            if statement and not all(
+                part.strip().startswith("--") or not part.strip()
+                for part in statement.splitlines()
+            ):
+                statements.append(statement)
+            current = ""
+    return statements
+
+
+def current_version(connection):
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+          version INTEGER PRIMARY KEY,
+          name TEXT NOT NULL,
+          applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """)
+    return (
+        connection.execute("SELECT MAX(version) FROM schema_version").fetchone()[0] or 0
+    )
+
+
+def migrate(connection, path=MIGRATIONS_PATH):
+    """Apply every migration newer than the database's schema_version.
+
+    Each migration runs in its own IMMEDIATE transaction, so a failing
+    migration leaves the database at the previous version and two processes
+    starting together do not apply the same migration twice.
+    """
+    applied = []
+    for version, name, file_path in list_migrations(path):
+        with open(file_path, "r") as sql_file:
+            statements = split_statements(sql_file.read())
+
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            if version <= current_version(connection):
+                connection.rollback()
+                continue
+
+            for statement in statements:
+                connection.execute(statement)
+            connection.execute(
+                "INSERT INTO schema_version (version, name) VALUES (?, ?)",
+                (version, name),
+            )
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+
+        applied.append(version)
+        print(f"Applied migration {version:04d}_{name}")
+
+    return applied
@@ -1,14 +1,48 @@
 import paho.mqtt.client as mqtt
-import json
+import os
 import random
+import sys
 import time
 from datetime import datetime
-from database import save_sensor_data
+
+# Allow running as `python app/utils/mqtt.py` while importing from the app root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import database
+from utils.batch_writer import BatchWriter
+from utils.export import export_sensor_data
+from utils.ingest import INGEST_WORKERS, IngestPipeline
+from utils.metrics import MetricsExporter
+from utils.payload import encode_payload
 
 BROKER = "test.mosquitto.org"
-TOPIC = "home/events"
+# Every device publishes to its own topic; the wildcard level is the device ID
+TOPIC = "farm/+/sensors"
+DEVICE_TOPIC = "farm/{device}/sensors"
+# Sent with every simulated reading; with ltr_DATA it identifies the reading
+DEVICE_ID = "esp32-simulado"
 CONNECTED = False
 PORT = 1883
+# Format of the simulated readings: "json" or the compact "binary"
+# (utils/payload.py); the ingest side accepts both
+PAYLOAD_FORMAT = os.getenv("MQTT_PAYLOAD_FORMAT", "json")
+# Seconds between simulated readings
+READING_INTERVAL = 10
+# Readings per message: a batch is published once it holds MQTT_BATCH_SIZE
+# readings or its oldest reading is MQTT_BATCH_SECONDS old, whichever is first
+BATCH_SIZE = int(os.getenv("MQTT_BATCH_SIZE", "1"))
+BATCH_SECONDS = float(os.getenv("MQTT_BATCH_SECONDS", "60"))
+
+# Readings are group-committed; see batch_writer.DURABILITY for the loss bound.
+# The CSV export is appended to after each commit instead of on every read.
+# One writer per ingest worker (INGEST_WORKERS); devices are sharded across them.
+SENSOR_WRITERS = [
+    BatchWriter(durability="balanced", on_flush=lambda rows: export_sensor_data())
+    for _ in range(INGEST_WORKERS)
+]
+# The network thread only queues payloads; worker threads decode and write them
+# (INGEST_POLICY picks the backpressure policy)
+INGEST_PIPELINE = IngestPipeline(SENSOR_WRITERS, TOPIC)
 
 
 def generate_fake_data():
@@ -20,6 +54,7 @@ def generate_fake_data():
         "ltr_NUTRIENTE_K": random.choice([0, 1]),
         "ltr_STATUS_IRRIGACAO": random.choice([0, 1]),
         "ltr_DATA": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"),
+        "ltr_DISPOSITIVO": DEVICE_ID,
     }
 
 
@@ -28,29 +63,27 @@ def on_connect(client, userdata, flags, rc):
     if rc == 0:
         CONNECTED = True
         print(f"Connected to MQTT Broker: {BROKER}")
+        client.subscribe(TOPIC)
     else:
         print(f"Failed to connect, return code {rc}")
 
 
 def on_message(client, userdata, msg):
-    try:
-        payload = json.loads(msg.payload.decode("utf-8"))
-        humidity = payload["ltr_UMIDADE"]
-        temperature = payload["ltr_TEMPERATURA"]
-        ph = payload["ltr_PH"]
-        nutrient_p = payload["ltr_NUTRIENTE_P"]
-        nutrient_k = payload["ltr_NUTRIENTE_K"]
-        irrigation_status = payload["ltr_STATUS_IRRIGACAO"]
+    INGEST_PIPELINE.submit(msg.topic, msg.payload)
 
-        save_sensor_data(
-            humidity, temperature, ph, nutrient_p, nutrient_k, irrigation_status
-        )
-        print(f"Data received and saved: {payload}")
 
-    except KeyError as e:
-        print(f"Missing field in payload: {e}")
-    except Exception as e:
-        print(f"Error processing message: {e}")
+def publish_batch(client, batch):
+    """Publish the buffered readings as one message (a single reading keeps
+    the one-reading payload) and empty the buffer."""
+    if not batch:
+        return None
+    readings = batch[0] if len(batch) == 1 else list(batch)
+    info = client.publish(
+        DEVICE_TOPIC.format(device=DEVICE_ID), encode_payload(readings, PAYLOAD_FORMAT)
+    )
+    print(f"Published {len(batch)} reading(s): {readings}")
+    batch.clear()
+    return info
 
 
 def main():
@@ -59,23 +92,48 @@ def main():
     # Initialize the MQTT client
     client = mqtt.Client()
     client.on_connect = on_connect
+    client.on_message = on_message
     client.connect(BROKER, PORT)
     client.loop_start()
+    # Prometheus text file read by the dashboard (METRICS_PATH, METRICS_PORT)
+    exporter = MetricsExporter().start()
+    # The ingest process owns compaction of the columnar store
+    if database.SENSOR_STORAGE == "columnar":
+        database.get_columnar_store().start_compaction()
+    batch = []
 
     try:
         while not CONNECTED:
             print("Waiting for connection...")
             time.sleep(1)
 
+        oldest = None
+        next_reading = time.monotonic()
         while True:
-            fake_data = generate_fake_data()
-            client.publish(TOPIC, json.dumps(fake_data))
-            print(f"Published fake data: {fake_data}")
-            time.sleep(10)
+            now = time.monotonic()
+            if now >= next_reading:
+                if not batch:
+                    oldest = now
+                batch.append(generate_fake_data())
+                next_reading += READING_INTERVAL
+            if batch and (len(batch) >= BATCH_SIZE or now - oldest >= BATCH_SECONDS):
+                publish_batch(client, batch)
+            wake = next_reading
+            if batch:
+                wake = min(wake, oldest + BATCH_SECONDS)
+            time.sleep(max(wake - time.monotonic(), 0))
 
     except KeyboardInterrupt:
         print("Disconnected!")
+        # Readings still buffered are sent before disconnecting
+        info = publish_batch(client, batch)
+        if info is not None:
+            info.wait_for_publish(5)
         client.loop_stop()
+        INGEST_PIPELINE.close()
+        for writer in SENSOR_WRITERS:
+            writer.close()
+        exporter.close()
 
 
 if __name__ == "__main__":
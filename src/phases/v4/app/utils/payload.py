@@ -0,0 +1,294 @@
+import calendar
+import json
+import math
+import struct
+import time
+from datetime import datetime
+import numpy
+from utils.query import format_timestamp
+
+VALUE_FIELDS = ("ltr_UMIDADE", "ltr_TEMPERATURA", "ltr_PH")
+FLAG_FIELDS = ("ltr_NUTRIENTE_P", "ltr_NUTRIENTE_K", "ltr_STATUS_IRRIGACAO")
+FORMATS = ("json", "binary")
+
+# Binary payloads start with 0x80 | version. JSON text never starts with a
+# byte >= 0x80, so the first byte tells the two formats apart.
+BINARY_VERSION = 1
+BINARY_BATCH_VERSION = 2
+BINARY_FLAG = 0x80
+# Header, ltr_DATA (epoch seconds, 0 = unknown), humidity, temperature and
+# pH in hundredths, P/K/irrigation bits, device ID length; the device ID
+# (UTF-8, may be empty) follows
+BINARY_READING = struct.Struct("<BIHhHBB")
+# Batch of one device's readings: header, readings, device ID length; the
+# device ID follows, then one column per field with the BINARY_READING
+# encodings: ltr_DATA, humidity, temperature, pH and flags
+BINARY_BATCH = struct.Struct("<BHB")
+BATCH_COLUMNS = ("<u4", "<u2", "<i2", "<u2", "u1")
+MAX_BATCH_READINGS = 65535
+MAX_DEVICE_BYTES = 255
+SCALE = 100
+# Scale and limits of the encoded ltr_DATA and values, from BATCH_COLUMNS
+RANGES = {
+    field: (scale, int(numpy.iinfo(dtype).min), int(numpy.iinfo(dtype).max))
+    for field, scale, dtype in zip(
+        ("ltr_DATA", *VALUE_FIELDS), (1, SCALE, SCALE, SCALE), BATCH_COLUMNS
+    )
+}
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def is_binary(payload):
+    return len(payload) > 0 and payload[0] & BINARY_FLAG
+
+
+def _format_timestamp(value):
+    # Readings normally arrive formatted already; checking that is much
+    # cheaper than parsing them again with pandas
+    if isinstance(value, str) and len(value) == 19 and value[10] == " ":
+        try:
+            datetime.fromisoformat(value)
+            return value
+        except ValueError:
+            pass
+    return format_timestamp(value)
+
+
+def _epoch(timestamp):
+    """Epoch seconds of a UTC ltr_DATA, 0 when it is missing."""
+    if timestamp is None:
+        return 0
+    timestamp = _format_timestamp(timestamp)
+    return calendar.timegm(time.strptime(timestamp, TIMESTAMP_FORMAT))
+
+
+def _flags(reading):
+    """P/K/irrigation bits of a reading; raises ValueError for a flag that is
+    not 0 or 1 instead of keeping only its low bit."""
+    flags = 0
+    for bit, field in enumerate(FLAG_FIELDS):
+        if reading[field] not in (0, 1):
+            raise ValueError(f"{field} {reading[field]!r} should be 0 or 1")
+        flags |= int(reading[field]) << bit
+    return flags
+
+
+def _device(readings):
+    devices = {reading.get("ltr_DISPOSITIVO", "") for reading in readings}
+    if len(devices) > 1:
+        raise ValueError("A binary batch holds the readings of a single device")
+    device = (devices.pop() if devices else "").encode("utf-8")
+    if len(device) > MAX_DEVICE_BYTES:
+        raise ValueError(
+            f"ltr_DISPOSITIVO takes {len(device)} bytes, "
+            f"binary payloads hold at most {MAX_DEVICE_BYTES}"
+        )
+    return device
+
+
+def _range_error(field, value):
+    scale, low, high = RANGES[field]
+    return ValueError(
+        f"{field} {value / scale} is out of the binary payload range "
+        f"[{low / scale}, {high / scale}]"
+    )
+
+
+def _encoded_values(reading):
+    """ltr_DATA seconds and the scaled values of a reading, as packed in
+    BINARY_READING. Raises ValueError when a value does not fit its field."""
+    values = [_epoch(reading.get("ltr_DATA"))]
+    for field in VALUE_FIELDS:
+        value = reading[field] * SCALE
+        values.append(round(value) if math.isfinite(value) else value)
+    for field, value in zip(RANGES, values):
+        _, low, high = RANGES[field]
+        # NaN fails both comparisons too
+        if not low <= value <= high:
+            raise _range_error(field, value)
+    return values
+
+
+def _encoded_columns(readings):
+    """`_encoded_values` of a batch, one array per field, checked before the
+    cast to BATCH_COLUMNS so out-of-range values are not wrapped around."""
+    columns = [numpy.array([_epoch(reading.get("ltr_DATA")) for reading in readings])]
+    for field in VALUE_FIELDS:
+        values = numpy.array([reading[field] for reading in readings], numpy.float64)
+        columns.append(numpy.round(values * SCALE))
+    for field, values in zip(RANGES, columns):
+        _, low, high = RANGES[field]
+        fits = (values >= low) & (values <= high)
+        if not fits.all():
+            raise _range_error(field, values[~fits][0])
+    return columns
+
+
+def encode_json(readings):
+    """A reading dict as a JSON object, or a list of them as an array."""
+    return json.dumps(readings).encode("utf-8")
+
+
+def encode_binary(reading):
+    """Pack a reading dict (the JSON fields) into BINARY_READING.
+
+    Values are stored to two decimals, like the sensors report them.
+    ltr_DISPOSITIVO is optional; without it the topic names the device.
+    Raises ValueError for a value or device ID that does not fit its field.
+    """
+    device = _device([reading])
+    seconds, *values = _encoded_values(reading)
+    return (
+        BINARY_READING.pack(
+            BINARY_FLAG | BINARY_VERSION,
+            seconds,
+            *values,
+            _flags(reading),
+            len(device),
+        )
+        + device
+    )
+
+
+def encode_binary_batch(readings):
+    """Pack the readings of one device into a BINARY_BATCH block. Raises
+    ValueError like `encode_binary` and for readings it cannot batch."""
+    device = _device(readings)
+    if len(readings) > MAX_BATCH_READINGS:
+        raise ValueError(f"A binary batch holds at most {MAX_BATCH_READINGS} readings")
+    if len(readings) > 1 and any(
+        reading.get("ltr_DATA") is None for reading in readings
+    ):
+        raise ValueError("Every reading of a batch needs its ltr_DATA")
+    columns = _encoded_columns(readings)
+    columns.append([_flags(reading) for reading in readings])
+    return b"".join(
+        [
+            BINARY_BATCH.pack(
+                BINARY_FLAG | BINARY_BATCH_VERSION, len(readings), len(device)
+            )
+        ]
+        + [device]
+        + [
+            numpy.asarray(column).astype(dtype).tobytes()
+            for column, dtype in zip(columns, BATCH_COLUMNS)
+        ]
+    )
+
+
+def encode_payload(readings, payload_format="json"):
+    """Encode a reading dict, or a list of them as one batch message."""
+    if payload_format not in FORMATS:
+        raise ValueError(
+            f"Unknown payload format '{payload_format}', expected one of {FORMATS}"
+        )
+    if payload_format == "json":
+        return encode_json(readings)
+    if isinstance(readings, dict):
+        return encode_binary(readings)
+    return encode_binary_batch(readings)
+
+
+def _json_reading(data):
+    if not isinstance(data, dict):
+        raise ValueError(f"Expected a JSON object, got {type(data).__name__}")
+    timestamp = data.get("ltr_DATA")
+    return (
+        *(float(data[field]) for field in VALUE_FIELDS),
+        *(int(data[field]) for field in FLAG_FIELDS),
+        None if timestamp is None else _format_timestamp(timestamp),
+        data.get("ltr_DISPOSITIVO"),
+    )
+
+
+def decode_json(payload):
+    """`(humidity, temperature, ph, p, k, irrigation, ltr_DATA, device)` of
+    each reading of a JSON object or array of objects, ltr_DATA formatted
+    like tbl_LEITURA; ltr_DATA and device are None when absent.
+
+    Raises KeyError for a missing field and ValueError for invalid JSON or
+    a value of the wrong type, in any reading of the payload.
+    """
+    data = json.loads(payload)
+    if isinstance(data, list):
+        return [_json_reading(reading) for reading in data]
+    return [_json_reading(data)]
+
+
+def decode_binary(payload):
+    """Same tuple as `decode_json` for a single binary reading. Raises
+    ValueError for an unknown version or a truncated payload."""
+    if payload[0] != BINARY_FLAG | BINARY_VERSION:
+        raise ValueError(f"Unsupported binary payload version {payload[0] & 0x7F}")
+    if len(payload) < BINARY_READING.size:
+        raise ValueError(f"Binary payload of {len(payload)} bytes is truncated")
+    _, seconds, humidity, temperature, ph, flags, device_size = (
+        BINARY_READING.unpack_from(payload)
+    )
+    end = BINARY_READING.size + device_size
+    if len(payload) < end:
+        raise ValueError(f"Binary payload of {len(payload)} bytes is truncated")
+    device = bytes(payload[BINARY_READING.size : end]).decode("utf-8") or None
+    timestamp = (
+        time.strftime(TIMESTAMP_FORMAT, time.gmtime(seconds)) if seconds else None
+    )
+    return (
+        humidity / SCALE,
+        temperature / SCALE,
+        ph / SCALE,
+        flags & 1,
+        (flags >> 1) & 1,
+        (flags >> 2) & 1,
+        timestamp,
+        device,
+    )
+
+
+def decode_binary_batch(payload):
+    """`decode_json` tuples of a BINARY_BATCH block, decoded a column at a
+    time."""
+    if len(payload) < BINARY_BATCH.size:
+        raise ValueError(f"Binary payload of {len(payload)} bytes is truncated")
+    _, count, device_size = BINARY_BATCH.unpack_from(payload)
+    offset = BINARY_BATCH.size + device_size
+    size = offset + count * sum(numpy.dtype(dtype).itemsize for dtype in BATCH_COLUMNS)
+    if len(payload) != size:
+        raise ValueError(
+            f"Binary batch of {count} readings should take {size} bytes, "
+            f"got {len(payload)}"
+        )
+    device = bytes(payload[BINARY_BATCH.size : offset]).decode("utf-8") or None
+    columns = []
+    for dtype in BATCH_COLUMNS:
+        column = numpy.frombuffer(payload, dtype, count, offset)
+        offset += column.nbytes
+        columns.append(column)
+    seconds, humidity, temperature, ph, flags = columns
+
+    texts = numpy.datetime_as_string(seconds.astype("datetime64[s]")).tolist()
+    timestamps = [
+        text.replace("T", " ") if second else None
+        for text, second in zip(texts, seconds.tolist())
+    ]
+    return list(
+        zip(
+            (humidity / SCALE).tolist(),
+            (temperature / SCALE).tolist(),
+            (ph / SCALE).tolist(),
+            (flags & 1).tolist(),
+            ((flags >> 1) & 1).tolist(),
+            ((flags >> 2) & 1).tolist(),
+            timestamps,
+            [device] * count,
+        )
+    )
+
+
+def decode_payload(payload):
+    """Decode the readings of a JSON or binary message, told apart by its
+    first byte; returns a list of `decode_json` tuples."""
+    if not is_binary(payload):
+        return decode_json(payload)
+    if payload[0] == BINARY_FLAG | BINARY_BATCH_VERSION:
+        return decode_binary_batch(payload)
+    return [decode_binary(payload)]
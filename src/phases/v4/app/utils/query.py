@@ -0,0 +1,190 @@
+from datetime import datetime
+import pandas
+from utils import database
+from utils.query_cache import cached_read
+
+# Sensor tables of each phase. Column names are validated against these lists
+# before being interpolated into SQL.
+SCHEMAS = {
+    "v4": {
+        "table": "tbl_LEITURA",
+        "id": "ID_LEITURA",
+        "time": "ltr_DATA",
+        "columns": [
+            "ID_LEITURA",
+            "ltr_UMIDADE",
+            "ltr_TEMPERATURA",
+            "ltr_PH",
+            "ltr_NUTRIENTE_P",
+            "ltr_NUTRIENTE_K",
+            "ltr_STATUS_IRRIGACAO",
+            "ltr_DATA",
+        ],
+    },
+    "v3": {
+        "table": "sensor_data",
+        "id": "id",
+        "time": "created_at",
+        "columns": [
+            "id",
+            "humidity",
+            "temperature",
+            "ph",
+            "sensor_p",
+            "sensor_k",
+            "irrigation_status",
+            "created_at",
+        ],
+    },
+}
+
+# Bucket width in seconds; "month" buckets by calendar month
+RESAMPLE_INTERVALS = {
+    "1min": 60,
+    "15min": 900,
+    "1h": 3600,
+    "1d": 86400,
+    "month": None,
+}
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def format_timestamp(value):
+    if isinstance(value, str):
+        return pandas.Timestamp(value).strftime(TIMESTAMP_FORMAT)
+    if isinstance(value, (datetime, pandas.Timestamp)):
+        return value.strftime(TIMESTAMP_FORMAT)
+    raise TypeError(f"Unsupported timestamp {value!r}")
+
+
+def _bucket_expression(time_column, resample):
+    if resample not in RESAMPLE_INTERVALS:
+        raise ValueError(
+            f"Unknown resample interval '{resample}', expected one of {list(RESAMPLE_INTERVALS)}"
+        )
+    seconds = RESAMPLE_INTERVALS[resample]
+    if seconds is None:
+        return f"strftime('%Y-%m-01 00:00:00', {time_column})"
+    return (
+        f"datetime((CAST(strftime('%s', {time_column}) AS INTEGER) / {seconds}) "
+        f"* {seconds}, 'unixepoch')"
+    )
+
+
+def build_sensor_query(
+    columns=None,
+    start=None,
+    end=None,
+    limit=None,
+    offset=None,
+    resample=None,
+    order="desc",
+    schema="v4",
+):
+    """Build the SQL and parameters for `query_sensor_data`."""
+    spec = SCHEMAS[schema]
+    time_column = spec["time"]
+    columns = list(columns or spec["columns"])
+    unknown = [column for column in columns if column not in spec["columns"]]
+    if unknown:
+        raise ValueError(f"Unknown columns for the {schema} schema: {unknown}")
+    if order not in ("asc", "desc"):
+        raise ValueError("order must be 'asc' or 'desc'")
+
+    conditions, params = [], []
+    if start is not None:
+        conditions.append(f"{time_column} >= ?")
+        params.append(format_timestamp(start))
+    if end is not None:
+        conditions.append(f"{time_column} < ?")
+        params.append(format_timestamp(end))
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    if resample is None:
+        query = f"SELECT {', '.join(columns)} FROM {spec['table']}{where} ORDER BY {time_column} {order.upper()}"
+    else:
+        values = [
+            f"AVG({column}) AS {column}"
+            for column in columns
+            if column not in (time_column, spec["id"])
+        ]
+        bucket = _bucket_expression(time_column, resample)
+        query = (
+            f"SELECT {bucket} AS {time_column}, COUNT(*) AS count"
+            f"{''.join(', ' + value for value in values)} "
+            f"FROM {spec['table']}{where} GROUP BY 1 ORDER BY 1 {order.upper()}"
+        )
+
+    if limit is not None or offset is not None:
+        query += " LIMIT ? OFFSET ?"
+        params += [-1 if limit is None else int(limit), int(offset or 0)]
+
+    return query, params
+
+
+def query_sensor_data(
+    columns=None,
+    start=None,
+    end=None,
+    limit=None,
+    offset=None,
+    resample=None,
+    order="desc",
+    schema="v4",
+    connection=None,
+):
+    """Read a time window of sensor readings with filtering pushed into SQL.
+
+    `start` is inclusive and `end` exclusive. `columns` selects a subset of the
+    schema's columns; with `resample` (see RESAMPLE_INTERVALS) rows are
+    averaged per time bucket and a `count` column is added. `connection`
+    queries another database, e.g. the v3 one with `schema="v3"`; by default
+    the v4 database is used and results are cached until tbl_LEITURA changes
+    (shared frames, do not modify them in place). With SENSOR_STORAGE=columnar
+    the v4 readings come from the columnar store, uncached.
+    """
+    query, params = build_sensor_query(
+        columns, start, end, limit, offset, resample, order, schema
+    )
+    time_column = SCHEMAS[schema]["time"]
+    if connection is None and schema == "v4" and database.SENSOR_STORAGE == "columnar":
+        return _query_columnar(columns, start, end, limit, offset, resample, order)
+
+    def load(connection, query, params):
+        data = pandas.read_sql_query(query, connection, params=params)
+        if time_column in data:
+            data[time_column] = pandas.to_datetime(data[time_column])
+        return data
+
+    if connection is None:
+        return cached_read(query, params, (SCHEMAS[schema]["table"],), load)
+    return load(connection, query, params)
+
+
+def _query_columnar(columns, start, end, limit, offset, resample, order):
+    """`query_sensor_data` over the columnar store, with the SQL steps done
+    by pandas."""
+    spec = SCHEMAS["v4"]
+    time_column = spec["time"]
+    columns = list(columns or spec["columns"])
+    data = database.get_columnar_store().fetch_sensor_data(columns, start, end)
+    if resample is not None:
+        seconds = RESAMPLE_INTERVALS[resample]
+        times = data[time_column]
+        if seconds is None:
+            buckets = times.dt.to_period("M").dt.start_time
+        else:
+            buckets = times.dt.floor(f"{seconds}s")
+        values = [
+            column for column in columns if column not in (time_column, spec["id"])
+        ]
+        grouped = data.groupby(buckets.rename(time_column))
+        data = pandas.concat(
+            [grouped.size().rename("count"), grouped[values].mean()], axis=1
+        ).reset_index()
+        columns = list(data.columns)
+    data = data.sort_values(time_column, ascending=order == "asc", kind="stable")
+    data = data.loc[:, columns]
+    first = int(offset or 0)
+    last = None if limit is None else first + int(limit)
+    return data.iloc[first:last].reset_index(drop=True)
@@ -0,0 +1,128 @@
+import sys
+import threading
+from collections import OrderedDict
+import pandas
+from utils.database import connect_read
+
+MAX_BYTES = 256 * 2**20
+MAX_ENTRIES = 128
+
+
+def result_bytes(value):
+    """Approximate memory held by a cached result."""
+    if isinstance(value, pandas.DataFrame):
+        return int(value.memory_usage(deep=True, index=True).sum())
+    if isinstance(value, pandas.Series):
+        return int(value.memory_usage(deep=True, index=True))
+    return sys.getsizeof(value)
+
+
+class QueryCache:
+    """Process-wide LRU of query results, bounded by entries and bytes.
+
+    Keys include the data version of the tables a query reads (see
+    `table_versions`), so entries are never invalidated explicitly: once a
+    table changes, lookups use a new key and the old entries age out. Cached
+    frames are shared between callers, who must not modify them in place.
+    """
+
+    def __init__(self, max_bytes=MAX_BYTES, max_entries=MAX_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (value, bytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size=None):
+        size = result_bytes(value) if size is None else size
+        if size > self.max_bytes:
+            return  # would evict everything else
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes or len(self._entries) > self.max_entries:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+
+QUERY_CACHE = QueryCache()
+
+
+def normalize_sql(sql):
+    """Collapse whitespace so formatting differences share one cache entry."""
+    return " ".join(sql.split())
+
+
+def table_versions(connection, tables):
+    """Return the change counters (migration 0004) of `tables` as a tuple."""
+    placeholders = ", ".join("?" for _ in tables)
+    versions = dict(
+        connection.execute(
+            f"SELECT ver_TABELA, ver_CONTADOR FROM tbl_VERSAO WHERE ver_TABELA IN ({placeholders})",
+            tuple(tables),
+        ).fetchall()
+    )
+    return tuple(versions.get(table) for table in tables)
+
+
+def bump_version(connection, table):
+    """Mark `table` as changed, for writes that bypass its triggers."""
+    connection.execute(
+        "UPDATE tbl_VERSAO SET ver_CONTADOR = ver_CONTADOR + 1 WHERE ver_TABELA = ?",
+        (table,),
+    )
+
+
+def cached_read(sql, params=(), tables=("tbl_LEITURA",), load=None, cache=QUERY_CACHE):
+    """Return the result of a read query, from the cache while `tables` are unchanged.
+
+    `load(connection, sql, params)` produces the result on a miss; it
+    defaults to `pandas.read_sql_query`. The version check is a single
+    primary-key lookup, so a hit costs microseconds regardless of the
+    result size.
+    """
+    with connect_read() as connection:
+        # Versions and data come from the same read transaction
+        connection.execute("BEGIN")
+        key = (normalize_sql(sql), tuple(params), table_versions(connection, tables))
+        result = cache.get(key)
+        if result is not None:
+            return result
+        if load is None:
+            result = pandas.read_sql_query(sql, connection, params=params)
+        else:
+            result = load(connection, sql, params)
+    cache.put(key, result)
+    return result
@@ -0,0 +1,264 @@
+import numpy
+import pandas
+from utils import database
+from utils.query import RESAMPLE_INTERVALS, format_timestamp
+
+DEVICE_COLUMN = "ltr_DISPOSITIVO"
+TIME_COLUMN = "ltr_DATA"
+VALUE_COLUMNS = [
+    "ltr_UMIDADE",
+    "ltr_TEMPERATURA",
+    "ltr_PH",
+    "ltr_NUTRIENTE_P",
+    "ltr_NUTRIENTE_K",
+    "ltr_STATUS_IRRIGACAO",
+]
+AGGREGATIONS = ("mean", "min", "max", "sum", "first", "last")
+FILLS = (None, "ffill", "linear")
+# Longest stretch without readings that forward fill or interpolation bridge
+MAX_GAP = 3600
+# Time covered by each chunk read from storage
+WINDOW_SECONDS = 86400
+
+
+def _step_seconds(step):
+    seconds = RESAMPLE_INTERVALS.get(step)
+    if seconds is None:
+        fixed = [name for name, width in RESAMPLE_INTERVALS.items() if width]
+        raise ValueError(f"Unknown grid step '{step}', expected one of {fixed}")
+    return seconds
+
+
+def _per_column(option, columns, allowed, name):
+    options = option if isinstance(option, dict) else dict.fromkeys(columns, option)
+    for column in columns:
+        if options.get(column) not in allowed:
+            raise ValueError(f"Unknown {name} {options.get(column)!r} for {column}")
+    return options
+
+
+def _aggregate(values, starts, counts, ends, aggregation):
+    """Reduce sorted `values` over the groups starting at `starts`."""
+    if aggregation == "mean":
+        return numpy.add.reduceat(values, starts) / counts
+    if aggregation == "sum":
+        return numpy.add.reduceat(values, starts)
+    if aggregation == "min":
+        return numpy.minimum.reduceat(values, starts)
+    if aggregation == "max":
+        return numpy.maximum.reduceat(values, starts)
+    return values[starts] if aggregation == "first" else values[ends]
+
+
+def _fill(grid, observed, method, limit):
+    """Fill the NaN buckets of a (devices, buckets) grid along each row.
+
+    Forward fill reaches at most `limit` buckets past an observed bucket;
+    linear interpolation only bridges gaps of at most `limit` buckets.
+    """
+    positions = numpy.arange(grid.shape[1])
+    previous = numpy.maximum.accumulate(numpy.where(observed, positions, -1), axis=1)
+    rows = numpy.arange(grid.shape[0])[:, None]
+    before = grid[rows, numpy.maximum(previous, 0)]
+    if method == "ffill":
+        usable = (previous >= 0) & (positions - previous <= limit)
+        return numpy.where(observed | ~usable, grid, before)
+
+    following = numpy.minimum.accumulate(
+        numpy.where(observed, positions, grid.shape[1])[:, ::-1], axis=1
+    )[:, ::-1]
+    after = grid[rows, numpy.minimum(following, grid.shape[1] - 1)]
+    usable = (
+        (previous >= 0) & (following < grid.shape[1]) & (following - previous <= limit)
+    )
+    span = numpy.maximum(following - previous, 1)
+    interpolated = before + (after - before) * (positions - previous) / span
+    return numpy.where(observed | ~usable, grid, interpolated)
+
+
+def resample_frame(
+    rows,
+    step="15min",
+    columns=None,
+    aggregation="mean",
+    fill=None,
+    max_gap=MAX_GAP,
+    start=None,
+    end=None,
+    by_device=True,
+):
+    """Align readings to a fixed grid of `step` buckets, per device.
+
+    Returns one row per device and bucket in [start, end) (default: the
+    buckets the readings cover) with the bucket start in ltr_DATA, each value
+    column reduced by `aggregation`, `count` (readings in the bucket) and
+    `observed`, the coverage mask. Empty buckets are left NaN, or filled by
+    `fill` ("ffill" or "linear") when the gap around them is at most
+    `max_gap` seconds. `aggregation` and `fill` also accept a dict per
+    column. With `by_device=False` all readings form one series.
+    """
+    seconds = _step_seconds(step)
+    columns = list(columns or [column for column in VALUE_COLUMNS if column in rows])
+    aggregations = _per_column(aggregation, columns, AGGREGATIONS, "aggregation")
+    fills = _per_column(fill, columns, FILLS, "fill")
+
+    times = rows[TIME_COLUMN]
+    if not pandas.api.types.is_datetime64_dtype(times):
+        times = pandas.to_datetime(times)
+    epoch = times.to_numpy("datetime64[s]").astype(numpy.int64)
+    if len(epoch) == 0:
+        return pandas.DataFrame(
+            columns=["device", TIME_COLUMN] + columns + ["count", "observed"]
+        )
+    first = (
+        epoch.min() // seconds
+        if start is None
+        else pandas.Timestamp(start).timestamp() // seconds
+    )
+    last = (
+        epoch.max() // seconds + 1
+        if end is None
+        else -(-pandas.Timestamp(end).timestamp() // seconds)
+    )
+    first, buckets = int(first), max(int(last - first), 0)
+
+    if by_device and DEVICE_COLUMN in rows and rows[DEVICE_COLUMN].notna().any():
+        codes, names = pandas.factorize(rows[DEVICE_COLUMN], use_na_sentinel=False)
+        names = names.to_series().fillna("").astype(str).to_numpy(object)
+    else:
+        codes = numpy.zeros(len(rows), dtype=numpy.intp)
+        names = numpy.array([""], dtype=object)
+
+    bucket = epoch // seconds - first
+    inside = (bucket >= 0) & (bucket < buckets)
+    keys = codes[inside] * buckets + bucket[inside]
+    # Time order within each bucket, for "first"/"last": readings usually
+    # arrive newest first
+    order = numpy.lexsort((epoch[inside], keys))
+    keys = keys[order]
+    unique_keys, starts, counts = numpy.unique(
+        keys, return_index=True, return_counts=True
+    )
+    ends = starts + counts - 1
+
+    shape = (len(names), buckets)
+    count = numpy.zeros(shape, dtype=numpy.int64)
+    count.flat[unique_keys] = counts
+    observed = count > 0
+    limit = max_gap // seconds
+
+    data = {
+        "device": numpy.repeat(names, buckets),
+        TIME_COLUMN: numpy.tile(
+            ((first + numpy.arange(buckets)) * seconds).astype("datetime64[s]"),
+            len(names),
+        ),
+    }
+    for column in columns:
+        values = rows[column].to_numpy(numpy.float64)[inside][order]
+        grid = numpy.full(shape, numpy.nan)
+        if len(values):
+            grid.flat[unique_keys] = _aggregate(
+                values, starts, counts, ends, aggregations[column]
+            )
+        if fills[column] is not None:
+            grid = _fill(grid, observed, fills[column], limit)
+        data[column] = grid.ravel()
+    data["count"] = count.ravel()
+    data["observed"] = observed.ravel()
+    return pandas.DataFrame(data)
+
+
+def _read_window(start, end, columns):
+    if database.SENSOR_STORAGE == "columnar":
+        store = database.get_columnar_store()
+        return store.fetch_sensor_data(columns, start, end)
+    with database.connect_read() as connection:
+        names = [row[1] for row in connection.execute("PRAGMA table_info(tbl_LEITURA)")]
+        selected = [TIME_COLUMN] + columns
+        if DEVICE_COLUMN in names:
+            selected.append(DEVICE_COLUMN)
+        return pandas.read_sql_query(
+            f"""
+            SELECT {', '.join(selected)} FROM tbl_LEITURA
+            WHERE ltr_DATA >= ? AND ltr_DATA < ?
+            ORDER BY ltr_DATA
+            """,
+            connection,
+            params=(format_timestamp(start), format_timestamp(end)),
+        )
+
+
+def _time_range():
+    if database.SENSOR_STORAGE == "columnar":
+        data = database.get_columnar_store().fetch_sensor_data([TIME_COLUMN])
+        if len(data) == 0:
+            return None, None
+        return data[TIME_COLUMN].min(), data[TIME_COLUMN].max()
+    with database.connect_read() as connection:
+        first, last = connection.execute(
+            "SELECT MIN(ltr_DATA), MAX(ltr_DATA) FROM tbl_LEITURA"
+        ).fetchone()
+    if first is None:
+        return None, None
+    return pandas.Timestamp(first), pandas.Timestamp(last)
+
+
+def iter_resampled(
+    step="15min",
+    columns=None,
+    aggregation="mean",
+    fill=None,
+    max_gap=MAX_GAP,
+    start=None,
+    end=None,
+    by_device=True,
+    window=WINDOW_SECONDS,
+):
+    """Yield `resample_frame` results window by window over tbl_LEITURA.
+
+    Each window of `window` seconds is read with `max_gap` seconds of margin
+    on both sides, enough for the fills of its buckets, so memory stays
+    bounded by one window however long the history is. Devices are listed in
+    a window when they have readings within it or its margins.
+    """
+    seconds = _step_seconds(step)
+    columns = list(columns or VALUE_COLUMNS)
+    if start is None or end is None:
+        first, last = _time_range()
+        if first is None:
+            return
+        start = first if start is None else start
+        end = last + pandas.Timedelta(seconds=seconds) if end is None else end
+
+    start = pandas.Timestamp(start).floor(f"{seconds}s")
+    end = pandas.Timestamp(end)
+    window = pandas.Timedelta(seconds=max(window // seconds, 1) * seconds)
+    margin = pandas.Timedelta(seconds=-(-max_gap // seconds) * seconds if fill else 0)
+    window_start = start
+    while window_start < end:
+        window_end = min(window_start + window, end)
+        data = resample_frame(
+            _read_window(window_start - margin, window_end + margin, columns),
+            step,
+            columns,
+            aggregation,
+            fill,
+            max_gap,
+            window_start - margin,
+            window_end + margin,
+            by_device,
+        )
+        times = data[TIME_COLUMN]
+        yield data[(times >= window_start) & (times < window_end)].reset_index(
+            drop=True
+        )
+        window_start = window_end
+
+
+def resample_readings(*args, **kwargs):
+    """`iter_resampled` as a single DataFrame."""
+    frames = list(iter_resampled(*args, **kwargs))
+    if not frames:
+        return resample_frame(pandas.DataFrame(columns=[TIME_COLUMN]))
+    return pandas.concat(frames, ignore_index=True)
@@ -0,0 +1,131 @@
+import numpy
+import pandas
+from utils import database
+from utils.database import connect
+from utils.query_cache import bump_version, cached_read
+
+# granularity -> (rollup table, strftime format of its agr_PERIODO key)
+ROLLUPS = {
+    "hour": ("tbl_LEITURA_HORA", "%Y-%m-%d %H:00:00"),
+    "day": ("tbl_LEITURA_DIA", "%Y-%m-%d"),
+    "month": ("tbl_LEITURA_MES", "%Y-%m"),
+}
+# pandas period of each granularity, to aggregate the columnar store
+PERIODS = {"hour": "h", "day": "D", "month": "M"}
+ANALOG_COLUMNS = ["UMIDADE", "TEMPERATURA", "PH"]
+FLAG_COLUMNS = {
+    "ltr_NUTRIENTE_P": "agr_NUTRIENTE_P_QTD",
+    "ltr_NUTRIENTE_K": "agr_NUTRIENTE_K_QTD",
+    "ltr_STATUS_IRRIGACAO": "agr_IRRIGACAO_QTD",
+}
+
+
+def _rollup_select(period_format, where=""):
+    aggregates = [f"strftime('{period_format}', ltr_DATA)", "COUNT(*)"]
+    for column in ANALOG_COLUMNS:
+        aggregates += [
+            f"SUM(ltr_{column})",
+            f"MIN(ltr_{column})",
+            f"MAX(ltr_{column})",
+            f"SUM(ltr_{column} * ltr_{column})",
+        ]
+    aggregates += [f"SUM({column})" for column in FLAG_COLUMNS]
+    return f"SELECT {', '.join(aggregates)} FROM tbl_LEITURA{where} GROUP BY 1"
+
+
+def rebuild_rollups(granularities=None, connection=None, start=None, end=None):
+    """Recompute rollup tables from tbl_LEITURA, e.g. after deletes or bulk loads.
+
+    The insert trigger only handles new rows, so rows that are updated or
+    deleted leave the rollups stale until they are rebuilt. `start`/`end`
+    (ltr_DATA values, both inclusive) limit the rebuild to the periods they
+    touch. `connection` rebuilds another database than the default one.
+    """
+    if connection is None:
+        with connect() as pooled_connection:
+            return rebuild_rollups(granularities, pooled_connection, start, end)
+
+    for granularity in granularities or ROLLUPS:
+        table, period_format = ROLLUPS[granularity]
+        if start is None or end is None:
+            connection.execute(f"DELETE FROM {table}")
+            connection.execute(f"INSERT INTO {table} {_rollup_select(period_format)}")
+            continue
+
+        # Period keys sort like timestamps and never exceed the first
+        # timestamp of their period, so the key of `start` can use the index
+        bounds = (start, end)
+        connection.execute(
+            f"""
+            DELETE FROM {table} WHERE agr_PERIODO
+            BETWEEN strftime('{period_format}', ?) AND strftime('{period_format}', ?)
+            """,
+            bounds,
+        )
+        where = (
+            f" WHERE ltr_DATA >= strftime('{period_format}', ?)"
+            f" AND strftime('{period_format}', ltr_DATA) <= strftime('{period_format}', ?)"
+        )
+        connection.execute(
+            f"INSERT INTO {table} {_rollup_select(period_format, where)}", bounds
+        )
+    # Cached rollups are keyed by the version of tbl_LEITURA
+    bump_version(connection, "tbl_LEITURA")
+    connection.commit()
+
+
+def fetch_rollups(granularity="month"):
+    """Return one row per hour/day/month, oldest first.
+
+    Besides the stored agr_* columns, the frame has per-period means under the
+    tbl_LEITURA column names (the flag means are activation rates), standard
+    deviations as `<column>_DESVIO`, and the period key in a column named
+    after the granularity.
+    """
+    table, period_format = ROLLUPS[granularity]
+    if database.SENSOR_STORAGE == "columnar":
+        # No triggers fill rollup tables for the store, so it is aggregated
+        # when read
+        return _derive_rollup_columns(
+            _columnar_rollup(granularity, period_format), granularity
+        )
+    return cached_read(
+        f"SELECT * FROM {table} ORDER BY agr_PERIODO",
+        load=lambda connection, query, params: _derive_rollup_columns(
+            pandas.read_sql_query(query, connection), granularity
+        ),
+    )
+
+
+def _columnar_rollup(granularity, period_format):
+    """The rollup table rows of `granularity`, computed from the columnar store."""
+    data = database.get_columnar_store().fetch_sensor_data(
+        [f"ltr_{column}" for column in ANALOG_COLUMNS] + list(FLAG_COLUMNS)
+    )
+    periods = data["ltr_DATA"].dt.to_period(PERIODS[granularity])
+    rollup = pandas.DataFrame({"agr_QTD": data.groupby(periods).size()})
+    for column in ANALOG_COLUMNS:
+        values = data[f"ltr_{column}"]
+        grouped = values.groupby(periods)
+        rollup[f"agr_{column}_SOMA"] = grouped.sum()
+        rollup[f"agr_{column}_MIN"] = grouped.min()
+        rollup[f"agr_{column}_MAX"] = grouped.max()
+        rollup[f"agr_{column}_SOMA_QUAD"] = (values * values).groupby(periods).sum()
+    for column, count_column in FLAG_COLUMNS.items():
+        rollup[count_column] = data[column].groupby(periods).sum()
+    rollup = rollup.sort_index()
+    rollup.index = rollup.index.strftime(period_format)
+    return rollup.rename_axis("agr_PERIODO").reset_index()
+
+
+def _derive_rollup_columns(data, granularity):
+    count = data["agr_QTD"]
+    for column in ANALOG_COLUMNS:
+        mean = data[f"agr_{column}_SOMA"] / count
+        variance = data[f"agr_{column}_SOMA_QUAD"] / count - mean**2
+        data[f"ltr_{column}"] = mean
+        data[f"ltr_{column}_DESVIO"] = numpy.sqrt(variance.clip(lower=0))
+    for column, count_column in FLAG_COLUMNS.items():
+        data[column] = data[count_column] / count
+
+    return data.rename(columns={"agr_PERIODO": granularity})
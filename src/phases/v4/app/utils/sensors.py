@@ -0,0 +1,168 @@
+from datetime import datetime
+import pandas
+from utils.database import connect
+from utils.latest import record_sensor_readings
+from utils.query import format_timestamp
+from utils.query_cache import cached_read
+
+# Sensor_Reading columns in insert order. The key columns come first, as in
+# the table's primary key.
+READING_COLUMNS = [
+    "sensor_id",
+    "timestamp",
+    "crop_id",
+    "location_id",
+    "moisture_value",
+    "ph_value",
+    "phosphorus_value",
+    "potassium_value",
+]
+VALUE_COLUMNS = READING_COLUMNS[4:]
+
+
+def _insert(query, params):
+    with connect() as connection:
+        cursor = connection.execute(query, params)
+        connection.commit()
+        return cursor.lastrowid
+
+
+def add_sensor(sensor_type, sensor_id=None):
+    """Register a sensor and return its id (`sensor_id` keeps a device's own id)."""
+    return _insert(
+        "INSERT INTO Sensor (sensor_id, sensor_type) VALUES (?, ?)",
+        (sensor_id, sensor_type),
+    )
+
+
+def add_location(location_name, coordinates):
+    return _insert(
+        "INSERT INTO Location (location_name, coordinates) VALUES (?, ?)",
+        (location_name, coordinates),
+    )
+
+
+def add_crop(crop_name, planting_date):
+    return _insert(
+        "INSERT INTO Crop (crop_name, planting_date) VALUES (?, ?)",
+        (crop_name, format_timestamp(planting_date)),
+    )
+
+
+def add_application(
+    crop_id, water_amount, phosphorus_amount, potassium_amount, timestamp=None
+):
+    timestamp = timestamp or datetime.utcnow()
+    return _insert(
+        """
+        INSERT INTO Application (
+          crop_id, timestamp, water_amount, phosphorus_amount, potassium_amount
+        ) VALUES (?, ?, ?, ?, ?)
+        """,
+        (
+            crop_id,
+            format_timestamp(timestamp),
+            water_amount,
+            phosphorus_amount,
+            potassium_amount,
+        ),
+    )
+
+
+def save_readings(rows):
+    """Insert reading tuples ordered like READING_COLUMNS in one transaction.
+
+    Timestamps must already be `YYYY-MM-DD HH:MM:SS` strings. A second
+    reading of the same sensor at the same timestamp is ignored. Returns the
+    number of rows inserted.
+    """
+    rows = list(rows)
+    placeholders = ", ".join("?" for _ in READING_COLUMNS)
+    with connect() as connection:
+        inserted = connection.executemany(
+            f"""
+            INSERT INTO Sensor_Reading ({', '.join(READING_COLUMNS)})
+            VALUES ({placeholders})
+            ON CONFLICT (sensor_id, timestamp) DO NOTHING
+            """,
+            rows,
+        ).rowcount
+        connection.commit()
+    record_sensor_readings(rows)
+    return inserted
+
+
+def save_reading(
+    sensor_id,
+    crop_id,
+    location_id,
+    moisture_value=None,
+    ph_value=None,
+    phosphorus_value=None,
+    potassium_value=None,
+    timestamp=None,
+):
+    timestamp = format_timestamp(timestamp or datetime.utcnow())
+    return save_readings(
+        [
+            (
+                sensor_id,
+                timestamp,
+                crop_id,
+                location_id,
+                moisture_value,
+                ph_value,
+                phosphorus_value,
+                potassium_value,
+            )
+        ]
+    )
+
+
+def _fetch_readings(key_column, key, start, end, columns):
+    columns = list(columns or VALUE_COLUMNS)
+    unknown = [column for column in columns if column not in READING_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown Sensor_Reading columns: {unknown}")
+    selected = ["timestamp"] + [column for column in columns if column != "timestamp"]
+
+    # The key equality plus a timestamp range is one range scan of the
+    # (key, timestamp) primary key or index; other devices are never read.
+    conditions, params = [f"{key_column} = ?"], [key]
+    if start is not None:
+        conditions.append("timestamp >= ?")
+        params.append(format_timestamp(start))
+    if end is not None:
+        conditions.append("timestamp < ?")
+        params.append(format_timestamp(end))
+
+    def load(connection, query, params):
+        data = pandas.read_sql_query(query, connection, params=params)
+        data["timestamp"] = pandas.to_datetime(data["timestamp"])
+        return data
+
+    return cached_read(
+        f"""
+        SELECT {', '.join(selected)} FROM Sensor_Reading
+        WHERE {' AND '.join(conditions)} ORDER BY timestamp
+        """,
+        params,
+        ("Sensor_Reading",),
+        load,
+    )
+
+
+def fetch_sensor_readings(sensor_id, start=None, end=None, columns=None):
+    """Return one sensor's readings in [start, end), oldest first.
+
+    `columns` defaults to the measured values; `timestamp` is always included.
+    """
+    return _fetch_readings("sensor_id", sensor_id, start, end, columns)
+
+
+def fetch_location_readings(location_id, start=None, end=None, columns=None):
+    """Return the readings of every sensor at a location in [start, end).
+
+    Add `sensor_id` to `columns` to tell the sensors apart.
+    """
+    return _fetch_readings("location_id", location_id, start, end, columns)
@@ -0,0 +1,187 @@
+import atexit
+import os
+import pathlib
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from utils.connection import BUSY_TIMEOUT_MS, POOL_SIZE, ConnectionPool
+
+SNAPSHOT_INTERVAL = 30.0
+
+# Read connections never write, so they skip journal_mode/synchronous and are
+# opened read-only on top of query_only
+READ_PRAGMAS = {
+    "query_only": 1,
+    "cache_size": -64000,
+    "mmap_size": 268435456,
+    "temp_store": "MEMORY",
+    "busy_timeout": BUSY_TIMEOUT_MS,
+}
+
+_SNAPSHOTS = {}
+_SNAPSHOTS_LOCK = threading.Lock()
+
+
+class ReadPool(ConnectionPool):
+    """Read-only connections, kept apart from the write pool.
+
+    Long dashboard queries borrow these, so they can never hold the
+    connections the MQTT client needs to write. In WAL mode each query sees
+    a consistent snapshot of the last commit and does not block writers.
+    `invalidate()` makes borrowed connections reopen the file, for when it
+    is replaced by a newer copy.
+    """
+
+    def __init__(self, db_path, size=POOL_SIZE):
+        super().__init__(db_path, size, READ_PRAGMAS)
+        self.generation = 0
+        self._generations = {}
+
+    def _open(self):
+        uri = pathlib.Path(os.path.abspath(self.db_path)).as_uri() + "?mode=ro"
+        connection = sqlite3.connect(
+            uri, uri=True, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False
+        )
+        for name, value in self.pragmas.items():
+            connection.execute(f"PRAGMA {name}={value}")
+        self._generations[connection] = self.generation
+        return connection
+
+    def acquire(self):
+        connection = super().acquire()
+        if self._generations.get(connection) != self.generation:
+            self._generations.pop(connection, None)
+            connection.close()
+            connection = self._open()
+        return connection
+
+    def release(self, connection):
+        if self._closed:
+            self._generations.pop(connection, None)
+        super().release(connection)
+
+    def invalidate(self):
+        self.generation += 1
+
+
+class BackupSnapshot:
+    """Copy of the database refreshed with the sqlite3 backup API.
+
+    Every `interval` seconds the live database is copied to `snapshot_path`
+    (skipped when nothing was committed since the last copy) and readers are
+    moved to the new copy. Readers never touch the live file, so they cannot
+    delay checkpoints or writes; in exchange their data is at most
+    `interval` seconds plus one copy old.
+    """
+
+    def __init__(self, db_path, snapshot_path, interval=SNAPSHOT_INTERVAL):
+        self.db_path = db_path
+        self.snapshot_path = snapshot_path
+        self.interval = interval
+        self.taken_at = None
+        self._pool = ReadPool(snapshot_path)
+        self._source = None
+        self._data_version = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def refresh(self):
+        """Copy the live database if it changed; return True when copied."""
+        with self._lock:
+            if self._source is None:
+                self._source = sqlite3.connect(
+                    self.db_path,
+                    timeout=BUSY_TIMEOUT_MS / 1000,
+                    check_same_thread=False,  # only used under self._lock
+                )
+            started = time.time()
+            # data_version changes when another connection commits
+            data_version = self._source.execute("PRAGMA data_version").fetchone()[0]
+            if data_version == self._data_version and os.path.exists(
+                self.snapshot_path
+            ):
+                self.taken_at = started
+                return False
+
+            tmp_path = self.snapshot_path + ".tmp"
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            target = sqlite3.connect(tmp_path)
+            try:
+                # One step: the whole copy comes from a single read transaction
+                self._source.backup(target)
+                target.execute("PRAGMA journal_mode=DELETE")
+            finally:
+                target.close()
+            os.replace(tmp_path, self.snapshot_path)
+
+            self._data_version = data_version
+            self.taken_at = started
+            self._pool.invalidate()
+            return True
+
+    def age(self):
+        """Seconds since the data in the snapshot was read from the database."""
+        return None if self.taken_at is None else time.time() - self.taken_at
+
+    def start(self):
+        if self._thread is not None:
+            return
+
+        def run():
+            while not self._stop.wait(self.interval):
+                try:
+                    self.refresh()
+                except Exception as e:
+                    print(f"Error refreshing snapshot {self.snapshot_path}: {e}")
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+
+    @contextmanager
+    def connection(self):
+        if self.taken_at is None:
+            self.refresh()
+        with self._pool.connection() as connection:
+            yield connection
+
+    def close(self):
+        self._stop.set()
+        self._pool.close()
+        with self._lock:
+            if self._source is not None:
+                self._source.close()
+                self._source = None
+
+
+def get_snapshot(db_path, mode="wal", snapshot_path=None, interval=SNAPSHOT_INTERVAL):
+    """Return the shared read path of a database for `mode` "wal" or "backup".
+
+    Both have a `connection()` context manager for read-only queries.
+    """
+    if mode not in ("wal", "backup"):
+        raise ValueError(f"Unknown read snapshot mode '{mode}', use wal or backup")
+
+    with _SNAPSHOTS_LOCK:
+        key = (db_path, mode)
+        snapshot = _SNAPSHOTS.get(key)
+        if snapshot is None:
+            if mode == "wal":
+                snapshot = ReadPool(db_path)
+            else:
+                snapshot = BackupSnapshot(db_path, snapshot_path, interval)
+                snapshot.start()
+            _SNAPSHOTS[key] = snapshot
+        return snapshot
+
+
+def close_all_snapshots():
+    with _SNAPSHOTS_LOCK:
+        for snapshot in _SNAPSHOTS.values():
+            snapshot.close()
+        _SNAPSHOTS.clear()
+
+
+atexit.register(close_all_snapshots)
@@ -0,0 +1,94 @@
+"""Size and decode speed of the compressed reading archive vs. SQLite.
+
+Generates `--devices` devices reporting every `--interval` seconds for
+`--days` days (utils/generator.py), loads them into tbl_LEITURA and into an
+archive, and reports bytes per reading, compression ratio and rows/s to
+encode and to decode back into the `fetch_sensor_data` frame.
+
+Usage: python benchmarks/bench_archive.py [--devices 10] [--days 30] [--interval 10]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy
+
+V4_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(V4_ROOT, "app"))
+
+from utils import archive  # noqa: E402
+from utils import database  # noqa: E402
+from utils.connection import close_all_pools  # noqa: E402
+from utils.generator import generate_frames  # noqa: E402
+from utils.importer import import_frames  # noqa: E402
+from utils.query_cache import QUERY_CACHE  # noqa: E402
+
+
+def with_ids(frames):
+    """Number the readings like tbl_LEITURA's ID_LEITURA."""
+    next_id = 1
+    for frame in frames:
+        frame["ID_LEITURA"] = numpy.arange(next_id, next_id + len(frame))
+        next_id += len(frame)
+        yield frame
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", type=int, default=10)
+    parser.add_argument("--days", type=float, default=30)
+    parser.add_argument("--interval", type=int, default=10)
+    args = parser.parse_args()
+    periods = int(args.days * 86400 // args.interval)
+
+    def frames():
+        return generate_frames(
+            args.devices, "2024-01-01", periods, args.interval, seed=42
+        )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_PATH = os.path.join(tmp, "data.db")
+        database.INIT_SQL_PATH = os.path.join(V4_ROOT, "database", "init.sql")
+        database.MIGRATIONS_PATH = os.path.join(V4_ROOT, "database", "migrations")
+        database.SENSOR_STORAGE = "sqlite"
+        rows, _ = import_frames(frames())
+        with database.connect() as connection:
+            connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            connection.execute("VACUUM")
+        sqlite_bytes = os.path.getsize(database.DB_PATH)
+
+        archive_path = os.path.join(tmp, "archive.ftsa")
+        started = time.perf_counter()
+        archive.write_archive(with_ids(frames()), archive_path, append=False)
+        encode_seconds = time.perf_counter() - started
+        archive_bytes = os.path.getsize(archive_path)
+
+        QUERY_CACHE.clear()
+        started = time.perf_counter()
+        sqlite_rows = len(database.fetch_sensor_data())
+        sqlite_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        decoded_rows = sum(len(frame) for frame in archive.read_archive(archive_path))
+        decode_seconds = time.perf_counter() - started
+        close_all_pools()
+
+    print(f"{rows} readings ({args.devices} devices x {periods})")
+    print(f"{'':<22} {'bytes/row':>10} {'rows/s':>14}")
+    print(
+        f"{'SQLite (fetch)':<22} {sqlite_bytes / rows:>10.2f} "
+        f"{sqlite_rows / sqlite_seconds:>14,.0f}"
+    )
+    print(
+        f"{'archive (decode)':<22} {archive_bytes / rows:>10.2f} "
+        f"{decoded_rows / decode_seconds:>14,.0f}"
+    )
+    print(f"{'archive (encode)':<22} {'':>10} {rows / encode_seconds:>14,.0f}")
+    print(f"Compression ratio vs. SQLite: {sqlite_bytes / archive_bytes:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Scan times of the SQLite and columnar (Parquet) sensor storage backends.
+
+Measures the two analytical reads of the dashboard over all history: monthly
+means of humidity, temperature and pH, and a humidity histogram.
+
+Usage: python benchmarks/bench_columnar.py [--rows 1000000 50000000]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy
+import pandas
+
+V4_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(V4_ROOT, "app"))
+
+from utils import database  # noqa: E402
+from utils.columnar import ColumnarStore  # noqa: E402
+from utils.connection import close_all_pools  # noqa: E402
+
+BATCH_ROWS = 1_000_000
+
+
+def generate_batch(rng, offset, rows):
+    start = numpy.datetime64("2022-01-01T00:00:00")
+    return pandas.DataFrame(
+        {
+            "ltr_UMIDADE": rng.uniform(28.9, 55.2, rows).round(2),
+            "ltr_TEMPERATURA": rng.uniform(7, 38.3, rows).round(2),
+            "ltr_PH": rng.uniform(6.3, 7.3, rows).round(2),
+            "ltr_NUTRIENTE_P": rng.integers(0, 2, rows),
+            "ltr_NUTRIENTE_K": rng.integers(0, 2, rows),
+            "ltr_STATUS_IRRIGACAO": rng.integers(0, 2, rows),
+            "ltr_DATA": start
+            + (numpy.arange(offset, offset + rows) * numpy.timedelta64(10, "s")),
+        }
+    )
+
+
+def load(rows, store):
+    rng = numpy.random.default_rng(42)
+    for offset in range(0, rows, BATCH_ROWS):
+        batch = generate_batch(rng, offset, min(BATCH_ROWS, rows - offset))
+        store.write_frame(batch)
+        sqlite_rows = batch.assign(
+            ltr_DATA=batch["ltr_DATA"].dt.strftime("%Y-%m-%d %H:%M:%S")
+        )
+        database.save_sensor_data_many(sqlite_rows.itertuples(index=False, name=None))
+    store.compact()
+
+
+def sqlite_monthly_means():
+    with database.connect() as connection:
+        return pandas.read_sql_query(
+            """
+            SELECT strftime('%Y-%m', ltr_DATA) AS month,
+                   AVG(ltr_UMIDADE), AVG(ltr_TEMPERATURA), AVG(ltr_PH)
+            FROM tbl_LEITURA GROUP BY 1
+            """,
+            connection,
+        )
+
+
+def sqlite_histogram():
+    with database.connect() as connection:
+        values = pandas.read_sql_query(
+            "SELECT ltr_UMIDADE FROM tbl_LEITURA", connection
+        )
+    return numpy.histogram(values["ltr_UMIDADE"], bins=30)
+
+
+def columnar_monthly_means(store):
+    data = store.fetch_sensor_data(columns=["ltr_UMIDADE", "ltr_TEMPERATURA", "ltr_PH"])
+    return data.groupby("month")[["ltr_UMIDADE", "ltr_TEMPERATURA", "ltr_PH"]].mean()
+
+
+def columnar_histogram(store):
+    data = store.fetch_sensor_data(columns=["ltr_UMIDADE"])
+    return numpy.histogram(data["ltr_UMIDADE"], bins=30)
+
+
+def timed(function):
+    started = time.perf_counter()
+    function()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000])
+    args = parser.parse_args()
+
+    print(f"{'rows':>10}  {'scan':<14} {'sqlite (s)':>10} {'columnar (s)':>12}")
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as tmp:
+            database.DB_PATH = os.path.join(tmp, "data.db")
+            database.INIT_SQL_PATH = os.path.join(V4_ROOT, "database", "init.sql")
+            database.MIGRATIONS_PATH = os.path.join(V4_ROOT, "database", "migrations")
+            database.DB_INITIALIZED = False
+            store = ColumnarStore(os.path.join(tmp, "columnar"))
+            load(rows, store)
+
+            for name, sqlite_scan, columnar_scan in (
+                ("monthly means", sqlite_monthly_means, columnar_monthly_means),
+                ("histogram", sqlite_histogram, columnar_histogram),
+            ):
+                sqlite_time = timed(sqlite_scan)
+                columnar_time = timed(lambda: columnar_scan(store))
+                print(
+                    f"{rows:>10}  {name:<14} {sqlite_time:>10.2f} {columnar_time:>12.2f}"
+                )
+            close_all_pools()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Inserts/sec of `save_sensor_data` with per-call connections vs the pool.
+
+Usage: python benchmarks/bench_connections.py [--rows 5000]
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+V4_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(V4_ROOT, "app"))
+
+from utils import database  # noqa: E402
+from utils.connection import close_all_pools  # noqa: E402
+
+INIT_SQL_PATH = os.path.join(V4_ROOT, "database", "init.sql")
+MIGRATIONS_PATH = os.path.join(V4_ROOT, "database", "migrations")
+
+
+def random_reading():
+    return (
+        round(random.uniform(28.9, 55.2), 2),
+        round(random.uniform(7, 38.3), 2),
+        round(random.uniform(6.3, 7.3), 2),
+        random.choice([0, 1]),
+        random.choice([0, 1]),
+        random.choice([0, 1]),
+    )
+
+
+def legacy_save_sensor_data(db_path, *reading):
+    # The original implementation: open, insert, commit and close per reading
+    connection = sqlite3.connect(db_path)
+    cursor = connection.cursor()
+    cursor.execute(
+        """
+        INSERT INTO tbl_LEITURA (ltr_UMIDADE, ltr_TEMPERATURA, ltr_PH, ltr_NUTRIENTE_P, ltr_NUTRIENTE_K, ltr_STATUS_IRRIGACAO)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """,
+        reading,
+    )
+    connection.commit()
+    connection.close()
+
+
+def run(label, save, readings):
+    start = time.perf_counter()
+    for reading in readings:
+        save(*reading)
+    elapsed = time.perf_counter() - start
+    rate = len(readings) / elapsed
+    print(
+        f"{label:<10} {len(readings):>8} rows  {elapsed:8.2f} s  {rate:10.0f} inserts/s"
+    )
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=5000)
+    args = parser.parse_args()
+
+    readings = [random_reading() for _ in range(args.rows)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_path = os.path.join(tmp, "legacy.db")
+        with open(INIT_SQL_PATH, "r") as sql_file:
+            connection = sqlite3.connect(legacy_path)
+            connection.executescript(sql_file.read())
+            connection.close()
+        before = run(
+            "before",
+            lambda *reading: legacy_save_sensor_data(legacy_path, *reading),
+            readings,
+        )
+
+        database.DB_PATH = os.path.join(tmp, "pooled.db")
+        database.INIT_SQL_PATH = INIT_SQL_PATH
+        database.MIGRATIONS_PATH = MIGRATIONS_PATH
+        after = run("after", database.save_sensor_data, readings)
+        close_all_pools()
+
+    print(f"speedup    {after / before:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
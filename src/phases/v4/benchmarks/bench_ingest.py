@@ -0,0 +1,184 @@
+"""Sustained MQTT ingest throughput and callback latency, per ingest mode.
+
+A broker stand-in thread plays paho's network thread: it delivers
+`--messages` JSON readings (utils/generator.py, `--devices` devices) to the
+`on_message` callback as fast as it can, or at `--rate` messages/s. With
+`--batch` N each message is a JSON array of N readings of one device. The
+"inline" mode decodes and writes inside the callback, like `on_message` did
+before utils/ingest.py; the other modes queue the payload and let the
+pipeline workers write it, with each backpressure policy. Each device
+publishes to its own topic under a `farm/+/sensors` subscription, and
+`--shards` writer workers split the devices. `--commit-delay` adds that
+many milliseconds to every commit to stand in for a slow disk.
+
+Reports how long the callback held the network thread (p50/p99/max), how
+many messages were dropped or spilled to disk, the readings/s delivered
+and committed
+until the queues drained and whether every device's readings were stored
+in order.
+
+Usage: python benchmarks/bench_ingest.py [--messages 200000] [--devices 100] [--rate 0] [--commit-delay 0] [--shards 1] [--batch 1]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy
+
+V4_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(V4_ROOT, "app"))
+
+from utils import database  # noqa: E402
+from utils.batch_writer import BatchWriter  # noqa: E402
+from utils.connection import close_all_pools  # noqa: E402
+from utils.generator import generate_readings  # noqa: E402
+from utils.ingest import (  # noqa: E402
+    POLICIES,
+    IngestPipeline,
+    decode_message,
+    topic_device,
+)
+
+TOPIC = "farm/+/sensors"
+QUEUE_SIZE = 10_000
+
+
+def payloads(count, devices, batch):
+    """`(topic, payload)` of `count` readings, `batch` readings per message."""
+    readings = generate_readings(devices, "2024-01-01", -(-count // devices), 10, 42)
+    readings = readings.head(count)
+    readings["ltr_DATA"] = readings["ltr_DATA"].dt.strftime("%Y-%m-%d %H:%M:%S")
+    devices = "esp32-" + readings.pop("device").astype(str)
+    if batch == 1:
+        return [
+            (TOPIC.replace("+", device), json.dumps(reading).encode("utf-8"))
+            for device, reading in zip(devices, readings.to_dict("records"))
+        ]
+    # The generator interleaves the devices; group consecutive readings of each
+    pending, messages = {}, []
+    for device, reading in zip(devices, readings.to_dict("records")):
+        group = pending.setdefault(device, [])
+        group.append(reading)
+        if len(group) == batch:
+            messages.append((device, pending.pop(device)))
+    messages.extend(pending.items())
+    return [
+        (TOPIC.replace("+", device), json.dumps(group).encode("utf-8"))
+        for device, group in messages
+    ]
+
+
+def run(mode, messages, readings, rate, commit_delay, shards):
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_PATH = os.path.join(tmp, "data.db")
+        database.INIT_SQL_PATH = os.path.join(V4_ROOT, "database", "init.sql")
+        database.MIGRATIONS_PATH = os.path.join(V4_ROOT, "database", "migrations")
+        database.SENSOR_STORAGE = "sqlite"
+        database.DB_INITIALIZED = False
+
+        def slow_disk(rows):
+            time.sleep(commit_delay / 1000)
+
+        writers = [
+            BatchWriter("balanced", on_flush=slow_disk if commit_delay else None)
+            for _ in range(1 if mode == "inline" else shards)
+        ]
+        pipeline = None
+        if mode == "inline":
+
+            def on_message(client, userdata, msg):
+                device = topic_device(TOPIC, msg.topic)
+                rows = decode_message(msg.topic, msg.payload, time.time(), device)
+                writers[0].add_many(rows)
+
+        else:
+            pipeline = IngestPipeline(
+                writers,
+                TOPIC,
+                QUEUE_SIZE,
+                mode,
+                os.path.join(tmp, "ingest.spill"),
+            )
+            on_message = pipeline.on_message
+
+        held = numpy.empty(len(messages))
+        started = time.perf_counter()
+
+        def broker():
+            for index, (topic, payload) in enumerate(messages):
+                if rate:
+                    delay = started + index / rate - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                before = time.perf_counter()
+                on_message(None, None, SimpleNamespace(topic=topic, payload=payload))
+                held[index] = time.perf_counter() - before
+
+        network = threading.Thread(target=broker)
+        network.start()
+        network.join()
+        delivered = time.perf_counter() - started
+        if pipeline is not None:
+            pipeline.close()
+        for writer in writers:
+            writer.close()
+        seconds = time.perf_counter() - started
+        with database.connect() as connection:
+            # Leaves out the sample rows of init.sql, which have no device
+            rows = connection.execute(
+                "SELECT COUNT(ltr_DISPOSITIVO) FROM tbl_LEITURA"
+            ).fetchone()[0]
+            # Rows inserted out of time order within a device
+            unordered = connection.execute("""
+                SELECT COUNT(*) FROM (
+                    SELECT ltr_DATA < LAG(ltr_DATA) OVER (
+                        PARTITION BY ltr_DISPOSITIVO ORDER BY ID_LEITURA
+                    ) AS late
+                    FROM tbl_LEITURA WHERE ltr_DISPOSITIVO IS NOT NULL
+                ) WHERE late
+                """).fetchone()[0]
+        close_all_pools()
+
+    p50, p99 = numpy.percentile(held, [50, 99]) * 1e6
+    print(
+        f"{mode:<12} {p50:>9.1f} {p99:>9.1f} {held.max() * 1e3:>9.1f} "
+        f"{readings / delivered:>12,.0f} {rows / seconds:>12,.0f} "
+        f"{pipeline.dropped if pipeline else 0:>8} "
+        f"{pipeline.spilled if pipeline else 0:>8} "
+        f"{'yes' if not unordered else 'no':>8}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=200_000, help="readings")
+    parser.add_argument("--devices", type=int, default=100)
+    parser.add_argument("--rate", type=float, default=0, help="messages/s, 0 = max")
+    parser.add_argument("--commit-delay", type=float, default=0, help="ms")
+    parser.add_argument("--shards", type=int, default=1, help="writer workers")
+    parser.add_argument("--batch", type=int, default=1, help="readings per message")
+    args = parser.parse_args()
+
+    messages = payloads(args.messages, args.devices, args.batch)
+    print(
+        f"{args.messages} readings in {len(messages)} messages, {args.devices} "
+        f"devices, rate {args.rate or 'max'}, commit delay {args.commit_delay} ms, "
+        f"{args.shards} shards"
+    )
+    print(
+        f"{'mode':<12} {'p50 (us)':>9} {'p99 (us)':>9} {'max (ms)':>9} "
+        f"{'delivered/s':>12} {'committed/s':>12} {'dropped':>8} {'spilled':>8} "
+        f"{'ordered':>8}"
+    )
+    for mode in ("inline",) + POLICIES:
+        run(mode, messages, args.messages, args.rate, args.commit_delay, args.shards)
+
+
+if __name__ == "__main__":
+    main()
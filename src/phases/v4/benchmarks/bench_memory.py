@@ -0,0 +1,84 @@
+"""Bytes per row and peak memory of fetch_sensor_data vs the compact load path.
+
+Usage: python benchmarks/bench_memory.py [--rows 1000000] [--chunksize 100000]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy
+
+V4_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(V4_ROOT, "app"))
+
+from utils import database  # noqa: E402
+from utils.compact import bytes_per_row, fetch_sensor_data_compact  # noqa: E402
+from utils.connection import close_all_pools  # noqa: E402
+
+
+def fill_database(rows):
+    rng = numpy.random.default_rng(42)
+    start = numpy.datetime64("2024-01-01T00:00:00")
+    timestamps = (start + numpy.arange(rows) * numpy.timedelta64(10, "s")).astype(str)
+    humidity = rng.uniform(28.9, 55.2, rows).round(2)
+    temperature = rng.uniform(7, 38.3, rows).round(2)
+    ph = rng.uniform(6.3, 7.3, rows).round(2)
+    flags = rng.integers(0, 2, (rows, 3))
+
+    batch = 100_000
+    for offset in range(0, rows, batch):
+        end = min(offset + batch, rows)
+        database.save_sensor_data_many(
+            zip(
+                humidity[offset:end].tolist(),
+                temperature[offset:end].tolist(),
+                ph[offset:end].tolist(),
+                flags[offset:end, 0].tolist(),
+                flags[offset:end, 1].tolist(),
+                flags[offset:end, 2].tolist(),
+                [value.replace("T", " ") for value in timestamps[offset:end]],
+            )
+        )
+
+
+def measure(label, load):
+    tracemalloc.start()
+    started = time.perf_counter()
+    data = load()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"{label:<8} {len(data):>10} rows  {bytes_per_row(data):8.1f} bytes/row  "
+        f"peak {peak / 2**20:9.1f} MiB  {elapsed:7.2f} s"
+    )
+    return bytes_per_row(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--chunksize", type=int, default=100_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_PATH = os.path.join(tmp, "data.db")
+        database.INIT_SQL_PATH = os.path.join(V4_ROOT, "database", "init.sql")
+        database.MIGRATIONS_PATH = os.path.join(V4_ROOT, "database", "migrations")
+        fill_database(args.rows)
+
+        before = measure("before", database.fetch_sensor_data)
+        after = measure(
+            "after", lambda: fetch_sensor_data_compact(chunksize=args.chunksize)
+        )
+        close_all_pools()
+
+    print(f"reduction {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Bytes per reading and encode/decode throughput of the MQTT payload formats.
+
+Encodes `--readings` readings (utils/generator.py) as the JSON payload of
+utils/mqtt.py and in the binary format of utils/payload.py, with and
+without the device ID in the payload (the topic can carry it instead), and
+as batches of `--batch` readings of one device per message: a JSON array
+and a binary columnar block. It then reports bytes per reading and
+readings/s through `encode_payload`, `decode_payload` and the ingest
+workers' `decode_message`. Decoding every case must give the same rows.
+
+Usage: python benchmarks/bench_payload.py [--readings 200000] [--devices 100] [--batch 50]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+V4_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(V4_ROOT, "app"))
+
+from utils.generator import generate_readings  # noqa: E402
+from utils.ingest import decode_message  # noqa: E402
+from utils.payload import decode_payload, encode_payload  # noqa: E402
+
+TOPIC = "farm/{device}/sensors"
+
+
+def readings(count, devices):
+    data = generate_readings(devices, "2024-01-01", -(-count // devices), 10, 42)
+    data = data.head(count)
+    data["ltr_DATA"] = data["ltr_DATA"].dt.strftime("%Y-%m-%d %H:%M:%S")
+    data["ltr_DISPOSITIVO"] = "esp32-" + data.pop("device").astype(str)
+    return data.to_dict("records")
+
+
+def batches(records, size):
+    """Consecutive readings of each device, `size` at a time."""
+    by_device = {}
+    for record in records:
+        by_device.setdefault(record["ltr_DISPOSITIVO"], []).append(record)
+    return [
+        group[start : start + size]
+        for group in by_device.values()
+        for start in range(0, len(group), size)
+    ]
+
+
+def rate(count, function, items):
+    started = time.perf_counter()
+    results = [function(item) for item in items]
+    return count / (time.perf_counter() - started), results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--readings", type=int, default=200_000)
+    parser.add_argument("--devices", type=int, default=100)
+    parser.add_argument("--batch", type=int, default=50, help="readings per batch")
+    args = parser.parse_args()
+
+    records = readings(args.readings, args.devices)
+    without_device = [
+        {key: value for key, value in record.items() if key != "ltr_DISPOSITIVO"}
+        for record in records
+    ]
+    topics = [TOPIC.format(device=record["ltr_DISPOSITIVO"]) for record in records]
+    groups = batches(records, args.batch)
+    group_topics = [
+        TOPIC.format(device=group[0]["ltr_DISPOSITIVO"]) for group in groups
+    ]
+    cases = [
+        ("json", "json", records, topics),
+        ("binary", "binary", records, topics),
+        ("binary, device in topic", "binary", without_device, topics),
+        (f"json, {args.batch}/message", "json", groups, group_topics),
+        (f"binary, {args.batch}/message", "binary", groups, group_topics),
+    ]
+
+    print(f"{len(records)} readings, {args.devices} devices")
+    print(
+        f"{'format':<24} {'bytes/reading':>14} {'encode/s':>12} "
+        f"{'decode/s':>12} {'ingest/s':>12}"
+    )
+    rows = {}
+    for name, payload_format, items, item_topics in cases:
+        encode_rate, payloads = rate(
+            len(records), lambda item: encode_payload(item, payload_format), items
+        )
+        decode_rate, _ = rate(len(records), decode_payload, payloads)
+        ingest_rate, decoded = rate(
+            len(records),
+            lambda pair: decode_message(pair[0], pair[1], 0.0, pair[0].split("/")[1]),
+            list(zip(item_topics, payloads)),
+        )
+        rows[name] = sorted(row for message in decoded for row in message)
+        size = sum(len(payload) for payload in payloads) / len(records)
+        print(
+            f"{name:<24} {size:>14.1f} {encode_rate:>12,.0f} "
+            f"{decode_rate:>12,.0f} {ingest_rate:>12,.0f}"
+        )
+
+    same = all(case == rows["json"] for case in rows.values())
+    print(f"Same rows from every format: {'yes' if same else 'no'}")
+
+
+if __name__ == "__main__":
+    main()
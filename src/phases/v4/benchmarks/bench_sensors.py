@@ -0,0 +1,169 @@
+"""Ingest and window-query times of the multi-sensor Phase 2 model.
+
+Loads `--sensors` sensors (10 per location) reporting every `--interval`
+seconds for `--days` days, then times one day of one sensor and of one
+location. The same queries run against a flat table with only a timestamp
+index, which has to read the readings of every device in the window.
+
+The defaults (500 sensors x 1 year of 10-second readings) are ~1.6 billion
+rows and need well over 100 GB of disk; use e.g. `--days 2` for a quick run.
+
+Usage: python benchmarks/bench_sensors.py [--sensors 500] [--days 365] [--interval 10]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy
+import pandas
+
+V4_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(V4_ROOT, "app"))
+
+from utils import database  # noqa: E402
+from utils import sensors  # noqa: E402
+from utils.connection import close_all_pools  # noqa: E402
+from utils.query_cache import QUERY_CACHE  # noqa: E402
+
+SENSORS_PER_LOCATION = 10
+CROPS = 5
+START = numpy.datetime64("2024-01-01T00:00:00")
+QUERIES = 20
+
+
+def create_devices(sensor_count):
+    for location in range(sensor_count // SENSORS_PER_LOCATION + 1):
+        sensors.add_location(f"Talhão {location + 1}", f"-22.{location:04d},-47.0000")
+    for crop in range(CROPS):
+        sensors.add_crop(f"Cultura {crop + 1}", "2024-01-01")
+    for sensor_id in range(1, sensor_count + 1):
+        sensors.add_sensor("umidade/pH/nutrientes", sensor_id)
+
+
+def generate_rows(rng, sensor_count, first_tick, ticks, interval):
+    """One row per sensor and tick, in arrival (time) order."""
+    offsets = numpy.arange(first_tick, first_tick + ticks) * interval
+    timestamps = numpy.char.replace(
+        numpy.datetime_as_string(START + offsets.astype("timedelta64[s]")), "T", " "
+    )
+    sensor_ids = numpy.arange(1, sensor_count + 1)
+    size = ticks * sensor_count
+    return zip(
+        numpy.tile(sensor_ids, ticks).tolist(),
+        numpy.repeat(timestamps, sensor_count).tolist(),
+        (numpy.tile(sensor_ids, ticks) % CROPS + 1).tolist(),
+        (numpy.tile(sensor_ids, ticks) // SENSORS_PER_LOCATION + 1).tolist(),
+        rng.uniform(28.9, 55.2, size).round(2).tolist(),
+        rng.uniform(6.3, 7.3, size).round(2).tolist(),
+        rng.uniform(0, 50, size).round(1).tolist(),
+        rng.uniform(0, 50, size).round(1).tolist(),
+    )
+
+
+def load(sensor_count, days, interval):
+    rng = numpy.random.default_rng(42)
+    total_ticks = days * 86400 // interval
+    ticks_per_batch = max(1, 200_000 // sensor_count)
+    with database.connect() as connection:
+        # Flat single-table layout for comparison: timestamp index only
+        connection.execute(
+            "CREATE TABLE flat_reading AS SELECT * FROM Sensor_Reading WHERE 0"
+        )
+        connection.execute(
+            "CREATE INDEX idx_flat_reading_timestamp ON flat_reading (timestamp)"
+        )
+        connection.commit()
+
+    rows, flat_seconds, started = 0, 0.0, time.perf_counter()
+    for first_tick in range(0, total_ticks, ticks_per_batch):
+        ticks = min(ticks_per_batch, total_ticks - first_tick)
+        batch = list(generate_rows(rng, sensor_count, first_tick, ticks, interval))
+        rows += sensors.save_readings(batch)
+
+        flat_started = time.perf_counter()
+        with database.connect() as connection:
+            connection.executemany(
+                "INSERT INTO flat_reading VALUES (?, ?, ?, ?, ?, ?, ?, ?)", batch
+            )
+            connection.commit()
+        flat_seconds += time.perf_counter() - flat_started
+    return rows, time.perf_counter() - started - flat_seconds
+
+
+def flat_window(key_column, key, start, end):
+    # Loaded into a DataFrame like sensors._fetch_readings, so both sides pay
+    # the same conversion
+    with database.connect() as connection:
+        data = pandas.read_sql_query(
+            f"""
+            SELECT timestamp, moisture_value, ph_value, phosphorus_value, potassium_value
+            FROM flat_reading
+            WHERE timestamp >= ? AND timestamp < ? AND {key_column} = ?
+            ORDER BY timestamp
+            """,
+            connection,
+            params=(start, end, key),
+        )
+    data["timestamp"] = pandas.to_datetime(data["timestamp"])
+    return data
+
+
+def timed_queries(query, keys, days):
+    """Median seconds of `query(key, start, end)` over random one-day windows."""
+    rng = numpy.random.default_rng(7)
+    times = []
+    for _ in range(QUERIES):
+        day = START + numpy.timedelta64(int(rng.integers(0, days)), "D")
+        start = str(day).replace("T", " ")
+        end = str(day + numpy.timedelta64(1, "D")).replace("T", " ")
+        key = int(rng.choice(keys))
+        # Repeated windows would otherwise be served from the query cache
+        QUERY_CACHE.clear()
+        started = time.perf_counter()
+        query(key, start, end)
+        times.append(time.perf_counter() - started)
+    return float(numpy.median(times))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sensors", type=int, default=500)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--interval", type=int, default=10, help="seconds")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_PATH = os.path.join(tmp, "data.db")
+        database.INIT_SQL_PATH = os.path.join(V4_ROOT, "database", "init.sql")
+        database.MIGRATIONS_PATH = os.path.join(V4_ROOT, "database", "migrations")
+        database.DB_INITIALIZED = False
+
+        create_devices(args.sensors)
+        rows, seconds = load(args.sensors, args.days, args.interval)
+        print(
+            f"Loaded {rows} readings ({args.sensors} sensors x {args.days} days) "
+            f"in {seconds:.1f} s ({rows / seconds:,.0f} rows/s)"
+        )
+
+        sensor_ids = numpy.arange(1, args.sensors + 1)
+        location_ids = numpy.unique(sensor_ids // SENSORS_PER_LOCATION + 1)
+        print(f"{'one-day window':<16} {'indexed (ms)':>12} {'flat (ms)':>10}")
+        for name, column, keys, fetch in (
+            ("sensor", "sensor_id", sensor_ids, sensors.fetch_sensor_readings),
+            ("location", "location_id", location_ids, sensors.fetch_location_readings),
+        ):
+            indexed = timed_queries(fetch, keys, args.days)
+            flat = timed_queries(
+                lambda key, start, end: flat_window(column, key, start, end),
+                keys,
+                args.days,
+            )
+            print(f"{name:<16} {indexed * 1000:>12.1f} {flat * 1000:>10.1f}")
+        close_all_pools()
+
+
+if __name__ == "__main__":
+    main()
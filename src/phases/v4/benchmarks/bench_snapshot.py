@@ -0,0 +1,137 @@
+"""Ingest latency while dashboards read, for each read path.
+
+A writer inserts single readings (like the MQTT client) at a fixed rate
+while a separate process runs `--readers` threads (like Streamlit sessions)
+that repeatedly load the whole history. Reads go through the write pool
+(`connect()`), the read-only pool on the live database (READ_SNAPSHOT=wal)
+or the periodic backup copy (READ_SNAPSHOT=backup).
+
+Usage: python benchmarks/bench_snapshot.py [--rows 1000000] [--readers 10] [--seconds 10]
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import numpy
+import pandas
+
+V4_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(V4_ROOT, "app"))
+
+from utils import database  # noqa: E402
+from utils.connection import close_all_pools  # noqa: E402
+
+WRITES_PER_SECOND = 100
+
+
+def configure(tmp, read_snapshot="wal", interval=5.0):
+    database.DB_PATH = os.path.join(tmp, "data.db")
+    database.SNAPSHOT_PATH = os.path.join(tmp, "snapshot.db")
+    database.INIT_SQL_PATH = os.path.join(V4_ROOT, "database", "init.sql")
+    database.MIGRATIONS_PATH = os.path.join(V4_ROOT, "database", "migrations")
+    database.READ_SNAPSHOT = read_snapshot
+    database.READ_SNAPSHOT_INTERVAL = interval
+
+
+def load(rows):
+    rng = numpy.random.default_rng(42)
+    timestamps = pandas.date_range("2022-01-01", periods=rows, freq="10s")
+    database.save_sensor_data_many(
+        zip(
+            rng.uniform(28.9, 55.2, rows).round(2).tolist(),
+            rng.uniform(7, 38.3, rows).round(2).tolist(),
+            rng.uniform(6.3, 7.3, rows).round(2).tolist(),
+            rng.integers(0, 2, rows).tolist(),
+            rng.integers(0, 2, rows).tolist(),
+            rng.integers(0, 2, rows).tolist(),
+            timestamps.strftime("%Y-%m-%d %H:%M:%S"),
+        )
+    )
+
+
+def run_readers(tmp, path, readers, stop, ready, reads):
+    """Child process: `readers` threads loading the full history until `stop`."""
+    configure(tmp, read_snapshot="backup" if path == "backup" else "wal")
+    connect = database.connect if path == "write-pool" else database.connect_read
+
+    def read():
+        while not stop.is_set():
+            with connect() as connection:
+                pandas.read_sql_query(
+                    "SELECT * FROM tbl_LEITURA ORDER BY ltr_DATA DESC", connection
+                )
+            with reads.get_lock():
+                reads.value += 1
+
+    threads = [threading.Thread(target=read, daemon=True) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    ready.set()
+    for thread in threads:
+        thread.join()
+
+
+def write(seconds):
+    """Insert single readings at WRITES_PER_SECOND and return latencies in ms."""
+    latencies = []
+    interval = 1 / WRITES_PER_SECOND
+    deadline = time.perf_counter() + seconds
+    next_write = time.perf_counter()
+    while next_write < deadline:
+        time.sleep(max(0.0, next_write - time.perf_counter()))
+        started = time.perf_counter()
+        database.save_sensor_data(40.0, 22.0, 6.8, 1, 0, 1)
+        latencies.append((time.perf_counter() - started) * 1000)
+        next_write += interval
+    return numpy.array(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--readers", type=int, default=10)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp:
+        configure(tmp)
+        load(args.rows)
+
+        print(
+            f"{'readers':<22} {'p50 (ms)':>9} {'p99 (ms)':>9} {'max (ms)':>9} {'reads':>6}"
+        )
+        for path in (None, "write-pool", "wal", "backup"):
+            stop, ready = context.Event(), context.Event()
+            reads = context.Value("i", 0)
+            process = None
+            if path is not None:
+                process = context.Process(
+                    target=run_readers,
+                    args=(tmp, path, args.readers, stop, ready, reads),
+                )
+                process.start()
+                ready.wait()
+                time.sleep(1)  # let every reader start its first query
+
+            latencies = write(args.seconds)
+            stop.set()
+            if process is not None:
+                process.join()
+
+            name = "none" if path is None else f"{args.readers} x {path}"
+            print(
+                f"{name:<22} {numpy.percentile(latencies, 50):>9.2f} "
+                f"{numpy.percentile(latencies, 99):>9.2f} {latencies.max():>9.2f} "
+                f"{reads.value:>6}"
+            )
+        close_all_pools()
+
+
+if __name__ == "__main__":
+    main()
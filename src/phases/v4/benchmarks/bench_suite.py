@@ -0,0 +1,318 @@
+"""Storage benchmark suite for the v3 and v4 sensor databases, with JSON output.
+
+For each schema the table is grown to every size in `--rows` (with the bulk
+importer) and at each size these operations are timed:
+
+- single_insert: `save_sensor_data`, one reading per call
+- batch_insert: 1000 readings per transaction
+- full_fetch: `fetch_sensor_data`, whole history
+- window_fetch: `query_sensor_data` for a random one-day window
+- monthly_aggregation: monthly means computed by `query_sensor_data`
+
+Reads run with the query cache cleared, so they measure the database. Each
+result has p50/p95/p99 latency in ms and throughput in rows/s. `--compare`
+reads a previous JSON report and lists operations whose p50 got slower than
+`--tolerance` times the baseline.
+
+Usage: python benchmarks/bench_suite.py [--rows 10000 1000000 10000000]
+    [--schemas v3 v4] [--output report.json] [--compare baseline.json]
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import json
+import os
+import platform
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy
+import pandas
+
+V4_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+V3_ROOT = os.path.join(os.path.dirname(V4_ROOT), "v3")
+sys.path.append(os.path.join(V4_ROOT, "app"))
+
+from utils import database  # noqa: E402
+from utils.connection import close_all_pools  # noqa: E402
+from utils.importer import import_frames  # noqa: E402
+from utils.query import SCHEMAS, query_sensor_data  # noqa: E402
+from utils.query_cache import QUERY_CACHE  # noqa: E402
+
+START = numpy.datetime64("2021-01-01T00:00:00")
+INTERVAL_SECONDS = 10
+LOAD_CHUNK_ROWS = 500_000
+BATCH_ROWS = 1000
+SAMPLES = {
+    "single_insert": 500,
+    "batch_insert": 50,
+    "full_fetch": 5,
+    "window_fetch": 50,
+    "monthly_aggregation": 10,
+}
+
+
+def generate_frame(rng, offset, rows):
+    """Synthetic readings in the v4 column layout, one every 10 seconds."""
+    seconds = numpy.arange(offset, offset + rows) * INTERVAL_SECONDS
+    return pandas.DataFrame(
+        {
+            "ltr_UMIDADE": rng.uniform(28.9, 55.2, rows).round(2),
+            "ltr_TEMPERATURA": rng.uniform(7, 38.3, rows).round(2),
+            "ltr_PH": rng.uniform(6.3, 7.3, rows).round(2),
+            "ltr_NUTRIENTE_P": rng.integers(0, 2, rows),
+            "ltr_NUTRIENTE_K": rng.integers(0, 2, rows),
+            "ltr_STATUS_IRRIGACAO": rng.integers(0, 2, rows),
+            "ltr_DATA": START + seconds.astype("timedelta64[s]"),
+        }
+    )
+
+
+def random_reading(rng):
+    return (
+        round(rng.uniform(28.9, 55.2), 2),
+        round(rng.uniform(7, 38.3), 2),
+        round(rng.uniform(6.3, 7.3), 2),
+        int(rng.integers(0, 2)),
+        int(rng.integers(0, 2)),
+        int(rng.integers(0, 2)),
+    )
+
+
+class V4Target:
+    schema = "v4"
+
+    def __init__(self, tmp):
+        database.DB_PATH = os.path.join(tmp, "v4.db")
+        database.SNAPSHOT_PATH = os.path.join(tmp, "v4-snapshot.db")
+        database.INIT_SQL_PATH = os.path.join(V4_ROOT, "database", "init.sql")
+        database.MIGRATIONS_PATH = os.path.join(V4_ROOT, "database", "migrations")
+        database.DB_INITIALIZED = False
+        database.SENSOR_STORAGE = "sqlite"
+        self.db_path = database.DB_PATH
+        self.save_sensor_data = database.save_sensor_data
+        self.fetch_sensor_data = database.fetch_sensor_data
+        self.query_sensor_data = query_sensor_data
+        with database.connect():
+            pass
+
+    def save_batch(self, rows):
+        database.save_sensor_data_many(rows)
+
+    def clear_cache(self):
+        QUERY_CACHE.clear()
+
+    def close(self):
+        close_all_pools()
+
+
+class V3Target:
+    schema = "v3"
+
+    def __init__(self, tmp):
+        spec = importlib.util.spec_from_file_location(
+            "bench_v3_database", os.path.join(V3_ROOT, "app", "database.py")
+        )
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        module.DB_PATH = os.path.join(tmp, "v3.db")
+        module.CSV_PATH = os.path.join(tmp, "sensor_data.csv")
+        module.CSV_MANIFEST_PATH = module.CSV_PATH + ".manifest.json"
+        self.module = module
+        self.db_path = module.DB_PATH
+        self.save_sensor_data = module.save_sensor_data
+        self.fetch_sensor_data = module.fetch_sensor_data
+        self.query_sensor_data = module.query_sensor_data
+        module.connect()
+
+    def save_batch(self, rows):
+        with self.module.CONNECTION_LOCK:
+            connection = self.module.connect()
+            connection.executemany(
+                """
+                INSERT INTO sensor_data (humidity, temperature, ph, sensor_p, sensor_k, irrigation_status, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                rows,
+            )
+            connection.commit()
+
+    def clear_cache(self):
+        with self.module.QUERY_CACHE_LOCK:
+            self.module.QUERY_CACHE.clear()
+            self.module.QUERY_CACHE_STATS["bytes"] = 0
+
+    def close(self):
+        self.module.close_connection()
+
+
+def table_rows(target):
+    with sqlite3.connect(target.db_path) as connection:
+        return connection.execute(
+            f"SELECT COUNT(*) FROM {SCHEMAS[target.schema]['table']}"
+        ).fetchone()[0]
+
+
+def grow(target, rng, rows, loaded):
+    """Bulk load synthetic readings until the table has `rows` rows."""
+    missing = rows - table_rows(target)
+    frames = (
+        generate_frame(rng, loaded + offset, min(LOAD_CHUNK_ROWS, missing - offset))
+        for offset in range(0, max(missing, 0), LOAD_CHUNK_ROWS)
+    )
+    db_path = None if target.schema == "v4" else target.db_path
+    import_frames(frames, target.schema, db_path)
+    return loaded + max(missing, 0)
+
+
+def measure(operation, samples, run):
+    """Time `run()` `samples` times; `run` returns the rows it wrote or read."""
+    latencies, total_rows = [], 0
+    for _ in range(samples):
+        started = time.perf_counter()
+        total_rows += run()
+        latencies.append(time.perf_counter() - started)
+    latencies = numpy.array(latencies)
+    return {
+        "operation": operation,
+        "samples": samples,
+        "p50_ms": float(numpy.percentile(latencies, 50) * 1000),
+        "p95_ms": float(numpy.percentile(latencies, 95) * 1000),
+        "p99_ms": float(numpy.percentile(latencies, 99) * 1000),
+        "throughput_rows_per_s": float(total_rows / latencies.sum()),
+    }
+
+
+def run_operations(target, rng, loaded, samples):
+    time_column = SCHEMAS[target.schema]["time"]
+    days = max(1, loaded * INTERVAL_SECONDS // 86400)
+
+    def single_insert():
+        target.save_sensor_data(*random_reading(rng))
+        return 1
+
+    def batch_insert():
+        now = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+        target.save_batch([random_reading(rng) + (now,) for _ in range(BATCH_ROWS)])
+        return BATCH_ROWS
+
+    def full_fetch():
+        target.clear_cache()
+        return len(target.fetch_sensor_data())
+
+    def window_fetch():
+        target.clear_cache()
+        day = START + numpy.timedelta64(int(rng.integers(0, days)), "D")
+        return len(
+            target.query_sensor_data(
+                start=pandas.Timestamp(day),
+                end=pandas.Timestamp(day + numpy.timedelta64(1, "D")),
+            )
+        )
+
+    def monthly_aggregation():
+        target.clear_cache()
+        columns = SCHEMAS[target.schema]["columns"][1:4] + [time_column]
+        return len(target.query_sensor_data(columns=columns, resample="month"))
+
+    operations = [
+        ("single_insert", single_insert),
+        ("batch_insert", batch_insert),
+        ("full_fetch", full_fetch),
+        ("window_fetch", window_fetch),
+        ("monthly_aggregation", monthly_aggregation),
+    ]
+    return [
+        measure(name, max(1, int(SAMPLES[name] * samples)), run)
+        for name, run in operations
+    ]
+
+
+def compare(report, baseline, tolerance):
+    """Return the results whose p50 is more than `tolerance` x the baseline's."""
+    previous = {
+        (result["schema"], result["rows"], result["operation"]): result
+        for result in baseline["results"]
+    }
+    regressions = []
+    for result in report["results"]:
+        old = previous.get((result["schema"], result["rows"], result["operation"]))
+        if old and result["p50_ms"] > old["p50_ms"] * tolerance:
+            regressions.append(
+                dict(
+                    result,
+                    baseline_p50_ms=old["p50_ms"],
+                    ratio=result["p50_ms"] / old["p50_ms"],
+                )
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--rows", type=int, nargs="+", default=[10_000, 1_000_000, 10_000_000]
+    )
+    parser.add_argument(
+        "--schemas", nargs="+", choices=["v3", "v4"], default=["v3", "v4"]
+    )
+    parser.add_argument(
+        "--samples", type=float, default=1.0, help="scale the number of samples"
+    )
+    parser.add_argument("--output", help="write the JSON report here (default: stdout)")
+    parser.add_argument("--compare", help="baseline JSON report to check against")
+    parser.add_argument("--tolerance", type=float, default=1.5)
+    args = parser.parse_args()
+
+    report = {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "rows": sorted(args.rows),
+        },
+        "results": [],
+    }
+    for schema in args.schemas:
+        rng = numpy.random.default_rng(42)
+        # Keep stdout for the JSON report (migrations print their progress)
+        with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(
+            sys.stderr
+        ):
+            target = V4Target(tmp) if schema == "v4" else V3Target(tmp)
+            loaded = 0
+            for rows in sorted(args.rows):
+                loaded = grow(target, rng, rows, loaded)
+                for result in run_operations(target, rng, loaded, args.samples):
+                    report["results"].append(dict(result, schema=schema, rows=rows))
+                    print(
+                        f"{schema} {rows:>10} {result['operation']:<20} "
+                        f"p50 {result['p50_ms']:10.3f} ms",
+                        file=sys.stderr,
+                    )
+            target.close()
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            report["regressions"] = compare(
+                report, json.load(baseline_file), args.tolerance
+            )
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output + "\n")
+    else:
+        print(output)
+
+    if report.get("regressions"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,11 @@
+-- Time index for tbl_LEITURA. ltr_DATA leads so ORDER BY ltr_DATA and time
+-- range filters become index scans; the reading columns make it a covering
+-- index for the dashboard's monthly averages and irrigation counts.
+CREATE INDEX IF NOT EXISTS
+  idx_tbl_LEITURA_ltr_DATA ON tbl_LEITURA (
+    ltr_DATA,
+    ltr_UMIDADE,
+    ltr_TEMPERATURA,
+    ltr_PH,
+    ltr_STATUS_IRRIGACAO
+  );
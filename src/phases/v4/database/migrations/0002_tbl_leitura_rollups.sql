@@ -0,0 +1,269 @@
+-- Hourly, daily and monthly rollups of tbl_LEITURA. Each row keeps count,
+-- sum, min, max and sum of squares of the analog readings (so means and
+-- standard deviations can be derived) and counts of the P/K/irrigation flags.
+-- The insert trigger keeps them current; utils/rollups.py can rebuild them.
+
+CREATE TABLE
+  tbl_LEITURA_HORA (
+    agr_PERIODO TEXT PRIMARY KEY,
+    agr_QTD INTEGER NOT NULL,
+    agr_UMIDADE_SOMA REAL NOT NULL,
+    agr_UMIDADE_MIN REAL NOT NULL,
+    agr_UMIDADE_MAX REAL NOT NULL,
+    agr_UMIDADE_SOMA_QUAD REAL NOT NULL,
+    agr_TEMPERATURA_SOMA REAL NOT NULL,
+    agr_TEMPERATURA_MIN REAL NOT NULL,
+    agr_TEMPERATURA_MAX REAL NOT NULL,
+    agr_TEMPERATURA_SOMA_QUAD REAL NOT NULL,
+    agr_PH_SOMA REAL NOT NULL,
+    agr_PH_MIN REAL NOT NULL,
+    agr_PH_MAX REAL NOT NULL,
+    agr_PH_SOMA_QUAD REAL NOT NULL,
+    agr_NUTRIENTE_P_QTD INTEGER NOT NULL,
+    agr_NUTRIENTE_K_QTD INTEGER NOT NULL,
+    agr_IRRIGACAO_QTD INTEGER NOT NULL
+  );
+
+CREATE TABLE
+  tbl_LEITURA_DIA (
+    agr_PERIODO TEXT PRIMARY KEY,
+    agr_QTD INTEGER NOT NULL,
+    agr_UMIDADE_SOMA REAL NOT NULL,
+    agr_UMIDADE_MIN REAL NOT NULL,
+    agr_UMIDADE_MAX REAL NOT NULL,
+    agr_UMIDADE_SOMA_QUAD REAL NOT NULL,
+    agr_TEMPERATURA_SOMA REAL NOT NULL,
+    agr_TEMPERATURA_MIN REAL NOT NULL,
+    agr_TEMPERATURA_MAX REAL NOT NULL,
+    agr_TEMPERATURA_SOMA_QUAD REAL NOT NULL,
+    agr_PH_SOMA REAL NOT NULL,
+    agr_PH_MIN REAL NOT NULL,
+    agr_PH_MAX REAL NOT NULL,
+    agr_PH_SOMA_QUAD REAL NOT NULL,
+    agr_NUTRIENTE_P_QTD INTEGER NOT NULL,
+    agr_NUTRIENTE_K_QTD INTEGER NOT NULL,
+    agr_IRRIGACAO_QTD INTEGER NOT NULL
+  );
+
+CREATE TABLE
+  tbl_LEITURA_MES (
+    agr_PERIODO TEXT PRIMARY KEY,
+    agr_QTD INTEGER NOT NULL,
+    agr_UMIDADE_SOMA REAL NOT NULL,
+    agr_UMIDADE_MIN REAL NOT NULL,
+    agr_UMIDADE_MAX REAL NOT NULL,
+    agr_UMIDADE_SOMA_QUAD REAL NOT NULL,
+    agr_TEMPERATURA_SOMA REAL NOT NULL,
+    agr_TEMPERATURA_MIN REAL NOT NULL,
+    agr_TEMPERATURA_MAX REAL NOT NULL,
+    agr_TEMPERATURA_SOMA_QUAD REAL NOT NULL,
+    agr_PH_SOMA REAL NOT NULL,
+    agr_PH_MIN REAL NOT NULL,
+    agr_PH_MAX REAL NOT NULL,
+    agr_PH_SOMA_QUAD REAL NOT NULL,
+    agr_NUTRIENTE_P_QTD INTEGER NOT NULL,
+    agr_NUTRIENTE_K_QTD INTEGER NOT NULL,
+    agr_IRRIGACAO_QTD INTEGER NOT NULL
+  );
+
+INSERT INTO
+  tbl_LEITURA_HORA
+SELECT
+  strftime('%Y-%m-%d %H:00:00', ltr_DATA),
+  COUNT(*),
+  SUM(ltr_UMIDADE),
+  MIN(ltr_UMIDADE),
+  MAX(ltr_UMIDADE),
+  SUM(ltr_UMIDADE * ltr_UMIDADE),
+  SUM(ltr_TEMPERATURA),
+  MIN(ltr_TEMPERATURA),
+  MAX(ltr_TEMPERATURA),
+  SUM(ltr_TEMPERATURA * ltr_TEMPERATURA),
+  SUM(ltr_PH),
+  MIN(ltr_PH),
+  MAX(ltr_PH),
+  SUM(ltr_PH * ltr_PH),
+  SUM(ltr_NUTRIENTE_P),
+  SUM(ltr_NUTRIENTE_K),
+  SUM(ltr_STATUS_IRRIGACAO)
+FROM
+  tbl_LEITURA
+GROUP BY
+  1;
+
+INSERT INTO
+  tbl_LEITURA_DIA
+SELECT
+  strftime('%Y-%m-%d', ltr_DATA),
+  COUNT(*),
+  SUM(ltr_UMIDADE),
+  MIN(ltr_UMIDADE),
+  MAX(ltr_UMIDADE),
+  SUM(ltr_UMIDADE * ltr_UMIDADE),
+  SUM(ltr_TEMPERATURA),
+  MIN(ltr_TEMPERATURA),
+  MAX(ltr_TEMPERATURA),
+  SUM(ltr_TEMPERATURA * ltr_TEMPERATURA),
+  SUM(ltr_PH),
+  MIN(ltr_PH),
+  MAX(ltr_PH),
+  SUM(ltr_PH * ltr_PH),
+  SUM(ltr_NUTRIENTE_P),
+  SUM(ltr_NUTRIENTE_K),
+  SUM(ltr_STATUS_IRRIGACAO)
+FROM
+  tbl_LEITURA
+GROUP BY
+  1;
+
+INSERT INTO
+  tbl_LEITURA_MES
+SELECT
+  strftime('%Y-%m', ltr_DATA),
+  COUNT(*),
+  SUM(ltr_UMIDADE),
+  MIN(ltr_UMIDADE),
+  MAX(ltr_UMIDADE),
+  SUM(ltr_UMIDADE * ltr_UMIDADE),
+  SUM(ltr_TEMPERATURA),
+  MIN(ltr_TEMPERATURA),
+  MAX(ltr_TEMPERATURA),
+  SUM(ltr_TEMPERATURA * ltr_TEMPERATURA),
+  SUM(ltr_PH),
+  MIN(ltr_PH),
+  MAX(ltr_PH),
+  SUM(ltr_PH * ltr_PH),
+  SUM(ltr_NUTRIENTE_P),
+  SUM(ltr_NUTRIENTE_K),
+  SUM(ltr_STATUS_IRRIGACAO)
+FROM
+  tbl_LEITURA
+GROUP BY
+  1;
+
+CREATE TRIGGER
+  trg_tbl_LEITURA_rollups AFTER INSERT ON tbl_LEITURA
+BEGIN
+  INSERT INTO
+    tbl_LEITURA_HORA
+  VALUES
+    (
+      strftime('%Y-%m-%d %H:00:00', NEW.ltr_DATA),
+      1,
+      NEW.ltr_UMIDADE,
+      NEW.ltr_UMIDADE,
+      NEW.ltr_UMIDADE,
+      NEW.ltr_UMIDADE * NEW.ltr_UMIDADE,
+      NEW.ltr_TEMPERATURA,
+      NEW.ltr_TEMPERATURA,
+      NEW.ltr_TEMPERATURA,
+      NEW.ltr_TEMPERATURA * NEW.ltr_TEMPERATURA,
+      NEW.ltr_PH,
+      NEW.ltr_PH,
+      NEW.ltr_PH,
+      NEW.ltr_PH * NEW.ltr_PH,
+      NEW.ltr_NUTRIENTE_P,
+      NEW.ltr_NUTRIENTE_K,
+      NEW.ltr_STATUS_IRRIGACAO
+    )
+  ON CONFLICT (agr_PERIODO) DO UPDATE
+  SET
+    agr_QTD = agr_QTD + 1,
+    agr_UMIDADE_SOMA = agr_UMIDADE_SOMA + excluded.agr_UMIDADE_SOMA,
+    agr_UMIDADE_MIN = MIN(agr_UMIDADE_MIN, excluded.agr_UMIDADE_MIN),
+    agr_UMIDADE_MAX = MAX(agr_UMIDADE_MAX, excluded.agr_UMIDADE_MAX),
+    agr_UMIDADE_SOMA_QUAD = agr_UMIDADE_SOMA_QUAD + excluded.agr_UMIDADE_SOMA_QUAD,
+    agr_TEMPERATURA_SOMA = agr_TEMPERATURA_SOMA + excluded.agr_TEMPERATURA_SOMA,
+    agr_TEMPERATURA_MIN = MIN(agr_TEMPERATURA_MIN, excluded.agr_TEMPERATURA_MIN),
+    agr_TEMPERATURA_MAX = MAX(agr_TEMPERATURA_MAX, excluded.agr_TEMPERATURA_MAX),
+    agr_TEMPERATURA_SOMA_QUAD = agr_TEMPERATURA_SOMA_QUAD + excluded.agr_TEMPERATURA_SOMA_QUAD,
+    agr_PH_SOMA = agr_PH_SOMA + excluded.agr_PH_SOMA,
+    agr_PH_MIN = MIN(agr_PH_MIN, excluded.agr_PH_MIN),
+    agr_PH_MAX = MAX(agr_PH_MAX, excluded.agr_PH_MAX),
+    agr_PH_SOMA_QUAD = agr_PH_SOMA_QUAD + excluded.agr_PH_SOMA_QUAD,
+    agr_NUTRIENTE_P_QTD = agr_NUTRIENTE_P_QTD + excluded.agr_NUTRIENTE_P_QTD,
+    agr_NUTRIENTE_K_QTD = agr_NUTRIENTE_K_QTD + excluded.agr_NUTRIENTE_K_QTD,
+    agr_IRRIGACAO_QTD = agr_IRRIGACAO_QTD + excluded.agr_IRRIGACAO_QTD;
+
+  INSERT INTO
+    tbl_LEITURA_DIA
+  VALUES
+    (
+      strftime('%Y-%m-%d', NEW.ltr_DATA),
+      1,
+      NEW.ltr_UMIDADE,
+      NEW.ltr_UMIDADE,
+      NEW.ltr_UMIDADE,
+      NEW.ltr_UMIDADE * NEW.ltr_UMIDADE,
+      NEW.ltr_TEMPERATURA,
+      NEW.ltr_TEMPERATURA,
+      NEW.ltr_TEMPERATURA,
+      NEW.ltr_TEMPERATURA * NEW.ltr_TEMPERATURA,
+      NEW.ltr_PH,
+      NEW.ltr_PH,
+      NEW.ltr_PH,
+      NEW.ltr_PH * NEW.ltr_PH,
+      NEW.ltr_NUTRIENTE_P,
+      NEW.ltr_NUTRIENTE_K,
+      NEW.ltr_STATUS_IRRIGACAO
+    )
+  ON CONFLICT (agr_PERIODO) DO UPDATE
+  SET
+    agr_QTD = agr_QTD + 1,
+    agr_UMIDADE_SOMA = agr_UMIDADE_SOMA + excluded.agr_UMIDADE_SOMA,
+    agr_UMIDADE_MIN = MIN(agr_UMIDADE_MIN, excluded.agr_UMIDADE_MIN),
+    agr_UMIDADE_MAX = MAX(agr_UMIDADE_MAX, excluded.agr_UMIDADE_MAX),
+    agr_UMIDADE_SOMA_QUAD = agr_UMIDADE_SOMA_QUAD + excluded.agr_UMIDADE_SOMA_QUAD,
+    agr_TEMPERATURA_SOMA = agr_TEMPERATURA_SOMA + excluded.agr_TEMPERATURA_SOMA,
+    agr_TEMPERATURA_MIN = MIN(agr_TEMPERATURA_MIN, excluded.agr_TEMPERATURA_MIN),
+    agr_TEMPERATURA_MAX = MAX(agr_TEMPERATURA_MAX, excluded.agr_TEMPERATURA_MAX),
+    agr_TEMPERATURA_SOMA_QUAD = agr_TEMPERATURA_SOMA_QUAD + excluded.agr_TEMPERATURA_SOMA_QUAD,
+    agr_PH_SOMA = agr_PH_SOMA + excluded.agr_PH_SOMA,
+    agr_PH_MIN = MIN(agr_PH_MIN, excluded.agr_PH_MIN),
+    agr_PH_MAX = MAX(agr_PH_MAX, excluded.agr_PH_MAX),
+    agr_PH_SOMA_QUAD = agr_PH_SOMA_QUAD + excluded.agr_PH_SOMA_QUAD,
+    agr_NUTRIENTE_P_QTD = agr_NUTRIENTE_P_QTD + excluded.agr_NUTRIENTE_P_QTD,
+    agr_NUTRIENTE_K_QTD = agr_NUTRIENTE_K_QTD + excluded.agr_NUTRIENTE_K_QTD,
+    agr_IRRIGACAO_QTD = agr_IRRIGACAO_QTD + excluded.agr_IRRIGACAO_QTD;
+
+  INSERT INTO
+    tbl_LEITURA_MES
+  VALUES
+    (
+      strftime('%Y-%m', NEW.ltr_DATA),
+      1,
+      NEW.ltr_UMIDADE,
+      NEW.ltr_UMIDADE,
+      NEW.ltr_UMIDADE,
+      NEW.ltr_UMIDADE * NEW.ltr_UMIDADE,
+      NEW.ltr_TEMPERATURA,
+      NEW.ltr_TEMPERATURA,
+      NEW.ltr_TEMPERATURA,
+      NEW.ltr_TEMPERATURA * NEW.ltr_TEMPERATURA,
+      NEW.ltr_PH,
+      NEW.ltr_PH,
+      NEW.ltr_PH,
+      NEW.ltr_PH * NEW.ltr_PH,
+      NEW.ltr_NUTRIENTE_P,
+      NEW.ltr_NUTRIENTE_K,
+      NEW.ltr_STATUS_IRRIGACAO
+    )
+  ON CONFLICT (agr_PERIODO) DO UPDATE
+  SET
+    agr_QTD = agr_QTD + 1,
+    agr_UMIDADE_SOMA = agr_UMIDADE_SOMA + excluded.agr_UMIDADE_SOMA,
+    agr_UMIDADE_MIN = MIN(agr_UMIDADE_MIN, excluded.agr_UMIDADE_MIN),
+    agr_UMIDADE_MAX = MAX(agr_UMIDADE_MAX, excluded.agr_UMIDADE_MAX),
+    agr_UMIDADE_SOMA_QUAD = agr_UMIDADE_SOMA_QUAD + excluded.agr_UMIDADE_SOMA_QUAD,
+    agr_TEMPERATURA_SOMA = agr_TEMPERATURA_SOMA + excluded.agr_TEMPERATURA_SOMA,
+    agr_TEMPERATURA_MIN = MIN(agr_TEMPERATURA_MIN, excluded.agr_TEMPERATURA_MIN),
+    agr_TEMPERATURA_MAX = MAX(agr_TEMPERATURA_MAX, excluded.agr_TEMPERATURA_MAX),
+    agr_TEMPERATURA_SOMA_QUAD = agr_TEMPERATURA_SOMA_QUAD + excluded.agr_TEMPERATURA_SOMA_QUAD,
+    agr_PH_SOMA = agr_PH_SOMA + excluded.agr_PH_SOMA,
+    agr_PH_MIN = MIN(agr_PH_MIN, excluded.agr_PH_MIN),
+    agr_PH_MAX = MAX(agr_PH_MAX, excluded.agr_PH_MAX),
+    agr_PH_SOMA_QUAD = agr_PH_SOMA_QUAD + excluded.agr_PH_SOMA_QUAD,
+    agr_NUTRIENTE_P_QTD = agr_NUTRIENTE_P_QTD + excluded.agr_NUTRIENTE_P_QTD,
+    agr_NUTRIENTE_K_QTD = agr_NUTRIENTE_K_QTD + excluded.agr_NUTRIENTE_K_QTD,
+    agr_IRRIGACAO_QTD = agr_IRRIGACAO_QTD + excluded.agr_IRRIGACAO_QTD;
+END;
@@ -0,0 +1,53 @@
+-- Multi-sensor, multi-location model from Phase 2 (src/phases/v2/data-model.sql).
+-- Sensor_Reading is a WITHOUT ROWID table keyed by (sensor_id, timestamp), so
+-- the readings of one sensor are stored together in time order and a sensor's
+-- time window is a single range scan of the table itself. The
+-- (location_id, timestamp) index does the same for one location. A sensor
+-- sends at most one reading per second, which replaces Phase 2's reading_id.
+
+CREATE TABLE
+  Sensor (
+    sensor_id INTEGER PRIMARY KEY,
+    sensor_type TEXT NOT NULL
+  );
+
+CREATE TABLE
+  Location (
+    location_id INTEGER PRIMARY KEY,
+    location_name TEXT NOT NULL,
+    coordinates TEXT NOT NULL
+  );
+
+CREATE TABLE
+  Crop (
+    crop_id INTEGER PRIMARY KEY,
+    crop_name TEXT NOT NULL,
+    planting_date TIMESTAMP NOT NULL
+  );
+
+CREATE TABLE
+  Application (
+    application_id INTEGER PRIMARY KEY,
+    crop_id INTEGER NOT NULL REFERENCES Crop (crop_id),
+    timestamp TIMESTAMP NOT NULL,
+    water_amount REAL,
+    phosphorus_amount REAL,
+    potassium_amount REAL
+  );
+
+CREATE INDEX idx_Application_crop_id_timestamp ON Application (crop_id, timestamp);
+
+CREATE TABLE
+  Sensor_Reading (
+    sensor_id INTEGER NOT NULL REFERENCES Sensor (sensor_id),
+    timestamp TIMESTAMP NOT NULL,
+    crop_id INTEGER NOT NULL REFERENCES Crop (crop_id),
+    location_id INTEGER NOT NULL REFERENCES Location (location_id),
+    moisture_value REAL,
+    ph_value REAL,
+    phosphorus_value REAL,
+    potassium_value REAL,
+    PRIMARY KEY (sensor_id, timestamp)
+  ) WITHOUT ROWID;
+
+CREATE INDEX idx_Sensor_Reading_location_id_timestamp ON Sensor_Reading (location_id, timestamp);
@@ -0,0 +1,46 @@
+-- Change counters used as the data version of cached query results (see
+-- utils/query_cache.py). Every insert, update or delete on a tracked table
+-- bumps its counter, so a result cached under an older counter is never
+-- served again. Bulk loads that drop the triggers bump it themselves.
+
+CREATE TABLE
+  tbl_VERSAO (
+    ver_TABELA TEXT PRIMARY KEY,
+    ver_CONTADOR INTEGER NOT NULL DEFAULT 0
+  );
+
+INSERT INTO
+  tbl_VERSAO (ver_TABELA)
+VALUES
+  ('tbl_LEITURA'),
+  ('Sensor_Reading');
+
+CREATE TRIGGER trg_tbl_LEITURA_versao_insert AFTER INSERT ON tbl_LEITURA
+BEGIN
+  UPDATE tbl_VERSAO SET ver_CONTADOR = ver_CONTADOR + 1 WHERE ver_TABELA = 'tbl_LEITURA';
+END;
+
+CREATE TRIGGER trg_tbl_LEITURA_versao_update AFTER UPDATE ON tbl_LEITURA
+BEGIN
+  UPDATE tbl_VERSAO SET ver_CONTADOR = ver_CONTADOR + 1 WHERE ver_TABELA = 'tbl_LEITURA';
+END;
+
+CREATE TRIGGER trg_tbl_LEITURA_versao_delete AFTER DELETE ON tbl_LEITURA
+BEGIN
+  UPDATE tbl_VERSAO SET ver_CONTADOR = ver_CONTADOR + 1 WHERE ver_TABELA = 'tbl_LEITURA';
+END;
+
+CREATE TRIGGER trg_Sensor_Reading_versao_insert AFTER INSERT ON Sensor_Reading
+BEGIN
+  UPDATE tbl_VERSAO SET ver_CONTADOR = ver_CONTADOR + 1 WHERE ver_TABELA = 'Sensor_Reading';
+END;
+
+CREATE TRIGGER trg_Sensor_Reading_versao_update AFTER UPDATE ON Sensor_Reading
+BEGIN
+  UPDATE tbl_VERSAO SET ver_CONTADOR = ver_CONTADOR + 1 WHERE ver_TABELA = 'Sensor_Reading';
+END;
+
+CREATE TRIGGER trg_Sensor_Reading_versao_delete AFTER DELETE ON Sensor_Reading
+BEGIN
+  UPDATE tbl_VERSAO SET ver_CONTADOR = ver_CONTADOR + 1 WHERE ver_TABELA = 'Sensor_Reading';
+END;
@@ -0,0 +1,14 @@
+-- Device that sent each reading. Together with ltr_DATA from the payload it
+-- identifies a reading, so redelivered MQTT messages are ignored by
+-- INSERT ... ON CONFLICT DO NOTHING. Rows without a device (local inserts and
+-- readings from before this migration) are not part of the index and are
+-- never deduplicated.
+ALTER TABLE tbl_LEITURA ADD COLUMN ltr_DISPOSITIVO TEXT;
+
+CREATE UNIQUE INDEX IF NOT EXISTS
+  idx_tbl_LEITURA_ltr_DISPOSITIVO_ltr_DATA ON tbl_LEITURA (
+    ltr_DISPOSITIVO,
+    ltr_DATA
+  )
+WHERE
+  ltr_DISPOSITIVO IS NOT NULL;
@@ -0,0 +1,15 @@
+-- 1 when ltr_DATA is the time the reading arrived because its payload had
+-- none. Two such readings of one device in the same second are different
+-- readings, so only producer timestamps (0) identify a redelivered reading.
+ALTER TABLE tbl_LEITURA ADD COLUMN ltr_DATA_RECEBIDA INTEGER NOT NULL DEFAULT 0;
+
+DROP INDEX IF EXISTS idx_tbl_LEITURA_ltr_DISPOSITIVO_ltr_DATA;
+
+CREATE UNIQUE INDEX IF NOT EXISTS
+  idx_tbl_LEITURA_ltr_DISPOSITIVO_ltr_DATA ON tbl_LEITURA (
+    ltr_DISPOSITIVO,
+    ltr_DATA
+  )
+WHERE
+  ltr_DISPOSITIVO IS NOT NULL
+  AND ltr_DATA_RECEBIDA = 0;
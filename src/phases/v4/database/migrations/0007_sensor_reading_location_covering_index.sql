@@ -0,0 +1,17 @@
+-- Sensor_Reading is WITHOUT ROWID, so every row found through the
+-- (location_id, timestamp) index cost a second lookup in the primary key
+-- B-tree for its values. Carrying the other columns in the index (the key
+-- columns sensor_id and timestamp are always part of it) answers a
+-- location window from the index alone.
+DROP INDEX IF EXISTS idx_Sensor_Reading_location_id_timestamp;
+
+CREATE INDEX IF NOT EXISTS
+  idx_Sensor_Reading_location_id_timestamp ON Sensor_Reading (
+    location_id,
+    timestamp,
+    crop_id,
+    moisture_value,
+    ph_value,
+    phosphorus_value,
+    potassium_value
+  );
@@ -0,0 +1,36 @@
+import os
+import sys
+import pytest
+
+V4_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(V4_ROOT, "app"))
+
+from utils import database  # noqa: E402
+from utils.connection import close_all_pools  # noqa: E402
+from utils.query_cache import QUERY_CACHE  # noqa: E402
+from utils.snapshot import close_all_snapshots  # noqa: E402
+
+
+@pytest.fixture
+def v4_database(tmp_path, monkeypatch):
+    """The database module pointed at a new v4 database in `tmp_path`."""
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "data.db"))
+    monkeypatch.setattr(database, "CSV_PATH", str(tmp_path / "tbl_LEITURA.csv"))
+    monkeypatch.setattr(
+        database, "INIT_SQL_PATH", os.path.join(V4_ROOT, "database", "init.sql")
+    )
+    monkeypatch.setattr(
+        database, "MIGRATIONS_PATH", os.path.join(V4_ROOT, "database", "migrations")
+    )
+    monkeypatch.setattr(database, "SNAPSHOT_PATH", str(tmp_path / "snapshot.db"))
+    monkeypatch.setattr(database, "SENSOR_STORAGE", "sqlite")
+    monkeypatch.setattr(database, "READ_SNAPSHOT", "wal")
+    monkeypatch.setattr(database, "DB_INITIALIZED", False)
+    monkeypatch.setattr(
+        database, "SENSOR_CACHE", {"watermark": 0, "history": None, "data": None}
+    )
+    QUERY_CACHE.clear()
+    yield database
+    close_all_snapshots()
+    close_all_pools()
+    QUERY_CACHE.clear()
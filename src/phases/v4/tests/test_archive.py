@@ -0,0 +1,122 @@
+import os
+import numpy
+import pandas
+import pytest
+from utils import archive
+
+
+def readings(device, count, start="2024-01-01", first_id=1):
+    data = pandas.DataFrame(
+        {
+            "ID_LEITURA": numpy.arange(first_id, first_id + count),
+            "ltr_UMIDADE": numpy.round(numpy.linspace(30, 55, count), 2),
+            "ltr_TEMPERATURA": numpy.linspace(7, 38.3, count),  # not 2 decimals
+            "ltr_PH": numpy.full(count, 6.5),
+            "ltr_NUTRIENTE_P": numpy.arange(count) % 2,
+            "ltr_NUTRIENTE_K": numpy.ones(count, dtype=int),
+            "ltr_STATUS_IRRIGACAO": (numpy.arange(count) // 3) % 2,
+            "ltr_DATA": pandas.date_range(start, periods=count, freq="10s"),
+        }
+    )
+    data["ltr_DISPOSITIVO"] = device
+    return data
+
+
+def sorted_readings(data):
+    return data.sort_values("ID_LEITURA", ignore_index=True)
+
+
+def test_archive_round_trip_keeps_every_column(tmp_path):
+    path = str(tmp_path / "archive.ftsa")
+    source = pandas.concat(
+        [
+            readings("esp32-a", 50),
+            readings("esp32-b", 30, first_id=51),
+            readings(None, 20, first_id=81),
+        ],
+        ignore_index=True,
+    )
+    assert archive.write_archive([source], path, block_rows=16) == 100
+
+    data = sorted_readings(archive.load_archive(path).drop(columns="month"))
+    expected = sorted_readings(source)
+    pandas.testing.assert_frame_equal(
+        data[expected.columns], expected, check_dtype=False
+    )
+
+
+def test_archive_filters_by_device_and_time(tmp_path):
+    path = str(tmp_path / "archive.ftsa")
+    archive.write_archive([readings("esp32-a", 50)], path)
+    archive.write_archive([readings("esp32-b", 50, first_id=51)], path)
+
+    data = archive.load_archive(path, device="esp32-b", end="2024-01-01 00:01:00")
+    assert set(data["ltr_DISPOSITIVO"]) == {"esp32-b"}
+    assert sorted(data["ID_LEITURA"]) == list(range(51, 57))
+
+
+def test_generator_device_numbers_are_stored_as_text(tmp_path):
+    path = str(tmp_path / "archive.ftsa")
+    source = readings(None, 10).drop(columns="ltr_DISPOSITIVO")
+    source["device"] = numpy.arange(10) % 2
+    archive.write_archive([source], path)
+    data = archive.load_archive(path, device="1")
+    assert sorted(data["ID_LEITURA"]) == list(range(2, 11, 2))
+
+
+def test_version_1_archives_are_read_but_not_appended_to(tmp_path):
+    path = tmp_path / "archive.ftsa"
+    block = readings(None, 10)
+    encoded = archive.encode_block(None, block)
+    _, count, first, last, size = archive.BLOCK_HEADER.unpack_from(encoded)
+    path.write_bytes(
+        archive.MAGIC
+        + bytes([1])
+        + archive.BLOCK_HEADER_V1.pack(7, count, first, last, size)
+        + encoded[archive.BLOCK_HEADER.size :]
+    )
+
+    data = archive.load_archive(str(path))
+    assert set(data["ltr_DISPOSITIVO"]) == {"7"}
+    assert sorted(data["ID_LEITURA"]) == list(range(1, 11))
+    with pytest.raises(ValueError):
+        archive.write_archive([block], str(path))
+
+
+def test_blocks_are_read_one_at_a_time(tmp_path):
+    path = str(tmp_path / "archive.ftsa")
+    archive.write_archive([readings("esp32-a", 40)], path, block_rows=10)
+    frames = archive.read_archive(path)
+    assert len(next(frames)) == 10
+
+    # A truncated last block only fails when it is reached
+    with open(path, "r+b") as archive_file:
+        archive_file.truncate(archive_file.seek(0, 2) - 1)
+    frames = archive.read_archive(path)
+    assert [len(next(frames)) for _ in range(3)] == [10, 10, 10]
+    with pytest.raises(ValueError):
+        next(frames)
+
+
+def test_rerunning_the_archive_adds_only_new_readings(v4_database, tmp_path):
+    path = str(tmp_path / "archive.ftsa")
+    v4_database.save_sensor_data_many(
+        [(40.0, 21.0, 6.5, 1, 0, 1, "2000-01-01 00:00:00", "esp32", 0)]
+    )
+    rows = archive.archive_readings("2001-01-01", path)
+    assert rows >= 1
+    assert archive.archive_readings("2001-01-01", path) == 0
+
+    # A late reading of the archived period is added on the next run
+    v4_database.save_sensor_data_many(
+        [(41.0, 21.0, 6.5, 1, 0, 1, "2000-01-01 00:00:10", "esp32", 0)]
+    )
+    assert archive.archive_readings("2001-01-01", path) == 1
+    data = archive.load_archive(path)
+    assert len(data) == rows + 1
+    assert data["ID_LEITURA"].is_unique
+    assert archive.archived_max_id(path) == data["ID_LEITURA"].max()
+
+    # Archives without a manifest get the mark from their blocks
+    os.remove(path + archive.MANIFEST_SUFFIX)
+    assert archive.archive_readings("2001-01-01", path) == 0
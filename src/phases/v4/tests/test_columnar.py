@@ -0,0 +1,163 @@
+import os
+import time
+import pandas
+import pyarrow
+from utils import columnar
+from utils.columnar import READING_COLUMNS, SCHEMA, ColumnarStore
+from utils.rollups import rebuild_rollups
+
+
+def reading(timestamp):
+    return (40.0, 20.0, 6.5, 1, 0, 1, timestamp)
+
+
+def test_compaction_swaps_the_manifest_and_keeps_replaced_files(tmp_path):
+    store = ColumnarStore(str(tmp_path / "columnar"))
+    for day in range(1, 5):
+        store.save_sensor_data_many([reading(f"2024-01-0{day} 00:00:00")])
+    before = store._read_manifest()["files"]
+
+    assert store.compact() == 4
+    assert len(store._read_manifest()["files"]) == 1
+    assert sorted(store.fetch_sensor_data()["ID_LEITURA"]) == [1, 2, 3, 4]
+    # A reader that listed the old files can still open them
+    assert all(os.path.exists(store._path(name)) for name in before)
+
+
+def test_only_one_process_compacts_at_a_time(tmp_path):
+    store = ColumnarStore(str(tmp_path / "columnar"))
+    store.save_sensor_data_many([reading("2024-01-01 00:00:00")])
+    store.save_sensor_data_many([reading("2024-01-02 00:00:00")])
+    lock = store._path(columnar.COMPACTION_LOCK)
+    with columnar._file_lock(lock, blocking=False) as owner:
+        assert owner
+        assert store.compact() == 0
+    assert store.compact() == 2
+
+
+def test_unlisted_files_are_removed(tmp_path, monkeypatch):
+    monkeypatch.setattr(columnar, "RETAIN_SECONDS", 0)
+    store = ColumnarStore(str(tmp_path / "columnar"))
+    store.save_sensor_data_many([reading("2024-01-01 00:00:00")])
+    store.save_sensor_data_many([reading("2024-01-02 00:00:00")])
+    # Left by a compaction that crashed before its manifest swap
+    orphan = tmp_path / "columnar" / "month=2024-01" / "part-orphan.parquet"
+    orphan.write_bytes(b"")
+
+    store.compact()
+    assert os.listdir(tmp_path / "columnar" / "month=2024-01") == [
+        os.path.basename(store._read_manifest()["files"][0])
+    ]
+
+
+def test_single_readings_are_flushed_after_flush_seconds(tmp_path):
+    store = ColumnarStore(str(tmp_path / "columnar"), flush_seconds=0.1)
+    store.save_sensor_data(40.0, 20.0, 6.5, 1, 0, 1)
+    assert len(store.fetch_sensor_data()) == 0
+    time.sleep(0.5)
+    assert len(store.fetch_sensor_data()) == 1
+
+
+def sqlite_and_columnar(database, tmp_path, monkeypatch, rows):
+    """Run `read()` against the same readings in tbl_LEITURA and in a store."""
+    with database.connect() as connection:
+        connection.execute("DELETE FROM tbl_LEITURA")
+        connection.commit()
+    database.save_sensor_data_many(rows)
+    rebuild_rollups()
+    store = ColumnarStore(str(tmp_path / "columnar"))
+    store.save_sensor_data_many(rows)
+    monkeypatch.setattr(database, "get_columnar_store", lambda: store)
+
+    def run(read):
+        monkeypatch.setattr(database, "SENSOR_STORAGE", "sqlite")
+        expected = read()
+        monkeypatch.setattr(database, "SENSOR_STORAGE", "columnar")
+        return expected, read()
+
+    return run
+
+
+def test_columnar_reads_match_sqlite(v4_database, tmp_path, monkeypatch):
+    import pandas
+    from utils.export import _fetch_rows_after
+    from utils.query import query_sensor_data
+    from utils.rollups import fetch_rollups
+
+    rows = [
+        (
+            30.0 + i,
+            20.0 - i,
+            6.5,
+            i % 2,
+            1,
+            (i // 2) % 2,
+            f"2024-0{1 + i % 3}-1{i % 7} 0{i % 9}:1{i % 6}:00",
+        )
+        for i in range(40)
+    ]
+    run = sqlite_and_columnar(v4_database, tmp_path, monkeypatch, rows)
+    for kwargs in (
+        {},
+        {"columns": ["ltr_UMIDADE", "ltr_DATA"], "start": "2024-02-01", "order": "asc"},
+        {"resample": "1h", "limit": 5, "offset": 2},
+        {"columns": ["ltr_PH", "ltr_NUTRIENTE_P"], "resample": "month"},
+    ):
+        expected, actual = run(lambda: query_sensor_data(**kwargs))
+        # IDs differ: tbl_LEITURA had the init.sql readings before
+        expected, actual = (
+            data.drop(columns="ID_LEITURA", errors="ignore")
+            for data in (expected, actual)
+        )
+        pandas.testing.assert_frame_equal(
+            actual.sort_values(list(actual.columns), ignore_index=True),
+            expected.sort_values(list(expected.columns), ignore_index=True),
+            check_dtype=False,
+        )
+    for granularity in ("hour", "day", "month"):
+        expected, actual = run(lambda: fetch_rollups(granularity))
+        pandas.testing.assert_frame_equal(actual, expected, check_dtype=False)
+    expected, actual = run(lambda: _fetch_rows_after(0))
+    expected["ltr_DATA"] = pandas.to_datetime(expected["ltr_DATA"])
+    pandas.testing.assert_frame_equal(
+        actual.drop(columns="ID_LEITURA"),
+        expected.drop(columns="ID_LEITURA"),
+        check_dtype=False,
+    )
+    assert run(lambda: _fetch_rows_after(10))[1]["ID_LEITURA"].tolist() == list(
+        range(11, 41)
+    )
+
+
+def test_redeliveries_are_not_stored_twice(tmp_path):
+    store = ColumnarStore(str(tmp_path / "columnar"))
+    stamped = (40.5, 21.25, 6.5, 1, 0, 1, "2024-01-02 03:04:05", "esp32", 0)
+    arrival = (40.5, 21.25, 6.5, 1, 0, 1, "2024-01-02 03:04:05", "esp32", 1)
+    other = (40.5, 21.25, 6.5, 1, 0, 1, "2024-01-02 03:04:05", "esp32-b", 0)
+    assert store.save_sensor_data_many([stamped, stamped]) == [stamped]
+    # Arrival-stamped readings are never redeliveries, and another device's
+    # reading at the same time is a different reading
+    assert store.save_sensor_data_many([stamped, arrival, arrival, other]) == [
+        arrival,
+        arrival,
+        other,
+    ]
+    data = store.fetch_sensor_data()
+    assert len(data) == 4
+    assert data["ltr_DATA_RECEBIDA"].tolist().count(1) == 2
+
+
+def test_compaction_drops_redeliveries_written_before_the_check(tmp_path):
+    store = ColumnarStore(str(tmp_path / "columnar"))
+    row = (40.5, 21.25, 6.5, 1, 0, 1, "2024-01-02 03:04:05", "esp32", 0)
+    # Two part files holding the same reading, as older stores may have
+    data = pandas.DataFrame([row], columns=READING_COLUMNS)
+    data["ltr_DATA"] = pandas.to_datetime(data["ltr_DATA"])
+    with store._update_manifest() as manifest:
+        for first_id in (1, 2):
+            table = pyarrow.Table.from_pandas(
+                data.assign(ID_LEITURA=first_id), schema=SCHEMA, preserve_index=False
+            )
+            manifest["files"].append(store._write_file("month=2024-01", table))
+    assert store.compact() == 2
+    assert store.fetch_sensor_data()["ID_LEITURA"].tolist() == [1]
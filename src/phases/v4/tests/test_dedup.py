@@ -0,0 +1,114 @@
+import json
+import pytest
+from utils.batch_writer import BatchWriter, _key
+from utils.ingest import decode_message
+from utils.payload import encode_payload
+
+RECEIVED = 1_700_000_000.0  # 2023-11-14 22:13:20 UTC
+
+
+def reading(**fields):
+    return {
+        "ltr_UMIDADE": 40.5,
+        "ltr_TEMPERATURA": 21.25,
+        "ltr_PH": 6.5,
+        "ltr_NUTRIENTE_P": 1,
+        "ltr_NUTRIENTE_K": 0,
+        "ltr_STATUS_IRRIGACAO": 1,
+        **fields,
+    }
+
+
+def count_readings(database):
+    with database.connect() as connection:
+        return connection.execute(
+            "SELECT COUNT(*) FROM tbl_LEITURA WHERE ltr_DISPOSITIVO IS NOT NULL"
+        ).fetchone()[0]
+
+
+def test_payload_timestamp_is_the_redelivery_key():
+    payload = json.dumps(reading(ltr_DATA="2024-01-02 03:04:05")).encode()
+    (row,) = decode_message("farm/esp32/sensors", payload, RECEIVED, "esp32")
+    assert row[6:] == ("2024-01-02 03:04:05", "esp32", 0)
+    assert _key(row) == ("esp32", "2024-01-02 03:04:05")
+
+
+def test_arrival_timestamp_is_not_a_redelivery_key():
+    payload = json.dumps(reading()).encode()
+    (row,) = decode_message("farm/esp32/sensors", payload, RECEIVED, "esp32")
+    assert row[6:] == ("2023-11-14 22:13:20", "esp32", 1)
+    assert _key(row) is None
+
+
+def test_readings_without_a_device_have_no_key():
+    assert _key((40.5, 21.25, 6.5, 1, 0, 1, "2024-01-02 03:04:05")) is None
+    assert _key((40.5, 21.25, 6.5, 1, 0, 1, "2024-01-02 03:04:05", None)) is None
+
+
+def test_database_skips_redeliveries_only(v4_database):
+    payload = json.dumps(reading(ltr_DATA="2024-01-02 03:04:05")).encode()
+    row = decode_message("farm/esp32/sensors", payload, RECEIVED, "esp32")[0]
+    assert v4_database.save_sensor_data_many([row]) == 1
+    assert v4_database.save_sensor_data_many([row]) == 0
+
+    # Two readings of one device arriving in the same second are both kept
+    payload = json.dumps(reading()).encode()
+    rows = [
+        decode_message("farm/esp32/sensors", payload, RECEIVED, "esp32")[0]
+        for _ in range(2)
+    ]
+    assert rows[0] == rows[1]
+    assert v4_database.save_sensor_data_many(rows) == 2
+    assert count_readings(v4_database) == 3
+
+
+def test_batch_writer_drops_recently_seen_keys_only(v4_database):
+    writer = BatchWriter(max_rows=100, max_age=0)
+    assert writer.save_sensor_data(40.5, 21.25, 6.5, 1, 0, 1, device="esp32")
+    assert writer.save_sensor_data(40.5, 21.25, 6.5, 1, 0, 1, device="esp32")
+    timestamp = "2024-01-02 03:04:05"
+    assert writer.save_sensor_data(40.5, 21.25, 6.5, 1, 0, 1, timestamp, "esp32")
+    assert not writer.save_sensor_data(40.5, 21.25, 6.5, 1, 0, 1, timestamp, "esp32")
+    writer.close()
+    assert writer.duplicates == 1
+    assert count_readings(v4_database) == 3
+
+
+def test_batches_need_a_timestamp_in_every_reading():
+    readings = [reading(ltr_DATA="2024-01-02 03:04:05"), reading(), reading()]
+    with pytest.raises(ValueError):
+        decode_message("farm/esp32/sensors", json.dumps(readings).encode(), RECEIVED)
+    with pytest.raises(ValueError):
+        encode_payload(readings, "binary")
+    # A binary batch from an older producer with unknown (0) timestamps
+    batch = encode_payload([reading(ltr_DATA="2024-01-02 03:04:05")] * 3, "binary")
+    batch = batch[:4] + b"\0" * 12 + batch[16:]
+    with pytest.raises(ValueError):
+        decode_message("farm/esp32/sensors", batch, RECEIVED)
+
+
+def test_timestamped_batches_keep_every_reading(v4_database):
+    readings = [reading(ltr_DATA=f"2024-01-02 03:04:0{second}") for second in range(3)]
+    for payload_format in ("json", "binary"):
+        payload = encode_payload(readings, payload_format)
+        rows = decode_message("farm/esp32/sensors", payload, RECEIVED, "esp32")
+        assert [row[6] for row in rows] == [
+            "2024-01-02 03:04:00",
+            "2024-01-02 03:04:01",
+            "2024-01-02 03:04:02",
+        ]
+        # The binary message repeats the JSON readings, so it is a redelivery
+        assert v4_database.save_sensor_data_many(rows) == (
+            3 if payload_format == "json" else 0
+        )
+
+
+def test_only_inserted_readings_reach_the_latest_buffer(v4_database, monkeypatch):
+    recorded = []
+    monkeypatch.setattr(v4_database, "_record_latest", recorded.extend)
+    stored = (40.5, 21.25, 6.5, 1, 0, 1, "2024-01-02 03:04:05", "esp32", 0)
+    new = (41.0, 21.0, 6.5, 1, 0, 1, "2024-01-02 03:04:15", "esp32", 0)
+    assert v4_database.save_sensor_data_many([stored]) == 1
+    recorded.clear()
+    assert v4_database.save_sensor_data_many([stored, new, new]) == 1
+    assert recorded == [new]
@@ -0,0 +1,19 @@
+from utils.export import export_sensor_data, read_manifest, read_sensor_export
+
+
+def test_reads_include_rows_written_after_the_export(v4_database):
+    manifest = export_sensor_data()
+    exported = read_sensor_export()
+    assert len(exported) == manifest["rows"]
+
+    # Written without refreshing the export, like the importer does
+    v4_database.save_sensor_data_many(
+        [(40.0, 21.0, 6.5, 1, 0, 1, "2030-01-01 00:00:00", "esp32", 0)]
+    )
+    assert len(read_sensor_export()) == manifest["rows"]
+    current = read_sensor_export(include_new=True)
+    assert len(current) == manifest["rows"] + 1
+    assert current.iloc[-1]["ltr_DATA"] == "2030-01-01 00:00:00"
+    assert list(current.columns) == list(exported.columns)
+    # Reading never writes the export
+    assert read_manifest() == manifest
@@ -0,0 +1,64 @@
+from utils.columnar import ColumnarStore
+from utils.generator import generate_frames, write_database
+from utils.importer import import_frames
+
+
+def test_generated_devices_are_imported(v4_database):
+    frames = generate_frames(devices=3, start="2024-01-01", periods=100, seed=1)
+    assert write_database(frames) == 300
+    with v4_database.connect() as connection:
+        devices = connection.execute(
+            "SELECT ltr_DISPOSITIVO, COUNT(*) FROM tbl_LEITURA "
+            "WHERE ltr_DISPOSITIVO IS NOT NULL GROUP BY 1 ORDER BY 1"
+        ).fetchall()
+    assert devices == [("0", 100), ("1", 100), ("2", 100)]
+
+
+def test_generated_devices_are_imported_into_the_columnar_store(
+    v4_database, tmp_path, monkeypatch
+):
+    store = ColumnarStore(str(tmp_path / "columnar"))
+    monkeypatch.setattr(v4_database, "SENSOR_STORAGE", "columnar")
+    monkeypatch.setattr(v4_database, "get_columnar_store", lambda: store)
+    write_database(generate_frames(devices=2, start="2024-01-01", periods=50, seed=1))
+    counts = store.fetch_sensor_data()["ltr_DISPOSITIVO"].value_counts()
+    assert counts.to_dict() == {"0": 50, "1": 50}
+
+
+def test_reimport_skips_duplicates_and_keeps_the_unique_index(v4_database):
+    frames = lambda: generate_frames(devices=2, start="2024-01-01", periods=10, seed=1)
+    assert write_database(frames()) == 20
+    assert write_database(frames()) == 0
+    with v4_database.connect() as connection:
+        assert connection.execute(
+            "SELECT 1 FROM sqlite_master "
+            "WHERE name = 'idx_tbl_LEITURA_ltr_DISPOSITIVO_ltr_DATA'"
+        ).fetchone()
+
+
+def test_rollups_include_readings_written_during_the_load(v4_database):
+    def frames():
+        for frame in generate_frames(
+            devices=1, start="2024-01-01", periods=10, seed=1, chunk_rows=5
+        ):
+            yield frame
+            # Live ingest while the importer has the triggers dropped
+            v4_database.save_sensor_data_many(
+                [(40.0, 20.0, 6.5, 1, 0, 1, "2025-06-01 00:00:00")]
+            )
+
+    import_frames(frames(), commit_rows=1)
+    with v4_database.connect() as connection:
+        assert connection.execute(
+            "SELECT agr_QTD FROM tbl_LEITURA_MES WHERE agr_PERIODO = '2025-06'"
+        ).fetchone() == (2,)
+
+
+def test_columnar_reimport_skips_duplicates(v4_database, tmp_path, monkeypatch):
+    store = ColumnarStore(str(tmp_path / "columnar"))
+    monkeypatch.setattr(v4_database, "SENSOR_STORAGE", "columnar")
+    monkeypatch.setattr(v4_database, "get_columnar_store", lambda: store)
+    frames = lambda: generate_frames(devices=2, start="2024-01-01", periods=10, seed=1)
+    assert write_database(frames()) == 20
+    assert write_database(frames()) == 0
+    assert len(store.fetch_sensor_data()) == 20
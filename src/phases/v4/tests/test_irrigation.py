@@ -0,0 +1,65 @@
+import numpy
+import pandas
+from utils.generator import generate_readings
+from utils.irrigation import IrrigationCycles, irrigation_cycles
+
+
+def readings():
+    data = generate_readings(
+        devices=5, start="2024-01-01", periods=6000, interval=60, seed=3
+    )
+    data["ltr_DISPOSITIVO"] = "esp32-" + data.pop("device").astype(str)
+    # Device 1 is offline for two hours, cutting any cycle it was in
+    offline = (data["ltr_DISPOSITIVO"] == "esp32-1") & data["ltr_DATA"].between(
+        "2024-01-03 10:00", "2024-01-03 12:00"
+    )
+    data = data[~offline].reset_index(drop=True)
+    data.insert(0, "ID_LEITURA", numpy.arange(1, len(data) + 1))
+    return data
+
+
+def by_device(cycles):
+    # Running cycles come back with nanosecond times
+    return cycles.sort_values(["device", "start"], ignore_index=True).astype(
+        {
+            "start": "datetime64[ns]",
+            "end": "datetime64[ns]",
+            "duration": "int64",
+            "open": bool,
+        }
+    )
+
+
+def test_incremental_updates_match_the_full_computation():
+    data = readings()
+    expected = by_device(irrigation_cycles(data))
+    assert len(expected) > 10
+
+    tracker = IrrigationCycles()
+    rng = numpy.random.default_rng(0)
+    # Uneven batches end in the middle of cycles; repeated rows are ignored
+    bounds = numpy.sort(rng.choice(numpy.arange(1, len(data)), 40, replace=False))
+    previous = 0
+    for bound in [*bounds, len(data)]:
+        tracker.update(data.iloc[max(previous - 5, 0) : bound])
+        previous = bound
+    pandas.testing.assert_frame_equal(by_device(tracker.cycles()), expected)
+
+
+def test_cycle_split_across_updates_is_counted_once():
+    data = pandas.DataFrame(
+        {
+            "ID_LEITURA": [1, 2, 3, 4, 5],
+            "ltr_DATA": pandas.date_range("2024-01-01", periods=5, freq="10min"),
+            "ltr_STATUS_IRRIGACAO": [0, 1, 1, 0, 1],
+            "ltr_DISPOSITIVO": "esp32",
+        }
+    )
+    tracker = IrrigationCycles()
+    tracker.update(data.iloc[:3])
+    assert tracker.cycles()[["duration", "open"]].values.tolist() == [[600, True]]
+    cycles = tracker.update(data.iloc[3:])
+    assert cycles[["duration", "open"]].values.tolist() == [[1200, False], [0, True]]
+    pandas.testing.assert_frame_equal(
+        by_device(cycles), by_device(irrigation_cycles(data))
+    )
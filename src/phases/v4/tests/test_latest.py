@@ -0,0 +1,59 @@
+import pytest
+from utils import latest
+
+
+@pytest.fixture
+def buffers(v4_database, monkeypatch):
+    monkeypatch.setattr(latest, "_BUFFERS", {})
+    return v4_database
+
+
+def row(humidity, timestamp, device):
+    return (humidity, 21.0, 6.5, 1, 0, 1, timestamp, device, 0)
+
+
+def test_buffers_are_kept_per_device(buffers):
+    buffers.save_sensor_data_many(
+        [
+            row(40.0, "2030-01-01 00:00:00", "esp32-a"),
+            row(60.0, "2030-01-01 00:00:05", "esp32-b"),
+        ]
+    )
+    device, buffer = latest.refresh()
+    assert device == "esp32-b"
+    assert buffer.last_n(2)["ltr_UMIDADE"].tolist() == [60.0]
+
+    # A device whose clock is behind another's still gets its readings
+    buffers.save_sensor_data_many([row(41.0, "2030-01-01 00:00:01", "esp32-a")])
+    device, buffer = latest.refresh("esp32-a")
+    assert buffer.last_n(2)["ltr_UMIDADE"].tolist() == [40.0, 41.0]
+    assert latest.get_buffer(latest.flat_key("esp32-b")).latest()["ltr_UMIDADE"] == 60
+
+
+def test_refresh_reads_rows_written_by_other_processes(buffers, monkeypatch):
+    buffers.save_sensor_data_many([row(40.0, "2030-01-01 00:00:00", "esp32-a")])
+    device, buffer = latest.refresh()
+    # Written without feeding this process's buffers
+    monkeypatch.setattr(buffers, "_record_latest", lambda rows: None)
+    buffers.save_sensor_data_many(
+        [
+            row(42.0, "2030-01-01 00:00:10", "esp32-a"),
+            row(70.0, "2030-01-01 00:00:05", "esp32-b"),
+        ]
+    )
+    assert latest.refresh()[1] is buffer
+    assert buffer.last_n(3)["ltr_UMIDADE"].tolist() == [40.0, 42.0]
+    assert latest.refresh("esp32-b")[1].latest()["ltr_UMIDADE"] == 70
+
+
+def test_readings_without_a_device_have_their_own_buffer(buffers):
+    buffers.save_sensor_data_many(
+        [
+            row(40.0, "2030-01-01 00:00:00", "esp32-a"),
+            (50.0, 21.0, 6.5, 1, 0, 1, "2030-01-01 00:00:05"),
+        ]
+    )
+    device, buffer = latest.refresh()
+    assert device is None
+    assert buffer.latest()["ltr_UMIDADE"] == 50
+    assert latest.refresh("esp32-a")[1].latest()["ltr_UMIDADE"] == 40
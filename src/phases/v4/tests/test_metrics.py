@@ -0,0 +1,38 @@
+from utils import metrics
+from utils.batch_writer import BatchWriter
+from utils.ingest import IngestPipeline
+from utils.payload import encode_payload
+
+
+def reading(second):
+    return {
+        "ltr_UMIDADE": 40.5,
+        "ltr_TEMPERATURA": 21.25,
+        "ltr_PH": 6.5,
+        "ltr_NUTRIENTE_P": 1,
+        "ltr_NUTRIENTE_K": 0,
+        "ltr_STATUS_IRRIGACAO": 1,
+        "ltr_DATA": f"2030-01-01 00:00:0{second}",
+    }
+
+
+def test_messages_and_readings_are_separate_counters(
+    v4_database, monkeypatch, tmp_path
+):
+    monkeypatch.setattr(metrics, "_COLLECTORS", [])
+    pipeline = IngestPipeline(
+        BatchWriter(max_rows=100, max_age=0),
+        "farm/+/sensors",
+        spill_path=str(tmp_path / "spill"),
+    )
+    # One batch of three readings and one single reading
+    pipeline.submit(
+        "farm/esp32/sensors", encode_payload([reading(0), reading(1), reading(2)])
+    )
+    pipeline.submit("farm/esp32/sensors", encode_payload(reading(3)))
+    pipeline.close()
+
+    samples = metrics.parse_metrics(metrics.render())
+    assert samples[("ingest_messages_total", ())] == 2
+    assert samples[("ingest_readings_total", (("stage", "decoded"),))] == 4
+    assert samples[("ingest_readings_total", (("stage", "written"),))] == 4
@@ -0,0 +1,96 @@
+import sqlite3
+import pytest
+from utils.migrations import current_version, list_migrations, migrate, split_statements
+
+
+def write_migrations(path, migrations):
+    path.mkdir()
+    for file_name, sql in migrations.items():
+        (path / file_name).write_text(sql)
+    return str(path)
+
+
+def test_new_database_is_migrated_to_the_latest_version(v4_database):
+    with v4_database.connect() as connection:
+        versions = [
+            row[0]
+            for row in connection.execute(
+                "SELECT version FROM schema_version ORDER BY version"
+            )
+        ]
+        assert versions == [
+            version for version, _, _ in list_migrations(v4_database.MIGRATIONS_PATH)
+        ]
+        # Applying them again is a no-op
+        assert migrate(connection, v4_database.MIGRATIONS_PATH) == []
+
+
+def test_migrations_run_in_version_order(tmp_path):
+    path = write_migrations(
+        tmp_path / "migrations",
+        {
+            "0002_add_column.sql": "ALTER TABLE t ADD COLUMN b TEXT;",
+            "0001_create.sql": "CREATE TABLE t (a INTEGER);",
+            "notes.txt": "not a migration",
+        },
+    )
+    connection = sqlite3.connect(":memory:")
+    assert migrate(connection, path) == [1, 2]
+    assert [row[1] for row in connection.execute("PRAGMA table_info(t)")] == ["a", "b"]
+
+
+def test_failing_migration_leaves_the_previous_version(tmp_path):
+    path = write_migrations(
+        tmp_path / "migrations",
+        {
+            "0001_create.sql": "CREATE TABLE t (a INTEGER);",
+            "0002_broken.sql": "CREATE TABLE u (a INTEGER);\nINSERT INTO missing VALUES (1);",
+        },
+    )
+    connection = sqlite3.connect(":memory:")
+    with pytest.raises(sqlite3.OperationalError):
+        migrate(connection, path)
+    assert current_version(connection) == 1
+    # The statements before the failing one were rolled back too
+    assert not connection.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'u'"
+    ).fetchone()
+
+
+def test_split_statements_keeps_trigger_bodies_together():
+    statements = split_statements("""
+        -- comment only
+        CREATE TABLE t (a INTEGER);
+        CREATE TRIGGER trg AFTER INSERT ON t
+        BEGIN
+          UPDATE t SET a = a + 1;
+          UPDATE t SET a = a - 1;
+        END;
+        """)
+    assert len(statements) == 2
+    assert statements[1].startswith("CREATE TRIGGER") and statements[1].endswith("END;")
+
+
+def test_version_counter_tracks_tbl_leitura_changes(v4_database):
+    with v4_database.connect() as connection:
+        version = "SELECT ver_CONTADOR FROM tbl_VERSAO WHERE ver_TABELA = 'tbl_LEITURA'"
+        before = connection.execute(version).fetchone()[0]
+        connection.execute(
+            "INSERT INTO tbl_LEITURA (ltr_UMIDADE, ltr_TEMPERATURA, ltr_PH, "
+            "ltr_NUTRIENTE_P, ltr_NUTRIENTE_K, ltr_STATUS_IRRIGACAO) "
+            "VALUES (40, 20, 6.5, 0, 1, 0)"
+        )
+        connection.commit()
+        assert connection.execute(version).fetchone()[0] == before + 1
+
+
+def test_location_windows_read_only_the_index(v4_database):
+    with v4_database.connect() as connection:
+        plan = connection.execute(
+            "EXPLAIN QUERY PLAN SELECT timestamp, sensor_id, crop_id, moisture_value, "
+            "ph_value, phosphorus_value, potassium_value FROM Sensor_Reading "
+            "WHERE location_id = ? AND timestamp >= ? AND timestamp < ? "
+            "ORDER BY timestamp",
+            (1, "2024-01-01", "2024-01-02"),
+        ).fetchall()
+    assert "COVERING INDEX idx_Sensor_Reading_location_id_timestamp" in plan[0][3]
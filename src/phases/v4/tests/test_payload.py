@@ -0,0 +1,108 @@
+import pytest
+from utils.payload import (
+    BINARY_BATCH,
+    BINARY_READING,
+    decode_payload,
+    encode_payload,
+    is_binary,
+)
+
+
+def reading(**fields):
+    return {
+        "ltr_UMIDADE": 40.5,
+        "ltr_TEMPERATURA": -3.25,
+        "ltr_PH": 6.5,
+        "ltr_NUTRIENTE_P": 1,
+        "ltr_NUTRIENTE_K": 0,
+        "ltr_STATUS_IRRIGACAO": 1,
+        "ltr_DATA": "2024-01-02 03:04:05",
+        "ltr_DISPOSITIVO": "esp32-1",
+        **fields,
+    }
+
+
+DECODED = (40.5, -3.25, 6.5, 1, 0, 1, "2024-01-02 03:04:05", "esp32-1")
+
+
+@pytest.mark.parametrize("payload_format", ["json", "binary"])
+def test_single_reading_round_trip(payload_format):
+    payload = encode_payload(reading(), payload_format)
+    assert bool(is_binary(payload)) == (payload_format == "binary")
+    assert decode_payload(payload) == [DECODED]
+
+
+@pytest.mark.parametrize("payload_format", ["json", "binary"])
+def test_batch_round_trip(payload_format):
+    readings = [
+        reading(ltr_UMIDADE=40.5 + second, ltr_DATA=f"2024-01-02 03:04:0{second}")
+        for second in range(3)
+    ]
+    decoded = decode_payload(encode_payload(readings, payload_format))
+    assert [row[0] for row in decoded] == [40.5, 41.5, 42.5]
+    assert [row[6] for row in decoded] == [
+        "2024-01-02 03:04:00",
+        "2024-01-02 03:04:01",
+        "2024-01-02 03:04:02",
+    ]
+    assert {row[7] for row in decoded} == {"esp32-1"}
+
+
+def test_binary_reading_without_timestamp_or_device():
+    fields = reading()
+    del fields["ltr_DATA"], fields["ltr_DISPOSITIVO"]
+    assert decode_payload(encode_payload(fields, "binary")) == [
+        (*DECODED[:6], None, None)
+    ]
+
+
+def test_truncated_binary_payloads_are_rejected():
+    single = encode_payload(reading(), "binary")
+    batch = encode_payload([reading()] * 2, "binary")
+    for payload in (
+        single[: BINARY_READING.size - 1],
+        single[:-1],
+        batch[: BINARY_BATCH.size - 1],
+        batch[:-1],
+    ):
+        with pytest.raises(ValueError):
+            decode_payload(payload)
+
+
+def test_unknown_binary_version_is_rejected():
+    payload = encode_payload(reading(), "binary")
+    with pytest.raises(ValueError):
+        decode_payload(bytes([0x80 | 9]) + payload[1:])
+
+
+@pytest.mark.parametrize(
+    "fields",
+    [
+        {"ltr_UMIDADE": 655.36},
+        {"ltr_UMIDADE": -0.01},
+        {"ltr_TEMPERATURA": 327.68},
+        {"ltr_TEMPERATURA": -327.69},
+        {"ltr_PH": float("nan")},
+        {"ltr_DATA": "1969-12-31 23:59:59"},
+        {"ltr_DATA": "2106-02-07 06:28:16"},
+        {"ltr_DISPOSITIVO": "x" * 256},
+        {"ltr_NUTRIENTE_P": 2},
+        {"ltr_NUTRIENTE_K": -1},
+        {"ltr_STATUS_IRRIGACAO": 0.5},
+    ],
+)
+def test_out_of_range_values_are_rejected(fields):
+    with pytest.raises(ValueError):
+        encode_payload(reading(**fields), "binary")
+    # In a batch too, where the cast would otherwise wrap the value around
+    with pytest.raises(ValueError):
+        encode_payload([reading(), reading(**fields)], "binary")
+
+
+def test_range_limits_are_encoded():
+    fields = {"ltr_UMIDADE": 655.35, "ltr_TEMPERATURA": -327.68, "ltr_PH": 0.0}
+    for payload in (
+        encode_payload(reading(**fields), "binary"),
+        encode_payload([reading(**fields)], "binary"),
+    ):
+        assert decode_payload(payload)[0][:3] == (655.35, -327.68, 0.0)
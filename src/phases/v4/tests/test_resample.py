@@ -0,0 +1,49 @@
+import pandas
+from utils.resample import resample_frame, resample_readings
+
+
+def readings():
+    return pandas.DataFrame(
+        {
+            "ltr_DATA": pandas.to_datetime(
+                [
+                    "2024-01-01 00:10:00",
+                    "2024-01-01 00:00:00",
+                    "2024-01-01 00:20:00",
+                ]
+            ),
+            "ltr_UMIDADE": [20.0, 10.0, 30.0],
+            "ltr_DISPOSITIVO": ["esp32", "esp32", "esp32"],
+        }
+    )
+
+
+def test_first_and_last_follow_time_not_input_order():
+    data = readings()
+    for rows in (data, data.iloc[::-1]):
+        first = resample_frame(rows, "15min", ["ltr_UMIDADE"], "first")
+        last = resample_frame(rows, "15min", ["ltr_UMIDADE"], "last")
+        assert first["ltr_UMIDADE"].tolist() == [10.0, 30.0]
+        assert last["ltr_UMIDADE"].tolist() == [20.0, 30.0]
+
+
+def test_chunked_reads_follow_time(v4_database):
+    rows = [
+        (humidity, 21.0, 6.5, 1, 0, 1, timestamp, "esp32", 0)
+        for humidity, timestamp in [
+            (20.0, "2030-01-01 00:10:00"),
+            (10.0, "2030-01-01 00:00:00"),
+            (30.0, "2030-01-01 00:20:00"),
+        ]
+    ]
+    v4_database.save_sensor_data_many(rows)
+    data = resample_readings(
+        "15min",
+        ["ltr_UMIDADE"],
+        {"ltr_UMIDADE": "first"},
+        start="2030-01-01",
+        end="2030-01-01 00:30:00",
+        window=900,
+    )
+    data = data[data["device"] == "esp32"]
+    assert data["ltr_UMIDADE"].tolist() == [10.0, 30.0]